@@ -1,6 +1,7 @@
 import os
 import time
 import logging
+import threading
 from datetime import datetime
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
@@ -10,8 +11,10 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
 import json
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+# Set up logging: queued, written by a background thread, levels from LOG_LEVEL/LOG_LEVELS
+from log_config import configure_logging
+configure_logging()
+logger = logging.getLogger(__name__)
 
 # Initialize database
 class Base(DeclarativeBase):
@@ -21,7 +24,7 @@ db = SQLAlchemy(model_class=Base)
 
 # Create Flask app
 app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET" # Add your key here)
+app.secret_key = os.environ.get("SESSION_SECRET")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
 # Upload folder for cover art
@@ -50,9 +53,9 @@ def utility_processor():
         
     # Get system status variables
     # API Keys
-    openai_key = os.environ.get("OPENAI_API_KEY" # Add your key here, '')
-    elevenlabs_key = os.environ.get("ELEVENLABS_API_KEY" # Add your key here, '')
-    github_token = os.environ.get("GITHUB_TOKEN" # Add your key here, '')
+    openai_key = os.environ.get("OPENAI_API_KEY", '')
+    elevenlabs_key = os.environ.get("ELEVENLABS_API_KEY", '')
+    github_token = os.environ.get("GITHUB_TOKEN", '')
     github_username = os.environ.get('GITHUB_USERNAME', '')
     github_repo = os.environ.get('GITHUB_REPO', '')
     
@@ -120,12 +123,24 @@ db.init_app(app)
 with app.app_context():
     import models
     from rss import fetch_rss_feeds, get_feed_data
-    from gpt import generate_podcast_script
+    from gpt import generate_podcast_script, stream_podcast_script
     from tts import convert_to_speech
     from gitpush import publish_to_github
+    import tracing
+    import ingest
+    import feed_health
+    import article_store
+    import search
+    import script_store
+    import image_variants
+    import publish_queue
     
     # Create tables if they don't exist
     db.create_all()
+    search.init_index()
+    script_store.init_store()
+    # Scripts whose deferred release was cut short when the last process exited
+    script_store.delete_unreferenced_scripts()
     
     # Initialize default settings if not present
     if not models.Settings.query.first():
@@ -165,11 +180,24 @@ with app.app_context():
             db.session.add(feed)
             
         db.session.commit()
-        logging.info("Initialized default settings and RSS feeds")
+        logger.info("Initialized default settings and RSS feeds")
 
 # Create storage directory if it doesn't exist
 os.makedirs('storage', exist_ok=True)
 
+# Templates show avatars and covers through resized variants (see image_variants.py)
+app.add_template_global(image_variants.image_url, 'image_url')
+
+@app.after_request
+def cache_image_variants(response):
+    # Variant names change with the image's content, so browsers can keep them
+    if response.status_code == 200 and request.path.startswith(f"/static/{image_variants.VARIANT_DIR}/"):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+# Keep the article archive filled in the background (one worker polls, see ingest.py)
+ingest.start_ingestion(app)
+
 # Helper function for file uploads
 def allowed_file(filename):
     return '.' in filename and \
@@ -290,6 +318,7 @@ def update_profile():
                 
                 # Update the user's avatar path (store relative path)
                 user.avatar_path = f"uploads/avatars/{filename}"
+                image_variants.schedule_variants(user.avatar_path)
             else:
                 flash('Invalid file type. Please upload an image file (png, jpg, jpeg, gif).', 'danger')
     
@@ -317,9 +346,9 @@ def index():
     episodes = models.Episode.query.order_by(models.Episode.date.desc()).all()
     
     # Check API keys in environment variables first
-    openai_key = os.environ.get("OPENAI_API_KEY" # Add your key here, False)
-    elevenlabs_key = os.environ.get("ELEVENLABS_API_KEY" # Add your key here, False)
-    github_token = os.environ.get("GITHUB_TOKEN" # Add your key here, False)
+    openai_key = os.environ.get("OPENAI_API_KEY", False)
+    elevenlabs_key = os.environ.get("ELEVENLABS_API_KEY", False)
+    github_token = os.environ.get("GITHUB_TOKEN", False)
     github_username = os.environ.get('GITHUB_USERNAME', False)
     github_repo = os.environ.get('GITHUB_REPO', False)
     
@@ -373,6 +402,45 @@ def episode(id):
     episode = models.Episode.query.get_or_404(id)
     return render_template('episode.html', episode=episode)
 
+@app.route('/search')
+@login_required
+def search_episodes():
+    """Search episode titles and scripts"""
+    query = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    results, total = search.search_episodes(query, page) if query else ([], 0)
+    pages = (total + search.RESULTS_PER_PAGE - 1) // search.RESULTS_PER_PAGE
+    return render_template('search.html', query=query, results=results, total=total, page=page, pages=pages)
+
+@app.route('/api/search')
+@login_required
+def search_api():
+    """API endpoint for searching episodes, with highlighted HTML snippets"""
+    query = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', search.RESULTS_PER_PAGE, type=int)
+    if not query:
+        return jsonify({'error': 'Missing search query (q)'}), 400
+    
+    started = time.perf_counter()
+    results, total = search.search_episodes(query, page, per_page)
+    return jsonify({
+        'query': query,
+        'page': page,
+        'total': total,
+        'took_ms': round((time.perf_counter() - started) * 1000, 1),
+        'results': [{
+            'id': result.episode.id,
+            'title': result.episode.title,
+            'title_html': str(result.title),
+            'snippet_html': str(result.snippet),
+            'date': result.episode.date.isoformat() if result.episode.date else None,
+            'status': result.episode.status,
+            'score': result.score,
+            'url': url_for('episode', id=result.episode.id),
+        } for result in results],
+    })
+
 @app.route('/settings')
 @login_required
 def settings():
@@ -380,9 +448,9 @@ def settings():
     user_podcasts = models.Settings.query.filter_by(user_id=current_user.id).all()
     
     # API Keys data
-    openai_key = os.environ.get("OPENAI_API_KEY" # Add your key here, '')
-    elevenlabs_key = os.environ.get("ELEVENLABS_API_KEY" # Add your key here, '')
-    github_token = os.environ.get("GITHUB_TOKEN" # Add your key here, '')
+    openai_key = os.environ.get("OPENAI_API_KEY", '')
+    elevenlabs_key = os.environ.get("ELEVENLABS_API_KEY", '')
+    github_token = os.environ.get("GITHUB_TOKEN", '')
     github_username = os.environ.get('GITHUB_USERNAME', '')
     github_repo = os.environ.get('GITHUB_REPO', '')
     
@@ -419,8 +487,9 @@ def settings():
         available_voices = []
         if elevenlabs_key:
             import requests
+            from tts import ELEVENLABS_API_BASE
             headers = {"xi-api-key": elevenlabs_key}
-            response = requests.get("https://api.elevenlabs.io/v1/voices", headers=headers)
+            response = requests.get(f"{ELEVENLABS_API_BASE}/v1/voices", headers=headers)
             if response.status_code == 200:
                 voices_data = response.json().get("voices", [])
                 available_voices = [{"voice_id": v["voice_id"], "name": v["name"]} for v in voices_data]
@@ -488,6 +557,7 @@ def new_podcast():
         podcast.ai_instructions = request.form.get('ai_instructions')
         podcast.blocked_terms = request.form.get('blocked_terms')
         podcast.openai_model = request.form.get('openai_model', 'gpt-3.5-turbo')
+        podcast.set_short_call_model(request.form.get('short_call_model', 'auto'))
         
         # Initialize RSS slug based on podcast title
         podcast_title = request.form.get('podcast_title', f"{current_user.username}'s Podcast")
@@ -535,11 +605,11 @@ def new_podcast():
                 filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
                 file.save(filepath)
                 podcast.cover_art_path = f"uploads/{filename}"
+                image_variants.schedule_variants(podcast.cover_art_path, directory_art=True)
         elif request.form.get('generated_cover_path'):
             # Use the AI-generated cover art
             generated_path = request.form.get('generated_cover_path', '')
-            import logging
-            logging.warning(f"COVER ART DEBUG - New podcast - Generated cover path from form: {generated_path}")
+            logger.warning(f"COVER ART DEBUG - New podcast - Generated cover path from form: {generated_path}")
             
             if generated_path:
                 # The path should already be correct (relative to static)
@@ -548,18 +618,18 @@ def new_podcast():
                 if db_path.startswith('static/'):
                     db_path = db_path.replace('static/', '')
                 
-                logging.warning(f"COVER ART DEBUG - New podcast - Path for DB storage: {db_path}")
+                logger.warning(f"COVER ART DEBUG - New podcast - Path for DB storage: {db_path}")
                 
                 # Set the new cover art path
                 podcast.cover_art_path = db_path
-                logging.warning(f"COVER ART DEBUG - New podcast - Updated podcast cover art path to: {db_path}")
+                logger.warning(f"COVER ART DEBUG - New podcast - Updated podcast cover art path to: {db_path}")
                 
                 # Verify the file exists
                 full_path = os.path.join('static', db_path)
                 if os.path.exists(full_path):
-                    logging.warning(f"COVER ART DEBUG - New podcast - Cover art file exists at: {full_path}")
+                    logger.warning(f"COVER ART DEBUG - New podcast - Cover art file exists at: {full_path}")
                 else:
-                    logging.warning(f"COVER ART DEBUG - New podcast - WARNING: Cover art file does not exist at: {full_path}")
+                    logger.warning(f"COVER ART DEBUG - New podcast - WARNING: Cover art file does not exist at: {full_path}")
         
         # Handle RSS feed sources
         feed_sources = request.form.getlist('feed_sources[]')
@@ -626,6 +696,7 @@ def update_settings(id):
     podcast.ai_instructions = request.form.get('ai_instructions')
     podcast.blocked_terms = request.form.get('blocked_terms')
     podcast.openai_model = request.form.get('openai_model', 'gpt-3.5-turbo')
+    podcast.set_short_call_model(request.form.get('short_call_model', 'auto'))
     
     # Update RSS feed settings
     podcast.rss_slug = request.form.get('rss_slug')
@@ -652,6 +723,7 @@ def update_settings(id):
         if file and file.filename and file.filename != '' and allowed_file(file.filename):
             # Delete old cover art if it exists
             if podcast.cover_art_path and os.path.exists(os.path.join('static', podcast.cover_art_path)):
+                image_variants.remove_variants(podcast.cover_art_path)
                 os.remove(os.path.join('static', podcast.cover_art_path))
             
             # Save new cover art
@@ -661,11 +733,11 @@ def update_settings(id):
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             file.save(filepath)
             podcast.cover_art_path = f"uploads/{filename}"
+            image_variants.schedule_variants(podcast.cover_art_path, directory_art=True)
     elif request.form.get('generated_cover_path'):
         # Use the AI-generated cover art
         generated_path = request.form.get('generated_cover_path', '')
-        import logging
-        logging.info(f"Edit podcast - Generated cover path from form: {generated_path}")
+        logger.info(f"Edit podcast - Generated cover path from form: {generated_path}")
             
         if generated_path:
             # The path should already be correct (relative to static)
@@ -674,30 +746,31 @@ def update_settings(id):
             if db_path.startswith('static/'):
                 db_path = db_path.replace('static/', '')
                 
-            logging.info(f"Edit podcast - Path for DB storage: {db_path}")
+            logger.info(f"Edit podcast - Path for DB storage: {db_path}")
             
             # Check if the file exists
             full_path = os.path.join('static', db_path)
-            logging.info(f"Edit podcast - Full file path to check: {full_path}")
+            logger.info(f"Edit podcast - Full file path to check: {full_path}")
             
             # SIMPLIFIED APPROACH: Trust the path we received and assign it directly
             # Delete old cover art if it exists and it's different from what we're saving
             if podcast.cover_art_path and podcast.cover_art_path != db_path and os.path.exists(os.path.join('static', podcast.cover_art_path)):
                 try:
-                    logging.warning(f"COVER ART DEBUG - Deleting old cover art: {podcast.cover_art_path}")
+                    logger.warning(f"COVER ART DEBUG - Deleting old cover art: {podcast.cover_art_path}")
+                    image_variants.remove_variants(podcast.cover_art_path)
                     os.remove(os.path.join('static', podcast.cover_art_path))
                 except Exception as e:
-                    logging.warning(f"COVER ART DEBUG - Failed to delete old cover art: {str(e)}")
+                    logger.warning(f"COVER ART DEBUG - Failed to delete old cover art: {str(e)}")
             
             # Set the new cover art path
             podcast.cover_art_path = db_path
-            logging.warning(f"COVER ART DEBUG - Updated podcast cover art path to: {db_path}")
+            logger.warning(f"COVER ART DEBUG - Updated podcast cover art path to: {db_path}")
             
             # Verify the file exists
             if os.path.exists(full_path):
-                logging.warning(f"COVER ART DEBUG - Cover art file exists at: {full_path}")
+                logger.warning(f"COVER ART DEBUG - Cover art file exists at: {full_path}")
             else:
-                logging.warning(f"COVER ART DEBUG - WARNING: Cover art file does not exist at: {full_path}")
+                logger.warning(f"COVER ART DEBUG - WARNING: Cover art file does not exist at: {full_path}")
     
     # Update voice settings
     podcast.voice_id = request.form.get('voice_id', '')
@@ -736,6 +809,7 @@ def delete_podcast(id):
     
     # Delete cover art file if it exists
     if podcast.cover_art_path and os.path.exists(os.path.join('static', podcast.cover_art_path)):
+        image_variants.remove_variants(podcast.cover_art_path)
         os.remove(os.path.join('static', podcast.cover_art_path))
     
     db.session.delete(podcast)
@@ -757,7 +831,10 @@ def feeds():
         podcast_ids = [p.id for p in podcasts]
         feeds = models.RssFeed.query.filter(models.RssFeed.podcast_id.in_(podcast_ids)).all()
     
-    return render_template('feeds.html', feeds=feeds, podcasts=podcasts)
+    # Fetch statistics and circuit breaker state, shared by feeds with the same URL
+    health = feed_health.get_health([feed.url for feed in feeds])
+    
+    return render_template('feeds.html', feeds=feeds, podcasts=podcasts, health=health, utc_now=datetime.utcnow())
 
 @app.route('/feeds/add', methods=['POST'])
 @login_required
@@ -916,7 +993,6 @@ def generate_cover_art():
     """
     Generate podcast cover art using DALL-E
     """
-    import logging
     from gpt import generate_podcast_artwork
     
     try:
@@ -936,14 +1012,14 @@ def generate_cover_art():
             # The result from generate_podcast_artwork is now standardized
             # It returns just the relative path within static/ folder
             relative_path = result.replace('\\', '/')
-            logging.warning(f"COVER ART DEBUG - Generated art path from DALL-E (relative to static/): {relative_path}")
+            logger.warning(f"COVER ART DEBUG - Generated art path from DALL-E (relative to static/): {relative_path}")
             
             # Verify the file exists
             full_path = os.path.join('static', relative_path)
             if os.path.exists(full_path):
-                logging.warning(f"COVER ART DEBUG - Generated cover art file exists at: {full_path}")
+                logger.warning(f"COVER ART DEBUG - Generated cover art file exists at: {full_path}")
             else:
-                logging.warning(f"COVER ART DEBUG - WARNING: Generated cover art file does not exist at: {full_path}")
+                logger.warning(f"COVER ART DEBUG - WARNING: Generated cover art file does not exist at: {full_path}")
             
             # Return both the file path and URL for the image
             return jsonify({
@@ -956,9 +1032,112 @@ def generate_cover_art():
             return jsonify({"success": False, "error": result}), 500
             
     except Exception as e:
-        logging.error(f"Error generating cover art: {str(e)}")
+        logger.error(f"Error generating cover art: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+class VoiceSettings:
+    """Voice settings copied out of the database, safe to use in a background thread"""
+    def __init__(self, voice_id, stability, similarity_boost):
+        self.voice_id = voice_id
+        self.stability = stability
+        self.similarity_boost = similarity_boost
+
+def get_voice_settings(podcast):
+    """
+    Get the voice an episode is spoken with
+    
+    Args:
+        podcast (Settings): The episode's podcast, or None
+    
+    Returns:
+        VoiceSettings: The podcast's voice, else the global one, or None if neither is set up
+    """
+    if podcast and podcast.voice_id and podcast.voice_id.strip():
+        logger.info(f"Using podcast voice ID: {podcast.voice_id}")
+        return VoiceSettings(podcast.voice_id, podcast.voice_stability or 0.5, podcast.voice_similarity_boost or 0.5)
+    
+    voice = models.ElevenLabsVoice.query.first()
+    if not voice:
+        return None
+    logger.info(f"Using global voice ID: {voice.voice_id}")
+    return VoiceSettings(voice.voice_id, voice.stability, voice.similarity_boost)
+
+def stream_episode_audio(episode_id, sentences, voice, audio_path, trace_id, auto_publish):
+    """
+    Speak a script while it is being written, then store script and audio on the episode
+    
+    Runs in a background thread. Sentences go to ElevenLabs in chunks as
+    soon as they arrive (see tts.convert_to_speech), so the first audio is
+    requested while the summaries are still being generated.
+    
+    Args:
+        episode_id (int): Episode to fill in, created with status generating_audio
+        sentences: Sentence stream from gpt.stream_podcast_script
+        voice (VoiceSettings): Voice to speak with
+        audio_path (str): Where to write the MP3
+        trace_id (str): The episode's trace
+        auto_publish (bool): Whether the podcast publishes new episodes automatically
+    """
+    from mp3info import read_mp3_info
+    
+    with app.app_context():
+        span = tracing.start_span("generate_audio", trace_id=trace_id, attributes={"episode.id": episode_id, "audio.streamed": True})
+        script_parts = []
+        
+        def collect():
+            for sentence in sentences:
+                script_parts.append(sentence)
+                yield sentence
+        
+        stream = collect()
+        try:
+            audio_result = convert_to_speech(stream, voice, audio_path)
+            audio_info = read_mp3_info(audio_result) if audio_result and os.path.exists(audio_result) else None
+            
+            episode = db.session.get(models.Episode, episode_id)
+            episode.script = "".join(script_parts)
+            if audio_info:
+                episode.audio_path = audio_path
+                episode.audio_duration = audio_info["duration"]
+                episode.audio_bitrate = audio_info["bitrate"]
+                episode.audio_size = audio_info["size"]
+                episode.status = "audio_generated"
+            else:
+                logger.error(f"Streamed audio generation failed for episode {episode_id}")
+                episode.status = "script_generated"
+            db.session.commit()
+            logger.info(f"Streamed script and audio generation finished for episode {episode_id}")
+            
+            if audio_info and auto_publish:
+                publish_queue.schedule_auto_publish(app)
+        
+        except Exception as e:
+            span.record_exception(e)
+            logger.error(f"Error streaming episode {episode_id} to audio: {str(e)}")
+            db.session.rollback()
+            try:
+                # When speech failed, finish the script so the audio can be generated again from the episode page
+                for _ in stream:
+                    pass
+                script_complete = True
+            except Exception as script_error:
+                logger.error(f"Script generation for episode {episode_id} failed: {str(script_error)}")
+                script_complete = False
+            try:
+                episode = db.session.get(models.Episode, episode_id)
+                if episode:
+                    if script_complete and script_parts:
+                        episode.script = "".join(script_parts)
+                        episode.status = "script_generated"
+                    else:
+                        episode.status = "draft"
+                    db.session.commit()
+            except Exception as db_error:
+                logger.error(f"Database error updating episode status: {str(db_error)}")
+        
+        finally:
+            span.end()
+
 @app.route('/generate_podcast', methods=['GET', 'POST'])
 @login_required
 def generate_podcast():
@@ -967,6 +1146,8 @@ def generate_podcast():
     
     if request.method == 'POST':
         podcast_ids = request.form.getlist('podcast_ids[]')
+        # Speak each script while it is being written instead of waiting for "Generate Audio"
+        stream_audio = 'stream_audio' in request.form
         if not podcast_ids:
             flash('Please select at least one podcast to generate content for.', 'warning')
             return redirect(url_for('generate_podcast'))
@@ -1004,27 +1185,34 @@ def generate_podcast():
                     continue
                     
                 feed_urls = [feed.url for feed in active_feeds]
-                logging.info(f"Fetching articles from {len(feed_urls)} RSS feeds for podcast '{podcast.podcast_title}'")
+                logger.info(f"Fetching articles from {len(feed_urls)} RSS feeds for podcast '{podcast.podcast_title}'")
+                
+                # Every later stage of this episode (audio, publish) joins this trace
+                trace_id = tracing.new_trace_id()
+                span = tracing.start_span("generate_podcast", trace_id=trace_id, attributes={"podcast.id": podcast.id})
                 
                 try:
                     # Use the podcast's time_frame setting and blocked_terms when fetching articles
                     # Increase max_articles_per_feed to 15 to get more content
-                    articles = fetch_rss_feeds(
-                        feed_urls,
-                        max_articles_per_feed=15, 
-                        time_frame=podcast.time_frame,
-                        blocked_terms=podcast.blocked_terms
-                    )
+                    with tracing.start_span("fetch_feeds", attributes={"feed.count": len(feed_urls)}):
+                        articles = fetch_rss_feeds(
+                            feed_urls,
+                            max_articles_per_feed=15, 
+                            time_frame=podcast.time_frame,
+                            blocked_terms=podcast.blocked_terms,
+                            max_age=ingest.get_max_age()
+                        )
+                    span.set_attribute("article.count", len(articles))
                     
                     if not articles:
                         failed_podcasts.append(f"No articles found for: {podcast.podcast_title}")
                         continue
                         
-                    logging.info(f"Found {len(articles)} articles from RSS feeds for '{podcast.podcast_title}'")
+                    logger.info(f"Found {len(articles)} articles from RSS feeds for '{podcast.podcast_title}'")
                     
                     # Save fetched data to JSON
                     with open(f'{storage_dir}/data.json', 'w') as f:
-                        json.dump(articles, f)
+                        f.write(article_store.encode_articles(articles))
                     
                     # Step 2: Generate podcast script
                     podcast_title = podcast.podcast_title
@@ -1035,7 +1223,45 @@ def generate_podcast():
                     podcast_duration = podcast.podcast_duration
                     openai_model = podcast.openai_model
                     
-                    logging.info(f"Generating podcast script for '{podcast_title}' using model {openai_model}")
+                    logger.info(f"Generating podcast script for '{podcast_title}' using model {openai_model}")
+                    
+                    if stream_audio:
+                        voice = get_voice_settings(podcast)
+                        if not voice:
+                            failed_podcasts.append(f"No voice settings for: {podcast.podcast_title}")
+                            continue
+                        
+                        # The script is filled in by the audio thread once it has been spoken
+                        episode = models.Episode()
+                        episode.title = f"{podcast_title} - {datetime.now().strftime('%Y-%m-%d')}"
+                        episode.date = datetime.now()
+                        episode.status = "generating_audio"
+                        episode.podcast_id = podcast.id
+                        episode.trace_id = trace_id
+                        db.session.add(episode)
+                        db.session.commit()
+                        span.set_attribute("episode.id", episode.id)
+                        
+                        sentences = stream_podcast_script(
+                            articles,
+                            podcast_title=podcast_title,
+                            podcast_description=podcast_description,
+                            podcast_author=podcast_author,
+                            host_name=host_name,
+                            ai_instructions=ai_instructions,
+                            podcast_duration=podcast_duration,
+                            openai_model=openai_model,
+                            model_routing=podcast.model_routing
+                        )
+                        threading.Thread(
+                            target=stream_episode_audio,
+                            args=(episode.id, sentences, voice, f'{storage_dir}/podcast.mp3', trace_id, bool(podcast.auto_publish)),
+                            name=f"episode-audio-{episode.id}",
+                            daemon=True
+                        ).start()
+                        
+                        successful_podcasts.append({"title": podcast.podcast_title, "episode_id": episode.id})
+                        continue
                     
                     # Pass all relevant podcast settings to the script generator including the AI model
                     script = generate_podcast_script(
@@ -1046,42 +1272,43 @@ def generate_podcast():
                         host_name=host_name,
                         ai_instructions=ai_instructions,
                         podcast_duration=podcast_duration,
-                        openai_model=openai_model
+                        openai_model=openai_model,
+                        model_routing=podcast.model_routing
                     )
                     
                     if not script or len(script.strip()) < 100:  # Basic validation
                         failed_podcasts.append(f"Generated script too short for: {podcast.podcast_title}")
                         continue
                     
-                    # Save script to file
-                    script_path = f'{storage_dir}/script.txt'
-                    with open(script_path, 'w') as f:
-                        f.write(script)
-                    
-                    logging.info(f"Script generated successfully for '{podcast.podcast_title}', length: {len(script)} characters")
+                    logger.info(f"Script generated successfully for '{podcast.podcast_title}', length: {len(script)} characters")
                     
                     # Create episode record
                     episode = models.Episode()
                     episode.title = f"{podcast_title} - {datetime.now().strftime('%Y-%m-%d')}"
                     episode.date = datetime.now()
-                    episode.script = script
-                    episode.script_path = script_path
+                    episode.script = script  # Goes to the script store, see script_store.py
                     episode.status = "script_generated"
                     episode.podcast_id = podcast.id  # Associate the episode with the podcast
+                    episode.trace_id = trace_id
                     db.session.add(episode)
                     db.session.commit()
+                    span.set_attribute("episode.id", episode.id)
                     
                     # Add to successful podcasts list
                     successful_podcasts.append({"title": podcast.podcast_title, "episode_id": episode.id})
                     
                 except Exception as e:
+                    span.record_exception(e)
                     error_msg = str(e)
-                    logging.error(f"Error generating podcast '{podcast.podcast_title}': {error_msg}")
+                    logger.error(f"Error generating podcast '{podcast.podcast_title}': {error_msg}")
                     failed_podcasts.append(f"Error for {podcast.podcast_title}: {error_msg[:100]}...")
+                
+                finally:
+                    span.end()
             
             except Exception as e:
                 error_msg = str(e)
-                logging.error(f"Error processing podcast ID {podcast_id}: {error_msg}")
+                logger.error(f"Error processing podcast ID {podcast_id}: {error_msg}")
                 failed_podcasts.append(f"Error processing podcast ID {podcast_id}: {error_msg[:100]}...")
         
         # After processing all podcasts, show summary
@@ -1115,11 +1342,11 @@ def generate_audio(id):
     """
     try:
         # Get the episode
-        logging.info(f"Starting direct audio generation for episode ID {id}")
+        logger.info(f"Starting direct audio generation for episode ID {id}")
         episode = models.Episode.query.get_or_404(id)
         
         if not episode.script:
-            logging.error(f"No script found for episode ID {id}")
+            logger.error(f"No script found for episode ID {id}")
             flash('No script found for this episode!', 'danger')
             return redirect(url_for('episode', id=id))
         
@@ -1129,27 +1356,10 @@ def generate_audio(id):
             podcast = models.Settings.query.get(episode.podcast_id)
         
         # Get voice settings - either from podcast or fallback to global
-        if podcast and podcast.voice_id and podcast.voice_id.strip():
-            # Create voice settings from podcast
-            class VoiceSettings:
-                def __init__(self, voice_id, stability, similarity_boost):
-                    self.voice_id = voice_id
-                    self.stability = stability
-                    self.similarity_boost = similarity_boost
-            
-            voice = VoiceSettings(
-                podcast.voice_id,
-                podcast.voice_stability or 0.5,
-                podcast.voice_similarity_boost or 0.5
-            )
-            logging.info(f"Using podcast voice ID: {voice.voice_id}")
-        else:
-            # Use global voice settings
-            voice = models.ElevenLabsVoice.query.first()
-            if not voice:
-                flash('No voice settings found! Please configure voice settings first.', 'danger')
-                return redirect(url_for('voices'))
-            logging.info(f"Using global voice ID: {voice.voice_id}")
+        voice = get_voice_settings(podcast)
+        if not voice:
+            flash('No voice settings found! Please configure voice settings first.', 'danger')
+            return redirect(url_for('voices'))
         
         # Set up audio storage path
         today = episode.date.strftime('%Y%m%d')
@@ -1162,60 +1372,82 @@ def generate_audio(id):
         
         # Update episode status
         episode.status = "generating_audio"
+        if not episode.trace_id:
+            # Episodes generated before tracing start their trace here
+            episode.trace_id = tracing.new_trace_id()
+        trace_id = episode.trace_id
+        auto_publish = bool(podcast and podcast.auto_publish)
         db.session.commit()
+        queued_at = time.time()
         
         # Start a separate thread to generate audio
         def generate_audio_thread():
+            tracing.record_span("audio.queue_wait", queued_at, time.time(), trace_id=trace_id)
+            span = tracing.start_span("generate_audio", trace_id=trace_id, attributes={"episode.id": id})
             try:
                 # Import needed modules in thread
-                import logging
                 import os
                 from app import db
                 import models
                 from tts import convert_to_speech
+                from mp3info import read_mp3_info
                 
-                logging.info(f"Thread started for audio generation of episode {id}")
+                logger.info(f"Thread started for audio generation of episode {id}")
                 
                 # Generate the audio file
                 audio_result = convert_to_speech(episode.script, voice, audio_path)
                 
                 # Check if generation was successful
                 if audio_result and os.path.exists(audio_result):
+                    # Read duration, bitrate and size once so feeds never have to open the file
+                    audio_info = read_mp3_info(audio_result)
+                    
                     # Update episode status to success
                     with db.session.begin():
                         episode = models.Episode.query.get(id)
                         if episode:
                             episode.audio_path = audio_path
                             episode.status = "audio_generated"
-                            logging.info(f"Audio generation successful for episode {id}")
+                            if audio_info:
+                                episode.audio_duration = audio_info["duration"]
+                                episode.audio_bitrate = audio_info["bitrate"]
+                                episode.audio_size = audio_info["size"]
+                            logger.info(f"Audio generation successful for episode {id}")
                         else:
-                            logging.error(f"Episode {id} not found after audio generation")
+                            logger.error(f"Episode {id} not found after audio generation")
+                    
+                    if auto_publish:
+                        # Published together with the other episodes finished in the meantime
+                        publish_queue.schedule_auto_publish(app)
                 else:
                     # Update episode status to failure
                     with db.session.begin():
                         episode = models.Episode.query.get(id)
                         if episode:
                             episode.status = "script_generated"  # Revert to previous state
-                            logging.error(f"Audio generation failed for episode {id}")
+                            logger.error(f"Audio generation failed for episode {id}")
                         else:
-                            logging.error(f"Episode {id} not found after audio generation")
+                            logger.error(f"Episode {id} not found after audio generation")
             
             except Exception as e:
                 # Log the error and update episode status
+                span.record_exception(e)
                 error_msg = f"Error generating audio: {str(e)}"
-                logging.error(error_msg)
+                logger.error(error_msg)
                 
                 try:
                     with db.session.begin():
                         episode = models.Episode.query.get(id)
                         if episode:
                             episode.status = "script_generated"  # Revert to previous state
-                            logging.info(f"Reverted episode {id} status due to error")
+                            logger.info(f"Reverted episode {id} status due to error")
                 except Exception as db_error:
-                    logging.error(f"Database error updating episode status: {str(db_error)}")
+                    logger.error(f"Database error updating episode status: {str(db_error)}")
+            
+            finally:
+                span.end()
         
         # Start generation in a separate thread
-        import threading
         thread = threading.Thread(target=generate_audio_thread)
         thread.daemon = True
         thread.start()
@@ -1225,7 +1457,7 @@ def generate_audio(id):
         return redirect(url_for('episode', id=id))
     
     except Exception as e:
-        logging.error(f"Error initiating audio generation: {str(e)}")
+        logger.error(f"Error initiating audio generation: {str(e)}")
         flash(f'Error initiating audio generation: {str(e)}', 'danger')
         
         # Make sure to reset episode status
@@ -1274,21 +1506,20 @@ def audio_generation_status(id, task_id):
 def task_status_api(task_id):
     """API endpoint for getting task status"""
     from background_task import get_task_status
-    import logging
     
     # Log the request for debugging
-    logging.info(f"Task status request received for task_id: {task_id}")
+    logger.debug("Task status request received for task_id: %s", task_id)
     
     try:
         # Get the status of the task
         status = get_task_status(task_id)
         
         # Log the response for debugging
-        logging.info(f"Returning task status for {task_id}: {status}")
+        logger.debug("Returning task status for %s: %s", task_id, status)
         
         # Always return a valid JSON response
         if not status or not isinstance(status, dict):
-            logging.warning(f"Invalid status returned for task {task_id}: {status}")
+            logger.warning("Invalid status returned for task %s: %s", task_id, status)
             return jsonify({
                 'status': 'unknown',
                 'progress': 0,
@@ -1301,7 +1532,7 @@ def task_status_api(task_id):
     except Exception as e:
         # Log the error
         error_msg = f"Error retrieving task status: {str(e)}"
-        logging.error(error_msg)
+        logger.error(error_msg)
         
         # Return a fallback response
         return jsonify({
@@ -1338,7 +1569,7 @@ def delete_audio(id):
             # Delete the audio file if it exists
             if os.path.exists(audio_path):
                 os.remove(audio_path)
-                logging.info(f"Deleted audio file: {audio_path}")
+                logger.info(f"Deleted audio file: {audio_path}")
             
             # Update episode status
             if episode.status == 'published':
@@ -1354,7 +1585,7 @@ def delete_audio(id):
             
             flash('Audio file deleted successfully.', 'success')
         except Exception as e:
-            logging.error(f"Error deleting audio file: {str(e)}")
+            logger.error(f"Error deleting audio file: {str(e)}")
             flash(f'Error deleting audio file: {str(e)}', 'danger')
     else:
         flash('No audio file found for this episode.', 'warning')
@@ -1384,9 +1615,9 @@ def delete_episode(id):
                 # Delete the audio file if it exists
                 if os.path.exists(audio_path):
                     os.remove(audio_path)
-                    logging.info(f"Deleted audio file: {audio_path}")
+                    logger.info(f"Deleted audio file: {audio_path}")
             except Exception as e:
-                logging.error(f"Error deleting audio file: {str(e)}")
+                logger.error(f"Error deleting audio file: {str(e)}")
                 # Continue with episode deletion even if audio file deletion fails
         
         # Store episode title for flash message
@@ -1398,7 +1629,7 @@ def delete_episode(id):
         
         flash(f'Episode "{episode_title}" deleted successfully.', 'success')
     except Exception as e:
-        logging.error(f"Error deleting episode: {str(e)}")
+        logger.error(f"Error deleting episode: {str(e)}")
         flash(f'Error deleting episode: {str(e)}', 'danger')
     
     return redirect(url_for('index'))
@@ -1419,7 +1650,7 @@ def publish(id):
             return redirect(url_for('episode', id=id))
         
         # Get GitHub settings from environment variables or database
-        github_token = os.environ.get("GITHUB_TOKEN" # Add your key here)
+        github_token = os.environ.get("GITHUB_TOKEN")
         github_username = os.environ.get('GITHUB_USERNAME')
         github_repo = os.environ.get('GITHUB_REPO')
         
@@ -1444,7 +1675,7 @@ def publish(id):
             return redirect(url_for('settings', _anchor='nav-api-keys'))
         
         # Publish to GitHub
-        logging.info(f"Publishing episode {id} to GitHub Pages")
+        logger.info(f"Publishing episode {id} to GitHub Pages")
         
         # Get associated podcast settings
         podcast_settings = episode.settings  # This should be accessible through the relationship
@@ -1465,18 +1696,104 @@ def publish(id):
             db.session.commit()
             
             flash(f'Podcast "{episode.title}" published successfully! Accessible at: <a href="{url}" target="_blank">{url}</a>', 'success')
-            logging.info(f"Episode {id} published successfully to {url}")
+            logger.info(f"Episode {id} published successfully to {url}")
         else:
             flash(f'Error publishing to GitHub: {url}', 'danger')
-            logging.error(f"Failed to publish episode {id}: {url}")
+            logger.error(f"Failed to publish episode {id}: {url}")
             
         return redirect(url_for('episode', id=id))
     
     except Exception as e:
-        logging.error(f"Error publishing podcast: {str(e)}")
+        logger.error(f"Error publishing podcast: {str(e)}")
         flash(f'Error publishing podcast: {str(e)}', 'danger')
         return redirect(url_for('episode', id=id))
 
+@app.route('/publish/queue/<int:id>')
+@login_required
+def queue_publish(id):
+    """Add an episode to the batch publish queue"""
+    from publish_queue import queue_episodes
+    
+    episode = models.Episode.query.get_or_404(id)
+    
+    # Check if the episode belongs to the current user's podcasts
+    podcast = models.Settings.query.get_or_404(episode.podcast_id)
+    if podcast.user_id != current_user.id and not current_user.is_admin:
+        flash('You do not have permission to publish this episode.', 'danger')
+        return redirect(url_for('episode', id=id))
+    
+    if queue_episodes([id]):
+        flash(f'Episode "{episode.title}" added to the publish queue.', 'success')
+    else:
+        flash('Only episodes with generated audio can be queued for publishing.', 'warning')
+    
+    return redirect(url_for('episode', id=id))
+
+@app.route('/publish/batch', methods=['POST'])
+@login_required
+def publish_batch():
+    """
+    Publish queued episodes to GitHub Pages in one commit and push
+    
+    Accepts an optional list of episode IDs (form field episode_ids[] or a
+    JSON body {"episode_ids": [...]}); without it the whole queue is published.
+    """
+    from publish_queue import get_queued_episodes, queue_episodes, publish_queued_episodes
+    
+    if request.is_json:
+        episode_ids = (request.json or {}).get('episode_ids') or []
+    else:
+        episode_ids = request.form.getlist('episode_ids[]')
+    try:
+        if not isinstance(episode_ids, list):
+            raise ValueError(episode_ids)
+        episode_ids = [int(str(episode_id)) for episode_id in episode_ids]
+    except (TypeError, ValueError):
+        if request.is_json:
+            return jsonify({"success": False, "error": "episode_ids must be a list of episode IDs"}), 400
+        flash('Invalid episode selection.', 'danger')
+        return redirect(url_for('index'))
+    
+    # Only publish episodes of the current user's podcasts
+    user_podcast_ids = {p.id for p in models.Settings.query.filter_by(user_id=current_user.id).all()}
+    
+    def owned(episodes):
+        if current_user.is_admin:
+            return episodes
+        return [episode for episode in episodes if episode.podcast_id in user_podcast_ids]
+    
+    # Episodes named explicitly may not have been queued yet
+    if episode_ids:
+        requested = owned(models.Episode.query.filter(models.Episode.id.in_(episode_ids)).all())
+        episode_ids = [episode.id for episode in requested]
+        if episode_ids:
+            queue_episodes(episode_ids)
+            queued = get_queued_episodes(episode_ids)
+        else:
+            queued = []
+    else:
+        queued = owned(get_queued_episodes())
+    
+    try:
+        if queued:
+            success, result = publish_queued_episodes([episode.id for episode in queued])
+        else:
+            success, result = False, "No episodes are waiting to be published"
+    except Exception as e:
+        logger.error(f"Error publishing episode batch: {str(e)}")
+        success, result = False, str(e)
+    
+    if request.is_json:
+        if success:
+            return jsonify({"success": True, "published": result})
+        return jsonify({"success": False, "error": result}), 500
+    
+    if success:
+        flash(f'Published {len(result)} episode(s) to GitHub Pages.', 'success')
+    else:
+        flash(f'Error publishing to GitHub: {result}', 'danger')
+    return redirect(url_for('index'))
+
 
 @app.route('/schedule')
 @login_required
@@ -1607,3 +1924,24 @@ def podcast_rss(slug):
         mimetype='application/rss+xml'
     )
     return response
+
+
+@app.route('/websub/callback/<token>', methods=['GET', 'POST'])
+def websub_callback(token):
+    """Answer a WebSub hub: intent verification (GET) or pushed feed content (POST)"""
+    import websub
+    
+    if request.method == 'GET':
+        status, body = websub.verify_intent(token, request.args)
+    else:
+        status, body = websub.receive_push(token, request.get_data(), request.headers)
+    return app.response_class(response=body, status=status, mimetype='text/plain')
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Serve pipeline metrics in the Prometheus text format"""
+    from metrics import render_metrics
+    
+    body, content_type = render_metrics()
+    return app.response_class(response=body, status=200, content_type=content_type)
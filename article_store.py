@@ -0,0 +1,399 @@
+"""
+Persistent archive of fetched feed articles.
+
+Every entry seen in a feed is stored once per feed in the articles table,
+keyed by its normalized link (and checked against its feed GUID), so
+fetching a feed again only processes the entries it has not seen before.
+An article carried by several feeds has a row for each, so a podcast sees
+it whichever of those feeds it follows. Podcasts read their articles from
+the archive with a time-range query, which lets weekly and monthly time
+frames include entries that have already dropped out of the feed.
+"""
+import json
+import heapq
+import hashlib
+import logging
+import calendar
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that only track the click and do not change the article
+TRACKING_PARAMS = {"fbclid", "gclid", "mc_cid", "mc_eid", "ref", "ref_src", "cmpid", "ncid", "sr_share", "utm"}
+
+# Keys per IN (...) query when looking up seen entries
+LOOKUP_BATCH_SIZE = 500
+
+def to_epoch(value):
+    """
+    Convert a publish time to UTC epoch seconds
+    
+    Args:
+        value: Epoch seconds, a datetime (naive ones are UTC, as stored in the
+            archive) or an ISO 8601 string
+    
+    Returns:
+        int: Seconds since the epoch, or None if value is empty
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        return int(value.timestamp())
+    return calendar.timegm(value.timetuple())
+
+def from_epoch(seconds):
+    """
+    Convert UTC epoch seconds to the naive UTC datetime the archive stores
+    
+    Args:
+        seconds (int): Seconds since the epoch
+    
+    Returns:
+        datetime: Naive UTC time
+    """
+    return datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None)
+
+@dataclass(slots=True)
+class ArticleRecord:
+    """
+    An article on its way from a parsed feed through the archive to a podcast
+    
+    Records are much smaller than article dictionaries, which matters when
+    parse workers send hundreds of them back and when a monthly time frame
+    reads thousands from the archive. The publish time is kept as UTC epoch
+    seconds, so records compare and sort without parsing dates.
+    """
+    title: str
+    link: str
+    published: int  # UTC epoch seconds, None while a streamed entry has no date
+    source: str = ''
+    summary: str = ''
+    guid: str = None
+    
+    @property
+    def published_at(self):
+        """Publish time as a naive UTC datetime"""
+        return from_epoch(self.published)
+    
+    def to_dict(self):
+        """Article dictionary in the format returned by rss.fetch_rss_feeds"""
+        return {
+            'title': self.title,
+            'link': self.link,
+            'published': self.published_at.isoformat(),
+            'source': self.source,
+            'summary': self.summary or '',
+        }
+    
+    @classmethod
+    def from_dict(cls, article):
+        """
+        Build a record from an article dictionary
+        
+        Args:
+            article (dict): Article dictionary; 'published' may be epoch seconds,
+                a datetime or an ISO string
+        
+        Returns:
+            ArticleRecord: The record
+        """
+        return cls(
+            title=article.get('title') or 'Untitled article',
+            link=article['link'],
+            published=to_epoch(article.get('published')),
+            source=article.get('source') or '',
+            summary=article.get('summary') or '',
+            guid=article.get('guid'),
+        )
+
+def encode_articles(articles):
+    """
+    Serialize articles in the data.json format
+    
+    Args:
+        articles (list): ArticleRecords or article dictionaries
+    
+    Returns:
+        str: JSON list of article dictionaries with ISO 'published' dates
+    """
+    return json.dumps([
+        article.to_dict() if isinstance(article, ArticleRecord) else article for article in articles
+    ])
+
+def decode_articles(text):
+    """
+    Read articles serialized by encode_articles, e.g. an episode's data.json
+    
+    Args:
+        text (str): JSON list of article dictionaries
+    
+    Returns:
+        list: ArticleRecords
+    """
+    return [ArticleRecord.from_dict(article) for article in json.loads(text)]
+
+def normalize_link(link):
+    """
+    Normalize an article link so variants of the same URL compare equal
+    
+    Lowercases the scheme and host, drops default ports, fragments, tracking
+    parameters and trailing slashes, and sorts the remaining parameters.
+    
+    Args:
+        link (str): Article URL
+    
+    Returns:
+        str: Normalized URL
+    """
+    link = (link or "").strip()
+    try:
+        parts = urlsplit(link)
+    except ValueError:
+        return link
+    
+    scheme = parts.scheme.lower() or "http"
+    host = (parts.hostname or "").lower()
+    port = parts.port if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)) else None
+    netloc = f"{host}:{port}" if port else host
+    
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.lower().startswith("utm_") and name.lower() not in TRACKING_PARAMS
+    ))
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+def article_key(link):
+    """
+    Get the storage key of an article link
+    
+    Args:
+        link (str): Article URL
+    
+    Returns:
+        str: 64 hex characters
+    """
+    return hashlib.sha256(normalize_link(link).encode("utf-8")).hexdigest()
+
+def find_unseen(feed_url, entries):
+    """
+    Filter feed entries down to the ones the feed has not stored yet
+    
+    Args:
+        feed_url (str): Feed the entries come from
+        entries (list): (guid, link) tuples
+    
+    Returns:
+        list: Indexes of the unseen entries
+    """
+    import models
+    
+    keys = [article_key(link) for _, link in entries]
+    guids = [guid for guid, _ in entries if guid]
+    
+    known_keys = set()
+    known_guids = set()
+    for start in range(0, max(len(keys), len(guids)), LOOKUP_BATCH_SIZE):
+        key_batch = keys[start:start + LOOKUP_BATCH_SIZE]
+        guid_batch = guids[start:start + LOOKUP_BATCH_SIZE]
+        conditions = []
+        if key_batch:
+            conditions.append(models.Article.key.in_(key_batch))
+        if guid_batch:
+            conditions.append(models.Article.guid.in_(guid_batch))
+        # Other feeds having the article does not matter, it gets a row for this feed too
+        rows = models.Article.query.with_entities(models.Article.key, models.Article.guid).filter(
+            models.Article.feed_url == feed_url, or_(*conditions)
+        ).all()
+        for key, guid in rows:
+            known_keys.add(key)
+            if guid:
+                known_guids.add(guid)
+    
+    unseen = []
+    seen_in_batch = set()
+    for index, ((guid, _), key) in enumerate(zip(entries, keys)):
+        if key in known_keys or key in seen_in_batch or (guid and guid in known_guids):
+            continue
+        seen_in_batch.add(key)
+        unseen.append(index)
+    return unseen
+
+def get_recent_keys(feed_url, limit):
+    """
+    Get the keys and GUIDs of a feed's newest archived entries
+    
+    They let a feed parser recognize the entries it has reached before
+    without asking the database (see rss.parse_feed_content).
+    
+    Args:
+        feed_url (str): Feed URL
+        limit (int): Number of entries
+    
+    Returns:
+        tuple: (set of keys, set of GUIDs)
+    """
+    import models
+    
+    rows = models.Article.query.with_entities(models.Article.key, models.Article.guid).filter(
+        models.Article.feed_url == feed_url
+    ).order_by(models.Article.published.desc()).limit(limit).all()
+    return {key for key, _ in rows}, {guid for _, guid in rows if guid}
+
+def store_articles(feed_url, articles):
+    """
+    Add new articles to the archive
+    
+    Args:
+        feed_url (str): Feed the articles come from
+        articles (list): ArticleRecords with a publish time
+    
+    Returns:
+        int: Number of articles stored
+    """
+    from app import db
+    import models
+    
+    rows = [models.Article(
+        key=article_key(article.link),
+        guid=article.guid[:512] if article.guid else None,
+        link=article.link,
+        title=(article.title or 'Untitled article')[:512],
+        source=(article.source or '')[:255],
+        feed_url=feed_url,
+        summary=article.summary,
+        published=article.published_at,
+    ) for article in articles]
+    if not rows:
+        return 0
+    
+    try:
+        db.session.add_all(rows)
+        db.session.commit()
+        return len(rows)
+    except IntegrityError:
+        # Another process stored some of them in the meantime; keep the rest
+        db.session.rollback()
+    
+    stored = 0
+    for row in rows:
+        try:
+            db.session.add(row)
+            db.session.commit()
+            stored += 1
+        except IntegrityError:
+            db.session.rollback()
+    return stored
+
+def get_articles(since, until=None, feed_urls=None, per_feed_limit=None, exclude=None):
+    """
+    Get archived articles published in a time range, newest first
+    
+    With per_feed_limit, each feed's newest articles are picked with a heap
+    over publish times alone, and only the picked ones are loaded in full,
+    so a monthly time frame does not read every summary in the archive.
+    Articles that exclude leaves out do not count toward the limit; another
+    heap picks the feed's next ones, older than those already loaded. An article stored for several of the feeds
+    is returned once.
+    
+    Args:
+        since (datetime): Earliest publish time; naive times are local, like
+            rss.get_cutoff_date, aware ones are converted
+        until (datetime): Latest publish time, defaults to no limit
+        feed_urls (list): Only articles of these feeds
+        per_feed_limit (int): Most articles per feed
+        exclude: Function called with each ArticleRecord, True leaves it out
+    
+    Returns:
+        list: ArticleRecords
+    """
+    import models
+    
+    columns = (
+        models.Article.id, models.Article.key, models.Article.title, models.Article.link, models.Article.published,
+        models.Article.source, models.Article.summary, models.Article.guid,
+    )
+    # The archive stores naive UTC
+    query = models.Article.query.filter(models.Article.published >= from_epoch(since.timestamp()))
+    if until is not None:
+        query = query.filter(models.Article.published < from_epoch(until.timestamp()))
+    if feed_urls is not None:
+        if not feed_urls:
+            return []
+        query = query.filter(models.Article.feed_url.in_(list(feed_urls)))
+    
+    def read(rows):
+        """Turn rows into (row, record) pairs, without the excluded articles"""
+        pairs = [(row, ArticleRecord(
+            title=row.title,
+            link=row.link,
+            published=to_epoch(row.published),
+            source=row.source or '',
+            summary=row.summary or '',
+            guid=row.guid,
+        )) for row in rows]
+        return [(row, record) for row, record in pairs if exclude is None or not exclude(record)]
+    
+    if per_feed_limit:
+        pairs = []
+        # Feed -> articles still missing; the first round wants the limit of every feed
+        wanted = None
+        # Feed -> oldest (published, id) loaded so far, later rounds continue below it
+        boundary = {}
+        # Usually one round; another one for each feed that had articles left out
+        while wanted is None or wanted:
+            round_query = query.with_entities(models.Article.id, models.Article.feed_url, models.Article.published)
+            if wanted is not None:
+                round_query = round_query.filter(models.Article.feed_url.in_(list(wanted)))
+            # Smallest of each feed's newest articles at the top of its heap
+            heaps = {}
+            for article_id, feed_url, published in round_query:
+                candidate = (published, article_id)
+                if feed_url in boundary and candidate >= boundary[feed_url]:
+                    continue
+                count = per_feed_limit if wanted is None else wanted[feed_url]
+                heap = heaps.setdefault(feed_url, [])
+                if len(heap) < count:
+                    heapq.heappush(heap, candidate)
+                elif candidate > heap[0]:
+                    heapq.heapreplace(heap, candidate)
+            
+            feed_of = {article_id: feed_url for feed_url, heap in heaps.items() for _, article_id in heap}
+            found = dict.fromkeys(heaps, 0)
+            ids = list(feed_of)
+            for start in range(0, len(ids), LOOKUP_BATCH_SIZE):
+                for row, record in read(models.Article.query.with_entities(*columns).filter(
+                    models.Article.id.in_(ids[start:start + LOOKUP_BATCH_SIZE])
+                )):
+                    pairs.append((row, record))
+                    found[feed_of[row.id]] += 1
+            
+            requested = wanted or dict.fromkeys(heaps, per_feed_limit)
+            for feed_url, heap in heaps.items():
+                boundary[feed_url] = heap[0]
+            # A feed whose heap was not filled has no older articles left
+            wanted = {
+                feed_url: requested[feed_url] - found[feed_url] for feed_url, heap in heaps.items()
+                if found[feed_url] < requested[feed_url] and len(heap) == requested[feed_url]
+            }
+        pairs.sort(key=lambda pair: (pair[0].published, pair[0].id), reverse=True)
+    else:
+        pairs = read(query.with_entities(*columns).order_by(models.Article.published.desc(), models.Article.id.desc()))
+    
+    records = []
+    seen_keys = set()
+    for row, record in pairs:
+        if row.key in seen_keys:
+            continue
+        seen_keys.add(row.key)
+        records.append(record)
+    return records
@@ -0,0 +1,267 @@
+"""
+End-to-end benchmark of the podcast pipeline against the local stand-in
+servers in stub_servers.py and a local bare git repository.
+
+Usage:
+    python benchmark.py --iterations 5 --feeds 8 --latency 0.05 --json bench.json
+
+Reports throughput, p50/p99 latency and peak traced memory per stage:
+fetch_rss_feeds, generate_podcast_script, convert_to_speech and publish_to_github.
+The opt-in "stream" stage streams the script sentence by sentence and
+reports the time to its first sentence as well.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile
+    
+    Args:
+        values (list): Samples
+        pct (float): Percentile between 0 and 100
+    
+    Returns:
+        float: Percentile value, 0 for no samples
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def run_stage(name, iterations, func, units=None):
+    """
+    Run one pipeline stage repeatedly and measure it
+    
+    Args:
+        name (str): Stage name
+        iterations (int): Number of runs
+        func (callable): Stage function, returns the stage result
+        units (callable): Optional function mapping a result to a unit count (articles, characters...)
+    
+    Returns:
+        tuple: (stats dict, result of the last successful run)
+    """
+    latencies = []
+    errors = []
+    unit_total = 0
+    result = None
+    
+    tracemalloc.start()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        began = time.perf_counter()
+        try:
+            result = func()
+            if units:
+                unit_total += units(result)
+        except Exception as e:
+            errors.append(str(e))
+            logging.error(f"Benchmark stage {name} failed: {str(e)}")
+        latencies.append(time.perf_counter() - began)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    stats = {
+        "stage": name,
+        "iterations": iterations,
+        "errors": len(errors),
+        "throughput_per_s": iterations / elapsed if elapsed else 0.0,
+        "units_per_s": unit_total / elapsed if elapsed and units else None,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "peak_memory_kb": peak / 1024,
+    }
+    if errors:
+        stats["last_error"] = errors[-1][:200]
+    return stats, result
+
+def create_bare_repository(root):
+    """
+    Create a local bare repository with one commit on main to publish into
+    
+    Args:
+        root (str): Directory to create the repositories in
+    
+    Returns:
+        str: Path of the bare repository
+    """
+    bare = os.path.join(root, "pages.git")
+    seed = os.path.join(root, "seed")
+    subprocess.run(["git", "init", "-q", "--bare", "-b", "main", bare], check=True)
+    subprocess.run(["git", "clone", "-q", bare, seed], check=True, capture_output=True)
+    subprocess.run(["git", "-c", "user.name=bench", "-c", "user.email=bench@example.com",
+                    "commit", "-q", "--allow-empty", "-m", "init"], cwd=seed, check=True)
+    subprocess.run(["git", "push", "-q", "origin", "HEAD:main"], cwd=seed, check=True)
+    return bare
+
+def print_report(results):
+    """Print the stage statistics as a table"""
+    header = f"{'stage':<26}{'runs':>6}{'errors':>8}{'ops/s':>10}{'units/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'peak KB':>12}"
+    print(header)
+    print("-" * len(header))
+    for stats in results:
+        units = f"{stats['units_per_s']:.1f}" if stats["units_per_s"] is not None else "-"
+        print(
+            f"{stats['stage']:<26}{stats['iterations']:>6}{stats['errors']:>8}"
+            f"{stats['throughput_per_s']:>10.2f}{units:>12}{stats['p50_ms']:>10.1f}"
+            f"{stats['p99_ms']:>10.1f}{stats['peak_memory_kb']:>12.0f}"
+        )
+        if stats.get("first_output_p50_ms") is not None:
+            print(f"    first sentence p50: {stats['first_output_p50_ms']:.1f} ms")
+        if stats.get("last_error"):
+            print(f"    last error: {stats['last_error']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the podcast pipeline against local stand-in servers")
+    parser.add_argument("--iterations", type=int, default=3, help="Runs per stage")
+    parser.add_argument("--feeds", type=int, default=5, help="Number of fixture feeds")
+    parser.add_argument("--items-per-feed", type=int, default=30, help="Items in each fixture feed")
+    parser.add_argument("--duration", type=int, default=10, help="Podcast duration in minutes")
+    parser.add_argument("--latency", type=float, default=0.0, help="Stand-in API latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random stand-in API latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of API requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of API requests answered with 429")
+    parser.add_argument("--stream-delay", type=float, default=0.0, help="Delay between streamed chat completion chunks in seconds")
+    parser.add_argument("--stages", default="fetch,script,tts,publish", help="Comma separated stages to run (also: stream)")
+    parser.add_argument("--json", help="Write the results as JSON to this path")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    
+    from log_config import configure_logging
+    configure_logging(logging.INFO if args.verbose else logging.WARNING)
+    
+    import stub_servers
+    
+    workdir = tempfile.mkdtemp(prefix="podcast-bench-")
+    config = stub_servers.StubConfig(args.latency, args.jitter, args.error_rate, args.rate_limit_rate, seed=1)
+    stub_servers.FeedStubHandler.items_per_feed = args.items_per_feed
+    stub_servers.OpenAIStubHandler.stream_delay = args.stream_delay
+    servers = stub_servers.start_all(config)
+    
+    # Point every client at the stand-ins before the app modules read their settings
+    os.environ["OPENAI_API_KEY"] = "sk-stub"
+    os.environ["OPENAI_BASE_URL"] = f"{servers['openai'][1]}/v1"
+    os.environ["ELEVENLABS_API_KEY"] = "sk_stub_elevenlabs_key"
+    os.environ["ELEVENLABS_API_BASE"] = servers["elevenlabs"][1]
+    os.environ["GITHUB_MIRROR_DIR"] = os.path.join(workdir, "mirrors")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    os.environ.setdefault("SESSION_SECRET", "benchmark")
+    # Stages are timed on their own; the background poller would fetch the same feeds
+    os.environ["FEED_INGESTION"] = "off"
+    
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app import app
+    from rss import fetch_rss_feeds
+    from gpt import generate_podcast_script, stream_podcast_script
+    from tts import convert_to_speech
+    from gitpush import publish_to_github
+    
+    stages = [stage.strip() for stage in args.stages.split(",")]
+    feed_urls = [f"{servers['feeds'][1]}/feeds/{n}.xml" for n in range(1, args.feeds + 1)]
+    results = []
+    articles = []
+    script = "Welcome to the benchmark. " * 200
+    audio_path = os.path.join(workdir, "podcast.mp3")
+    
+    try:
+        with app.app_context():
+            if "fetch" in stages:
+                stats, fetched = run_stage(
+                    "fetch_rss_feeds", args.iterations,
+                    lambda: fetch_rss_feeds(feed_urls, max_articles_per_feed=15, time_frame="week"),
+                    units=len
+                )
+                results.append(stats)
+                articles = fetched or []
+            
+            if not articles:
+                articles = [
+                    {"title": f"Story {i}", "link": f"https://example.com/{i}", "published": datetime.now().isoformat(),
+                     "source": "Stub", "summary": stub_servers.lorem(400, config.random)}
+                    for i in range(15)
+                ]
+            
+            if "script" in stages:
+                stats, generated = run_stage(
+                    "generate_podcast_script", args.iterations,
+                    lambda: generate_podcast_script(articles, podcast_title="Benchmark Show", podcast_duration=args.duration),
+                    units=len
+                )
+                results.append(stats)
+                script = generated or script
+            
+            if "stream" in stages:
+                first_sentence = []
+                
+                def stream_once():
+                    started = time.perf_counter()
+                    sentences = []
+                    for sentence in stream_podcast_script(articles, podcast_title="Benchmark Show", podcast_duration=args.duration):
+                        if not sentences:
+                            first_sentence.append(time.perf_counter() - started)
+                        sentences.append(sentence)
+                    return "".join(sentences)
+                
+                stats, _ = run_stage("stream_podcast_script", args.iterations, stream_once, units=len)
+                stats["first_output_p50_ms"] = percentile(first_sentence, 50) * 1000
+                results.append(stats)
+            
+            if "tts" in stages:
+                voice = SimpleNamespace(voice_id="8Rym4ZbhAhRTh2D03UoX", stability=0.5, similarity_boost=0.5)
+                stats, _ = run_stage(
+                    "convert_to_speech", args.iterations,
+                    lambda: convert_to_speech(script, voice, audio_path),
+                    units=lambda _: len(script)
+                )
+                results.append(stats)
+            
+            if "publish" in stages:
+                # Fall back to a stand-in MP3 when TTS was skipped or ffmpeg is unavailable
+                if not os.path.exists(audio_path):
+                    with open(audio_path, "wb") as f:
+                        f.write(stub_servers.silent_mp3(len(script) / stub_servers.CHARS_PER_SECOND))
+                
+                bare = create_bare_repository(workdir)
+                counter = iter(range(1, args.iterations + 1))
+                
+                def publish_once():
+                    number = next(counter)
+                    episode = SimpleNamespace(
+                        id=number, title=f"Benchmark Episode {number}", date=datetime.now(),
+                        script=script, audio_path=audio_path,
+                        audio_size=None, audio_duration=None, audio_bitrate=None
+                    )
+                    success, result = publish_to_github(episode, "stub-token", "bench", "pages", remote_url=bare)
+                    if not success:
+                        raise Exception(result)
+                    return result
+                
+                stats, _ = run_stage("publish_to_github", args.iterations, publish_once)
+                results.append(stats)
+    finally:
+        for server, _ in servers.values():
+            server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    print_report(results)
+    print(f"\nStand-in API requests: {config.requests}, injected failures: {config.failures}")
+    
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Check of the GitHub Pages publishing flow against a local bare repository.
+
+Usage:
+    python check_publish.py
+
+Publishes a single episode, a batch of two and two concurrent single
+episodes through gitpush into a bare repository in a temporary directory,
+then clones it and checks the pushed files, the commits and podcast.xml.
+Only gitpush and the modules it imports are loaded, not the app, so no
+database or API keys are needed. Exits with status 1 when a check fails.
+"""
+import os
+import sys
+import json
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+# Number of episodes the check publishes
+EPISODE_COUNT = 5
+
+def make_episode(number, audio_dir):
+    """
+    Create an episode with a stand-in MP3 of its own
+    
+    Args:
+        number (int): Episode number, also its ID
+        audio_dir (str): Directory for the MP3
+    
+    Returns:
+        SimpleNamespace: Episode with the attributes gitpush reads
+    """
+    import stub_servers
+    
+    audio_path = os.path.join(audio_dir, f"episode-{number}.mp3")
+    with open(audio_path, "wb") as f:
+        f.write(stub_servers.silent_mp3(10 * number))
+    return SimpleNamespace(
+        id=number, title=f"Check Episode {number}", date=datetime(2025, 1, 1) + timedelta(days=number),
+        script=f"Script of episode {number}. " * 20, audio_path=audio_path, trace_id=None,
+        audio_size=None, audio_duration=None, audio_bitrate=None
+    )
+
+def main():
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    
+    workdir = tempfile.mkdtemp(prefix="podcast-publish-check-")
+    # gitpush reads the mirror location when it is imported
+    os.environ["GITHUB_MIRROR_DIR"] = os.path.join(workdir, "mirrors")
+    os.environ.setdefault("TRACE_EXPORTER", "none")
+    
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import gitpush
+    from benchmark import create_bare_repository
+    
+    failures = []
+    
+    def check(condition, message):
+        print(f"{'ok  ' if condition else 'FAIL'} {message}")
+        if not condition:
+            failures.append(message)
+    
+    try:
+        bare = create_bare_repository(workdir)
+        audio_dir = os.path.join(workdir, "audio")
+        os.makedirs(audio_dir)
+        episodes = [make_episode(number, audio_dir) for number in range(1, EPISODE_COUNT + 1)]
+        
+        success, result = gitpush.publish_to_github(episodes[0], "check-token", "check", "pages", remote_url=bare)
+        check(success, f"single publish: {result}")
+        
+        success, result = gitpush.publish_episodes_to_github(episodes[1:3], "check-token", "check", "pages", remote_url=bare)
+        check(success and sorted(result) == [2, 3], f"batch publish: {result}")
+        
+        # The mirror lock makes concurrent publishes take turns instead of racing
+        outcomes = {}
+        
+        def publish(episode):
+            outcomes[episode.id] = gitpush.publish_to_github(episode, "check-token", "check", "pages", remote_url=bare)
+        
+        threads = [threading.Thread(target=publish, args=(episode,)) for episode in episodes[3:]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        check(all(success for success, _ in outcomes.values()), f"concurrent publishes: {outcomes}")
+        
+        clone = os.path.join(workdir, "clone")
+        subprocess.run(["git", "clone", "-q", bare, clone], check=True)
+        subjects = subprocess.run(
+            ["git", "log", "--format=%s"], cwd=clone, check=True, capture_output=True, text=True
+        ).stdout.splitlines()
+        check(len(subjects) == 5, f"one commit per publish after the initial one: {subjects}")
+        check("Add podcast episode: Check Episode 1" in subjects, "single publish commit message")
+        check("Add 2 podcast episodes" in subjects, "batch publish commit message")
+        
+        for episode in episodes:
+            file_base = gitpush.get_episode_file_base(episode)
+            audio_path = os.path.join(clone, "podcasts", f"{file_base}.mp3")
+            script_path = os.path.join(clone, "podcasts", f"{file_base}.txt")
+            check(os.path.exists(audio_path) and os.path.getsize(audio_path) == os.path.getsize(episode.audio_path),
+                  f"audio of episode {episode.id} pushed")
+            check(os.path.exists(script_path) and open(script_path, encoding="utf-8").read() == episode.script,
+                  f"script of episode {episode.id} pushed")
+        
+        channel = ET.parse(os.path.join(clone, "podcast.xml")).getroot().find("channel")
+        items = channel.findall("item")
+        titles = [item.findtext("title") for item in items]
+        check(sorted(titles) == sorted(episode.title for episode in episodes), f"podcast.xml has every episode once: {titles}")
+        # The concurrent publishes may land in either order
+        check(sorted(titles[:2]) == ["Check Episode 4", "Check Episode 5"]
+              and titles[2:] == ["Check Episode 3", "Check Episode 2", "Check Episode 1"],
+              f"podcast.xml lists the latest publishes first: {titles}")
+        for item in items:
+            enclosure = item.find("enclosure")
+            number = int(item.findtext("title").rsplit(" ", 1)[1])
+            check(enclosure is not None and enclosure.get("length") == str(os.path.getsize(episodes[number - 1].audio_path)),
+                  f"enclosure length of episode {number}")
+        
+        with open(os.path.join(clone, "feed-index.json"), encoding="utf-8") as f:
+            index = json.load(f)
+        check(len(index["recent"]) == EPISODE_COUNT, "feed index lists every episode")
+        check("app" not in sys.modules, "published without importing the app")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    if failures:
+        print(f"\n{len(failures)} check(s) failed")
+        sys.exit(1)
+    print("\nAll publishing checks passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Per-feed health statistics, adaptive polling and a circuit breaker.
+
+Every fetch of a feed, in the background or while generating, updates its
+feed_health row: moving averages of the success rate and fetch latency,
+how many entries it publishes per day and when the newest one appeared.
+Busy feeds are polled more often than feeds that publish once a week.
+After FAILURE_THRESHOLD failures in a row the feed's circuit opens: it is
+skipped until a probe fetch is due, and every failed probe doubles the
+wait up to MAX_PROBE_INTERVAL. A successful fetch closes the circuit.
+"""
+import os
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Seconds between fetches of a feed without publishing history yet
+DEFAULT_POLL_INTERVAL = int(os.environ.get("FEED_INGEST_INTERVAL", "900"))
+
+# Bounds of the adaptive polling interval in seconds
+MIN_POLL_INTERVAL = int(os.environ.get("FEED_MIN_POLL_INTERVAL", "300"))
+MAX_POLL_INTERVAL = int(os.environ.get("FEED_MAX_POLL_INTERVAL", "21600"))
+
+# Fetches per expected new entry; 2 picks up an entry half an interval after it appears on average
+POLLS_PER_ITEM = 2
+
+# Days of archived entries the publishing rate is measured over
+RATE_WINDOW_DAYS = 14
+
+# Weight of the latest fetch in the success rate and latency averages
+SMOOTHING = 0.2
+
+# Failures in a row after which the circuit opens
+FAILURE_THRESHOLD = 3
+
+# Wait before the first probe of an open circuit, doubled after each failed probe (seconds)
+PROBE_INTERVAL = 600
+MAX_PROBE_INTERVAL = 86400
+
+def get_health(feed_urls):
+    """
+    Get the health rows of some feeds
+    
+    Args:
+        feed_urls (list): RSS feed URLs
+    
+    Returns:
+        dict: URL to FeedHealth, feeds never fetched are missing
+    """
+    import models
+    
+    if not feed_urls:
+        return {}
+    rows = models.FeedHealth.query.filter(models.FeedHealth.url.in_(list(set(feed_urls)))).all()
+    return {row.url: row for row in rows}
+
+def is_skipped(health, now=None):
+    """
+    Check whether a feed's circuit is open and its next probe is not due yet
+    
+    Args:
+        health (FeedHealth): Health row, may be None
+        now (datetime): Current time (UTC), defaults to now
+    
+    Returns:
+        bool: True if the feed should not be fetched now
+    """
+    if health is None or not health.circuit_open or health.next_fetch is None:
+        return False
+    return (now or datetime.utcnow()) < health.next_fetch
+
+def get_poll_interval(items_per_day):
+    """
+    Get how often to poll a feed given how much it publishes
+    
+    Args:
+        items_per_day (float): Entries per day, None if unknown
+    
+    Returns:
+        int: Seconds between fetches
+    """
+    if items_per_day is None:
+        return DEFAULT_POLL_INTERVAL
+    if items_per_day <= 0:
+        return MAX_POLL_INTERVAL
+    interval = 86400 / (items_per_day * POLLS_PER_ITEM)
+    return int(min(MAX_POLL_INTERVAL, max(MIN_POLL_INTERVAL, interval)))
+
+def get_probe_delay(consecutive_failures):
+    """
+    Get the wait before probing a feed with an open circuit again
+    
+    Args:
+        consecutive_failures (int): Failures in a row, at least FAILURE_THRESHOLD
+    
+    Returns:
+        int: Seconds until the next probe
+    """
+    exponent = min(max(0, consecutive_failures - FAILURE_THRESHOLD), 16)
+    return min(MAX_PROBE_INTERVAL, PROBE_INTERVAL * 2 ** exponent)
+
+def get_publishing_stats(feed_url):
+    """
+    Measure a feed's publishing rate from the article archive
+    
+    Args:
+        feed_url (str): RSS feed URL
+    
+    Returns:
+        tuple: (entries per day or None, publish time of the newest entry or None)
+    """
+    import models
+    from sqlalchemy import func
+    
+    # Publish times are stored in UTC, see article_store.ArticleRecord
+    now = datetime.utcnow()
+    count, oldest, newest = models.Article.query.with_entities(
+        func.count(models.Article.id), func.min(models.Article.published), func.max(models.Article.published)
+    ).filter(
+        models.Article.feed_url == feed_url,
+        models.Article.published >= now - timedelta(days=RATE_WINDOW_DAYS)
+    ).one()
+    
+    if not count:
+        newest = models.Article.query.with_entities(func.max(models.Article.published)).filter(
+            models.Article.feed_url == feed_url
+        ).scalar()
+        # Nothing recent at all; an empty archive means the rate is still unknown
+        return (0.0 if newest else None), newest
+    
+    # A feed added recently only has history since its oldest entry
+    days = max(1.0, (now - oldest).total_seconds() / 86400)
+    return count / days, newest
+
+def record_fetch(feed_url, latency, error=None):
+    """
+    Update a feed's health after a fetch and schedule its next one
+    
+    Args:
+        feed_url (str): RSS feed URL
+        latency (float): Seconds the fetch took
+        error (Exception): The error if the fetch failed
+    """
+    from app import db
+    import models
+    
+    try:
+        health = models.FeedHealth.query.filter_by(url=feed_url).first()
+        if health is None:
+            health = models.FeedHealth(url=feed_url, fetch_count=0, consecutive_failures=0)
+            db.session.add(health)
+        
+        now = datetime.utcnow()
+        succeeded = error is None
+        health.fetch_count = (health.fetch_count or 0) + 1
+        health.success_rate = float(succeeded) if health.success_rate is None else (
+            (1 - SMOOTHING) * health.success_rate + SMOOTHING * float(succeeded)
+        )
+        health.avg_latency = latency if health.avg_latency is None else (
+            (1 - SMOOTHING) * health.avg_latency + SMOOTHING * latency
+        )
+        
+        if succeeded:
+            if health.consecutive_failures >= FAILURE_THRESHOLD:
+                logger.info(f"Feed {feed_url} recovered after {health.consecutive_failures} failures")
+            health.consecutive_failures = 0
+            health.last_error = None
+            health.items_per_day, health.last_new_item = get_publishing_stats(feed_url)
+            health.poll_interval = get_poll_interval(health.items_per_day)
+            health.next_fetch = now + timedelta(seconds=health.poll_interval)
+        else:
+            health.consecutive_failures = (health.consecutive_failures or 0) + 1
+            health.last_error = f"{type(error).__name__}: {error}"[:255]
+            if health.consecutive_failures >= FAILURE_THRESHOLD:
+                delay = get_probe_delay(health.consecutive_failures)
+                logger.warning(
+                    f"Feed {feed_url} failed {health.consecutive_failures} times in a row, next probe in {delay}s"
+                )
+            else:
+                delay = health.poll_interval or DEFAULT_POLL_INTERVAL
+            health.next_fetch = now + timedelta(seconds=delay)
+        
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error recording health of feed {feed_url}: {str(e)}")
@@ -0,0 +1,187 @@
+"""
+Incremental RSS/Atom parsing.
+
+feedparser builds every entry of a document before the first one can be
+looked at, and most of its time goes into sanitizing full-content HTML the
+archive has often stored already. iter_entries() instead walks the document
+with xml.etree's XMLPullParser and hands out one plain entry at a time, so
+the caller can stop as soon as it reaches entries it has seen or that are
+too old (see rss.read_streamed_entries). Documents this parser cannot
+handle, e.g. malformed XML or unknown formats, raise UnsupportedFeed and
+are parsed with feedparser instead.
+"""
+import logging
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from xml.etree.ElementTree import XMLPullParser, ParseError
+
+import article_store
+
+logger = logging.getLogger(__name__)
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+RSS1 = "{http://purl.org/rss/1.0/}"
+RDF = "{http://www.w3.org/1999/02/22-rdf-syntax-ns#}"
+CONTENT = "{http://purl.org/rss/1.0/modules/content/}"
+DC = "{http://purl.org/dc/elements/1.1/}"
+
+# Elements holding one entry, and the elements whose title is the feed title
+ENTRY_TAGS = {"item", RSS1 + "item", ATOM + "entry"}
+FEED_TAGS = {"channel", RSS1 + "channel", ATOM + "feed"}
+ROOT_TAGS = {"rss", RDF + "RDF", ATOM + "feed"}
+TITLE_TAGS = {"title", RSS1 + "title", ATOM + "title"}
+
+# Content elements in order of preference (full content before summaries)
+CONTENT_TAGS = (CONTENT + "encoded", ATOM + "content", "description", RSS1 + "description", ATOM + "summary")
+DATE_TAGS = ("pubDate", ATOM + "published", ATOM + "updated", DC + "date")
+
+# Bytes handed to the parser at a time; entries are produced between chunks
+CHUNK_SIZE = 16 * 1024
+
+class UnsupportedFeed(Exception):
+    """The document cannot be parsed incrementally"""
+
+def parse_date(value):
+    """
+    Parse an RFC 822 (RSS) or ISO 8601 (Atom) date
+    
+    Args:
+        value (str): Date text
+    
+    Returns:
+        int: UTC epoch seconds like rss.get_entry_published, or None if unparseable
+    """
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    # Times without a zone are taken as UTC
+    return article_store.to_epoch(parsed)
+
+def get_text(element):
+    """
+    Get an element's content as text, keeping inline XHTML as text
+    
+    Args:
+        element: ElementTree element
+    
+    Returns:
+        str: Text
+    """
+    if len(element):
+        return " ".join(text.strip() for text in element.itertext() if text.strip())
+    return (element.text or "").strip()
+
+def get_link(item):
+    """
+    Get an entry's link from RSS <link>text</link> or Atom <link rel="alternate" href/>
+    
+    Args:
+        item: Entry element
+    
+    Returns:
+        str: Link, empty if the entry has none
+    """
+    for child in item:
+        if child.tag in ("link", RSS1 + "link") and (child.text or "").strip():
+            return child.text.strip()
+        if child.tag == ATOM + "link" and child.get("rel", "alternate") == "alternate" and child.get("href"):
+            return child.get("href").strip()
+    # RSS permalinks are sometimes only in the guid
+    guid = item.find("guid")
+    if guid is not None and guid.get("isPermaLink", "true") == "true" and (guid.text or "").startswith("http"):
+        return guid.text.strip()
+    return ""
+
+def read_entry(item, feed_title):
+    """
+    Turn an entry element into an article record
+    
+    Args:
+        item: Entry element
+        feed_title (str): Title of the feed
+    
+    Returns:
+        ArticleRecord: Article as built by rss.read_parsed_entries, with a published
+            time of None when the entry has no date
+    """
+    children = {}
+    for child in item:
+        children.setdefault(child.tag, child)
+    
+    guid = children.get("guid", children.get(ATOM + "id"))
+    published = None
+    for tag in DATE_TAGS:
+        if tag in children:
+            published = parse_date(children[tag].text)
+            if published:
+                break
+    
+    content = ""
+    for tag in CONTENT_TAGS:
+        if tag in children:
+            content = get_text(children[tag])
+            if content:
+                break
+    
+    title = next((children[tag] for tag in TITLE_TAGS if tag in children), None)
+    return article_store.ArticleRecord(
+        title=(get_text(title) if title is not None else "") or 'Untitled article',
+        link=get_link(item),
+        published=published,
+        source=feed_title,
+        summary=content,
+        guid=(guid.text or "").strip() or None if guid is not None else None,
+    )
+
+def iter_entries(content, default_title=""):
+    """
+    Parse a feed document entry by entry
+    
+    Args:
+        content (bytes): Feed document
+        default_title (str): Feed title used until (or unless) the document names one
+    
+    Yields:
+        ArticleRecord: Articles in document order
+    
+    Raises:
+        UnsupportedFeed: The document is not well-formed RSS or Atom
+    """
+    parser = XMLPullParser(events=("start", "end"))
+    feed_title = default_title
+    # Tags of the open elements, to tell the feed's title from its entries' titles
+    open_tags = []
+    
+    for start in range(0, len(content), CHUNK_SIZE):
+        try:
+            parser.feed(content[start:start + CHUNK_SIZE])
+            events = list(parser.read_events())
+        except ParseError as e:
+            raise UnsupportedFeed(str(e))
+        
+        for event, element in events:
+            if event == "start":
+                if not open_tags and element.tag not in ROOT_TAGS:
+                    raise UnsupportedFeed(f"Unknown root element {element.tag}")
+                open_tags.append(element.tag)
+                continue
+            
+            open_tags.pop()
+            if element.tag in ENTRY_TAGS:
+                yield read_entry(element, feed_title)
+                # Entries are not needed once read
+                element.clear()
+            elif element.tag in TITLE_TAGS and open_tags and open_tags[-1] in FEED_TAGS:
+                feed_title = get_text(element) or feed_title
+    
+    try:
+        parser.close()
+    except ParseError as e:
+        raise UnsupportedFeed(str(e))
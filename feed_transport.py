@@ -0,0 +1,164 @@
+"""
+Pooled HTTP transport for feed downloads.
+
+feedparser.parse(url) opens a new urllib connection for every feed and
+does not reliably ask for compressed responses. Feeds are downloaded here
+instead, through one requests session with keep-alive connection pools and
+gzip/brotli transfer (brotli when the brotli package is installed), and
+handed to feedparser as bytes. Downloads run concurrently on a small
+thread pool; a semaphore per host keeps several feeds of the same site
+from being requested all at once, and responses larger than FEED_MAX_BYTES
+are abandoned.
+"""
+import os
+import time
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a connection and between bytes of the response
+FEED_CONNECT_TIMEOUT = 5
+FEED_FETCH_TIMEOUT = float(os.environ.get("FEED_FETCH_TIMEOUT", "20"))
+
+# Largest feed accepted, after decompression
+FEED_MAX_BYTES = int(os.environ.get("FEED_MAX_BYTES", str(10 * 1024 * 1024)))
+
+# Simultaneous downloads in total and per host
+FEED_FETCH_WORKERS = int(os.environ.get("FEED_FETCH_WORKERS", "8"))
+FEED_MAX_PER_HOST = int(os.environ.get("FEED_MAX_PER_HOST", "2"))
+
+# Hosts with a kept-alive connection pool
+POOL_HOSTS = 32
+
+READ_CHUNK_SIZE = 64 * 1024
+
+USER_AGENT = "AIPodcastGenerator/1.0 (feed reader)"
+
+FeedDownload = namedtuple("FeedDownload", ["feed_url", "content", "headers", "seconds", "error"])
+
+class FeedFetchError(Exception):
+    """A feed could not be downloaded"""
+
+_session = None
+_executor = None
+_host_semaphores = {}
+_lock = threading.Lock()
+
+def get_session():
+    """
+    Get the shared session, creating it on first use
+    
+    Returns:
+        requests.Session: Session with a connection pool per host
+    """
+    global _session
+    
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=FEED_MAX_PER_HOST)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({
+                "User-Agent": USER_AGENT,
+                "Accept": "application/rss+xml, application/atom+xml, application/xml;q=0.9, text/xml;q=0.9, */*;q=0.1",
+                # Includes br only when urllib3 can decode it
+                "Accept-Encoding": ACCEPT_ENCODING,
+            })
+            _session = session
+        return _session
+
+def get_executor():
+    """Get the thread pool downloads run on"""
+    global _executor
+    
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=FEED_FETCH_WORKERS, thread_name_prefix="feed-fetch")
+        return _executor
+
+def get_host_semaphore(feed_url):
+    """
+    Get the semaphore limiting simultaneous requests to a feed's host
+    
+    Args:
+        feed_url (str): Feed URL
+    
+    Returns:
+        threading.BoundedSemaphore: Semaphore of the host
+    """
+    host = (urlsplit(feed_url).hostname or "").lower()
+    with _lock:
+        semaphore = _host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = _host_semaphores[host] = threading.BoundedSemaphore(FEED_MAX_PER_HOST)
+        return semaphore
+
+def fetch_feed(feed_url):
+    """
+    Download one feed
+    
+    Args:
+        feed_url (str): Feed URL
+    
+    Returns:
+        FeedDownload: The decompressed body and the headers feedparser needs;
+            failures are returned in the error field, not raised
+    """
+    with get_host_semaphore(feed_url):
+        # Waiting for the host's turn does not count as fetch time
+        started = time.perf_counter()
+        try:
+            with get_session().get(feed_url, timeout=(FEED_CONNECT_TIMEOUT, FEED_FETCH_TIMEOUT), stream=True) as response:
+                if response.status_code >= 400:
+                    raise FeedFetchError(f"HTTP {response.status_code}")
+                
+                length = response.headers.get("Content-Length", "")
+                if length.isdigit() and int(length) > FEED_MAX_BYTES:
+                    raise FeedFetchError(f"Feed is {length} bytes, the limit is {FEED_MAX_BYTES}")
+                
+                chunks = []
+                size = 0
+                for chunk in response.iter_content(READ_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > FEED_MAX_BYTES:
+                        raise FeedFetchError(f"Feed is larger than {FEED_MAX_BYTES} bytes")
+                    chunks.append(chunk)
+                
+                # The body is already decompressed, so only the type (for the charset), the
+                # final URL (for relative links) and the links (for WebSub hubs) are passed on
+                headers = {"content-location": response.url}
+                if response.headers.get("Content-Type"):
+                    headers["content-type"] = response.headers["Content-Type"]
+                if response.headers.get("Link"):
+                    headers["link"] = response.headers["Link"]
+                return FeedDownload(feed_url, b"".join(chunks), headers, time.perf_counter() - started, None)
+        except Exception as e:
+            return FeedDownload(feed_url, None, None, time.perf_counter() - started, e)
+
+def fetch_feeds(feed_urls):
+    """
+    Download feeds concurrently
+    
+    Args:
+        feed_urls (list): Feed URLs
+    
+    Yields:
+        FeedDownload: One per distinct URL, in the order the downloads finish
+    """
+    feed_urls = list(dict.fromkeys(feed_urls))
+    if len(feed_urls) == 1:
+        yield fetch_feed(feed_urls[0])
+        return
+    
+    futures = [get_executor().submit(fetch_feed, feed_url) for feed_url in feed_urls]
+    for future in as_completed(futures):
+        yield future.result()
@@ -0,0 +1,301 @@
+import os
+import json
+import logging
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from mp3info import format_duration
+
+logger = logging.getLogger(__name__)
+
+ITUNES_NS = "http://www.itunes.com/dtds/podcast-1.0.dtd"
+ATOM_NS = "http://www.w3.org/2005/Atom"
+FH_NS = "http://purl.org/syndication/history/1.0"
+
+ET.register_namespace("itunes", ITUNES_NS)
+ET.register_namespace("atom", ATOM_NS)
+ET.register_namespace("fh", FH_NS)
+
+# Compact episode index kept next to podcast.xml in the Pages repository
+INDEX_FILENAME = "feed-index.json"
+FEED_FILENAME = "podcast.xml"
+ARCHIVE_FILENAME = "podcast-archive-{page}.xml"
+
+# Maximum number of items in podcast.xml and in each archive page
+DEFAULT_ITEM_CAP = int(os.environ.get("RSS_ITEM_CAP", "100"))
+
+DEFAULT_CHANNEL = {
+    "title": "Daily Tech Insights",
+    "description": "An AI-generated daily tech news podcast covering the latest in technology and startups.",
+    "link": "https://example.com",
+    "language": "en-us",
+    "author": "AI Podcast Generator",
+}
+
+def itunes(tag):
+    return f"{{{ITUNES_NS}}}{tag}"
+
+def atom(tag):
+    return f"{{{ATOM_NS}}}{tag}"
+
+def new_feed_index():
+    """
+    Create an empty feed index
+    
+    Returns:
+        dict: Feed index with default channel metadata
+    """
+    return {
+        "channel": dict(DEFAULT_CHANNEL),
+        "archives": 0,  # Number of archive pages written so far
+        "pending": [],  # Items not yet in an archive page, oldest first
+        "recent": [],  # Items shown in podcast.xml, oldest first
+    }
+
+def parse_length(value, guid):
+    """
+    Parse an enclosure length of an imported item
+    
+    Args:
+        value (str): length attribute, may be missing or malformed
+        guid (str): Item the value belongs to, for the log
+    
+    Returns:
+        int: Length in bytes, 0 when it cannot be read
+    """
+    if not value or not value.strip():
+        return 0
+    try:
+        return max(int(float(value.strip())), 0)
+    except (ValueError, OverflowError):
+        logger.warning(f"Unreadable enclosure length {value!r} of imported item {guid}, using 0")
+        return 0
+
+def parse_duration(value, guid):
+    """
+    Parse an itunes:duration of an imported item
+    
+    Accepts seconds, MM:SS and HH:MM:SS, each with fractional seconds.
+    
+    Args:
+        value (str): Duration text, may be missing or malformed
+        guid (str): Item the value belongs to, for the log
+    
+    Returns:
+        int: Duration in whole seconds, 0 when it cannot be read
+    """
+    if not value or not value.strip():
+        return 0
+    parts = value.strip().split(":")
+    try:
+        if len(parts) > 3:
+            raise ValueError("too many parts")
+        seconds = 0
+        for part in parts:
+            seconds = seconds * 60 + float(part)
+        return max(int(seconds), 0)
+    except (ValueError, OverflowError):
+        logger.warning(f"Unreadable duration {value!r} of imported item {guid}, using 0")
+        return 0
+
+def import_existing_feed(feed_path):
+    """
+    Build a feed index from a podcast.xml written before the index existed
+    
+    This parses the old feed once; afterwards only the index is read.
+    Malformed values of an item are read as 0 rather than dropping the item.
+    
+    Args:
+        feed_path (str): Path to the existing podcast.xml
+    
+    Returns:
+        dict: Feed index containing the existing channel metadata and items
+    
+    Raises:
+        ET.ParseError: The feed is not well-formed XML
+    """
+    with open(feed_path, "r", encoding="utf-8") as f:
+        text = f.read()
+    
+    # Older writers emitted itunes: elements without declaring the prefix
+    if "xmlns:itunes" not in text:
+        text = text.replace("<rss ", f'<rss xmlns:itunes="{ITUNES_NS}" ', 1)
+    
+    index = new_feed_index()
+    channel = ET.fromstring(text.encode("utf-8")).find("channel")
+    if channel is None:
+        return index
+    
+    for key in ("title", "description", "link", "language"):
+        value = channel.findtext(key)
+        if value:
+            index["channel"][key] = value
+    author = channel.findtext(itunes("author"))
+    if author:
+        index["channel"]["author"] = author
+    
+    for element in channel.findall("item"):
+        enclosure = element.find("enclosure")
+        guid = element.findtext("guid")
+        index["pending"].append({
+            "guid": guid,
+            "title": element.findtext("title"),
+            "summary": element.findtext("description"),
+            "pub_date": element.findtext("pubDate"),
+            "url": enclosure.get("url") if enclosure is not None else guid,
+            "length": parse_length(enclosure.get("length") if enclosure is not None else None, guid),
+            "duration": parse_duration(element.findtext(itunes("duration")), guid),
+        })
+    
+    index["recent"] = list(index["pending"])
+    logger.info(f"Imported {len(index['pending'])} items from existing feed {feed_path}")
+    return index
+
+def load_feed_index(site_dir):
+    """
+    Load the feed index of a Pages site, importing podcast.xml on first use
+    
+    Args:
+        site_dir (str): Root of the Pages working tree
+    
+    Returns:
+        dict: Feed index
+    
+    Raises:
+        Exception: podcast.xml exists but cannot be imported, so publishing
+            must not replace it
+    """
+    index_path = os.path.join(site_dir, INDEX_FILENAME)
+    if os.path.exists(index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    
+    feed_path = os.path.join(site_dir, FEED_FILENAME)
+    if os.path.exists(feed_path):
+        try:
+            return import_existing_feed(feed_path)
+        except Exception as e:
+            # A new index would overwrite podcast.xml and drop the back catalog
+            logger.error(f"Could not import existing feed {feed_path}: {str(e)}")
+            raise
+    
+    return new_feed_index()
+
+def write_atomic(path, data):
+    """
+    Write a file through a temporary file so readers never see a partial write
+    
+    Args:
+        path (str): Destination path
+        data (bytes): File contents
+    """
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+def render_feed(channel_info, items, base_url, links):
+    """
+    Render an RSS document
+    
+    Args:
+        channel_info (dict): Channel metadata
+        items (list): Items to include, newest first
+        base_url (str): Public URL of the Pages site, ending with a slash
+        links (dict): Atom link relations (self, current, prev-archive) to filenames
+    
+    Returns:
+        bytes: RSS XML document
+    """
+    root = ET.Element("rss", version="2.0")
+    channel = ET.SubElement(root, "channel")
+    
+    ET.SubElement(channel, "title").text = channel_info["title"]
+    ET.SubElement(channel, "description").text = channel_info["description"]
+    ET.SubElement(channel, "link").text = channel_info["link"]
+    ET.SubElement(channel, "language").text = channel_info["language"]
+    ET.SubElement(channel, "lastBuildDate").text = datetime.now().strftime("%a, %d %b %Y %H:%M:%S GMT")
+    
+    # RFC 5005 archive links
+    for rel, filename in links.items():
+        if filename:
+            ET.SubElement(channel, atom("link"), rel=rel, href=f"{base_url}{filename}", type="application/rss+xml")
+    if "current" in links:
+        ET.SubElement(channel, f"{{{FH_NS}}}archive")
+    
+    # iTunes specific elements
+    ET.SubElement(channel, itunes("author")).text = channel_info["author"]
+    ET.SubElement(channel, itunes("summary")).text = channel_info["description"]
+    
+    for entry in items:
+        item = ET.SubElement(channel, "item")
+        ET.SubElement(item, "title").text = entry["title"]
+        ET.SubElement(item, "description").text = entry["summary"]
+        ET.SubElement(item, "pubDate").text = entry["pub_date"]
+        ET.SubElement(item, "guid", isPermaLink="false").text = entry["guid"]
+        ET.SubElement(item, "enclosure", url=entry["url"], length=str(entry["length"]), type="audio/mpeg")
+        ET.SubElement(item, itunes("duration")).text = format_duration(entry["duration"])
+        ET.SubElement(item, itunes("summary")).text = entry["summary"]
+    
+    tree = ET.ElementTree(root)
+    ET.indent(tree, space="  ", level=0)
+    return ET.tostring(root, encoding="utf-8", xml_declaration=True)
+
+def update_feed(site_dir, new_items, base_url, item_cap=None):
+    """
+    Add items to the published feed
+    
+    Only the compact index and the newest item_cap items are read and
+    rendered. Once item_cap items have accumulated since the last archive
+    page they are written out as an immutable RFC 5005 archive page
+    (podcast-archive-N.xml) linked from podcast.xml with prev-archive, so the
+    cost of a publish does not grow with the back catalog.
+    
+    Args:
+        site_dir (str): Root of the Pages working tree
+        new_items (list): Item dicts (guid, title, summary, pub_date, url, length, duration), oldest first
+        base_url (str): Public URL of the Pages site, ending with a slash
+        item_cap (int): Maximum items per document, defaults to RSS_ITEM_CAP
+    
+    Returns:
+        dict: Updated feed index
+    """
+    item_cap = item_cap or DEFAULT_ITEM_CAP
+    index = load_feed_index(site_dir)
+    
+    # Re-publishing an episode replaces its item instead of duplicating it
+    new_guids = {entry["guid"] for entry in new_items}
+    index["pending"] = [entry for entry in index["pending"] if entry["guid"] not in new_guids]
+    index["recent"] = [entry for entry in index["recent"] if entry["guid"] not in new_guids]
+    
+    index["pending"].extend(new_items)
+    index["recent"].extend(new_items)
+    
+    # Move full pages of items into archive documents
+    while len(index["pending"]) >= item_cap:
+        page_items = index["pending"][:item_cap]
+        index["pending"] = index["pending"][item_cap:]
+        index["archives"] += 1
+        page = index["archives"]
+        
+        archive = render_feed(index["channel"], list(reversed(page_items)), base_url, {
+            "current": FEED_FILENAME,
+            "self": ARCHIVE_FILENAME.format(page=page),
+            "prev-archive": ARCHIVE_FILENAME.format(page=page - 1) if page > 1 else None,
+        })
+        write_atomic(os.path.join(site_dir, ARCHIVE_FILENAME.format(page=page)), archive)
+        logger.info(f"Wrote feed archive page {page} with {len(page_items)} items")
+    
+    index["recent"] = index["recent"][-item_cap:]
+    
+    feed = render_feed(index["channel"], list(reversed(index["recent"])), base_url, {
+        "self": FEED_FILENAME,
+        "prev-archive": ARCHIVE_FILENAME.format(page=index["archives"]) if index["archives"] else None,
+    })
+    write_atomic(os.path.join(site_dir, FEED_FILENAME), feed)
+    write_atomic(
+        os.path.join(site_dir, INDEX_FILENAME),
+        json.dumps(index, separators=(",", ":")).encode("utf-8")
+    )
+    
+    logger.info(f"Updated feed with {len(new_items)} items ({len(index['recent'])} in podcast.xml, {index['archives']} archive pages)")
+    return index
@@ -1,13 +1,149 @@
 import os
+import fcntl
+import time
 import shutil
 import logging
-import tempfile
 import subprocess
-import xml.etree.ElementTree as ET
-from datetime import datetime
-from urllib.parse import urljoin
+from contextlib import contextmanager
+from mp3info import read_mp3_info
+from feed_writer import update_feed
 
-def publish_to_github(episode, github_token, github_username, github_repo, branch="main"):
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Long-lived working copies of the GitHub Pages repositories, one per repo/branch
+MIRROR_ROOT = os.environ.get("GITHUB_MIRROR_DIR", os.path.join("storage", "github_mirrors"))
+
+def get_mirror_dir(github_username, github_repo, branch="main"):
+    """
+    Get the local mirror directory for a GitHub repository
+    
+    Args:
+        github_username (str): GitHub username
+        github_repo (str): GitHub repository name
+        branch (str): GitHub branch name
+        
+    Returns:
+        str: Path to the mirror working copy
+    """
+    return os.path.join(MIRROR_ROOT, f"{github_username}_{github_repo}_{branch}")
+
+@contextmanager
+def mirror_lock(mirror_dir):
+    """
+    Hold an exclusive file lock on a mirror so concurrent publishes
+    (threads or gunicorn workers) run one at a time
+    
+    Args:
+        mirror_dir (str): Path to the mirror working copy
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(mirror_dir)), exist_ok=True)
+    with open(f"{mirror_dir}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def run_git(args, cwd=None, secret=None):
+    """
+    Run a git command and raise if it fails
+    
+    Args:
+        args (list): Arguments passed to git
+        cwd (str): Working directory
+        secret (str): Value to mask in logs and error messages (e.g. the token)
+        
+    Returns:
+        CompletedProcess: Finished git process
+    """
+    def mask(text):
+        return text.replace(secret, "***") if secret else text
+    
+    cmd = ["git"] + args
+    logger.debug(f"Running git command: {mask(' '.join(cmd))}")
+    started = time.perf_counter()
+    with tracing.start_span(f"git.{args[0]}") as span:
+        process = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True)
+        span.set_attribute("process.exit_code", process.returncode)
+        if process.returncode != 0:
+            span.status = tracing.STATUS_ERROR
+    outcome = "success" if process.returncode == 0 else "error"
+    metrics.GIT_COMMAND_DURATION.labels(args[0], outcome).observe(time.perf_counter() - started)
+    
+    if process.returncode != 0:
+        raise Exception(f"Git command failed ({mask(' '.join(cmd[:2]))}): {mask(process.stderr.strip())}")
+    
+    return process
+
+def sync_mirror(mirror_dir, repo_url, branch="main", secret=None):
+    """
+    Create the mirror on first use, otherwise fetch and fast-forward it to the remote branch
+    
+    Args:
+        mirror_dir (str): Path to the mirror working copy
+        repo_url (str): Remote repository URL
+        branch (str): Branch to track
+        secret (str): Value to mask in logs and error messages
+    """
+    if not os.path.isdir(os.path.join(mirror_dir, ".git")):
+        # Leftovers from an interrupted clone are not usable
+        if os.path.exists(mirror_dir):
+            shutil.rmtree(mirror_dir)
+        
+        logger.info(f"Creating local mirror at {mirror_dir}")
+        run_git(["clone", repo_url, "--depth", "1", "--branch", branch, mirror_dir], secret=secret)
+        run_git(["config", "user.name", "AI Podcast Generator"], cwd=mirror_dir)
+        run_git(["config", "user.email", "noreply@example.com"], cwd=mirror_dir)
+        return
+    
+    # The token may have been rotated since the mirror was created
+    run_git(["remote", "set-url", "origin", repo_url], cwd=mirror_dir, secret=secret)
+    
+    # Drop anything left behind by a publish that failed half way
+    run_git(["reset", "--hard", "HEAD"], cwd=mirror_dir)
+    run_git(["clean", "-fd"], cwd=mirror_dir)
+    
+    # Only the commits made since the last publish are transferred
+    run_git(["fetch", "origin", branch], cwd=mirror_dir, secret=secret)
+    try:
+        run_git(["merge", "--ff-only", "FETCH_HEAD"], cwd=mirror_dir)
+    except Exception as e:
+        # A local commit that never got pushed; the remote is the source of truth
+        logger.warning(f"Mirror {mirror_dir} diverged from origin, resetting: {str(e)}")
+        run_git(["reset", "--hard", "FETCH_HEAD"], cwd=mirror_dir)
+
+def link_or_copy(src, dest):
+    """
+    Hardlink a file into the mirror, falling back to a copy across filesystems
+    
+    Args:
+        src (str): Source file path
+        dest (str): Destination file path
+    """
+    if os.path.lexists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+def get_episode_file_base(episode):
+    """
+    Get the base filename used for an episode's files in the Pages repository
+    
+    Args:
+        episode (Episode): Episode
+        
+    Returns:
+        str: Filename without extension
+    """
+    date_str = episode.date.strftime('%Y%m%d')
+    return f"{date_str}_{episode.title.lower().replace(' ', '_')}"
+
+def publish_to_github(episode, github_token, github_username, github_repo, branch="main", remote_url=None):
     """
     Publish podcast to GitHub Pages
     
@@ -17,168 +153,170 @@ def publish_to_github(episode, github_token, github_username, github_repo, branc
         github_username (str): GitHub username
         github_repo (str): GitHub repository name
         branch (str): GitHub branch name
+        remote_url (str): Optional repository URL overriding github.com (e.g. a local bare repository)
         
     Returns:
         tuple: (success, url_or_error)
     """
-    logging.info(f"Publishing episode {episode.id} to GitHub")
+    success, result = publish_episodes_to_github(
+        [episode], github_token, github_username, github_repo, branch, remote_url
+    )
+    if not success:
+        return False, result
+    return True, result[episode.id]
+
+def publish_episodes_to_github(episodes, github_token, github_username, github_repo, branch="main", remote_url=None):
+    """
+    Publish several podcast episodes to GitHub Pages with a single commit and push
     
-    # Check if audio file exists
-    if not os.path.exists(episode.audio_path):
-        error_msg = f"Audio file not found at {episode.audio_path}"
-        logging.error(error_msg)
-        return False, error_msg
+    All audio, scripts and RSS items are written in one working-tree update,
+    so publishing a batch costs one sync, one RSS rewrite and one push.
+    
+    Args:
+        episodes (list): Episodes to publish
+        github_token (str): GitHub access token
+        github_username (str): GitHub username
+        github_repo (str): GitHub repository name
+        branch (str): GitHub branch name
+        remote_url (str): Optional repository URL overriding github.com (e.g. a local bare repository)
+        
+    Returns:
+        tuple: (success, {episode_id: url} or error message)
+    """
+    if not episodes:
+        return False, "No episodes to publish"
+    
+    logger.info(f"Publishing {len(episodes)} episode(s) to GitHub: {[episode.id for episode in episodes]}")
+    
+    # Check that every audio file exists before touching the repository
+    for episode in episodes:
+        if not episode.audio_path or not os.path.exists(episode.audio_path):
+            error_msg = f"Audio file not found at {episode.audio_path} for episode {episode.id}"
+            logger.error(error_msg)
+            return False, error_msg
+    
+    repo_url = remote_url or f"https://{github_token}@github.com/{github_username}/{github_repo}.git"
+    mirror_dir = get_mirror_dir(github_username, github_repo, branch)
+    
+    # A single episode publishes inside its own trace; a batch gets its own
+    # trace and each episode's trace gets a span linking to it
+    episode_trace_ids = [getattr(episode, "trace_id", None) for episode in episodes]
+    span = tracing.start_span(
+        "publish",
+        trace_id=episode_trace_ids[0] if len(episodes) == 1 else tracing.new_trace_id(),
+        attributes={"publish.episode_count": len(episodes), "publish.repo": f"{github_username}/{github_repo}"}
+    )
     
     try:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Clone repository
-            repo_url = f"https://{github_token}@github.com/{github_username}/{github_repo}.git"
-            clone_cmd = ["git", "clone", repo_url, "--depth", "1", "--branch", branch, temp_dir]
-            
-            logging.debug(f"Cloning repository: {github_username}/{github_repo}")
-            process = subprocess.run(clone_cmd, capture_output=True, text=True)
-            
-            if process.returncode != 0:
-                error_msg = f"Failed to clone repository: {process.stderr}"
-                logging.error(error_msg)
-                return False, error_msg
+        with mirror_lock(mirror_dir):
+            logger.debug(f"Syncing mirror of {github_username}/{github_repo}")
+            sync_mirror(mirror_dir, repo_url, branch, secret=github_token)
             
             # Create podcast directory if it doesn't exist
-            podcast_dir = os.path.join(temp_dir, "podcasts")
+            podcast_dir = os.path.join(mirror_dir, "podcasts")
             os.makedirs(podcast_dir, exist_ok=True)
             
-            # Generate clean filename from title
-            date_str = episode.date.strftime('%Y%m%d')
-            file_base = f"{date_str}_{episode.title.lower().replace(' ', '_')}"
-            
-            # Copy audio file
-            audio_filename = f"{file_base}.mp3"
-            audio_dest = os.path.join(podcast_dir, audio_filename)
-            shutil.copy2(episode.audio_path, audio_dest)
-            
-            # Copy script file
-            script_filename = f"{file_base}.txt"
-            script_dest = os.path.join(podcast_dir, script_filename)
-            shutil.copy2(episode.script_path, script_dest)
+            published_urls = {}
+            rss_items = []
             
-            # Update podcast RSS feed XML
-            rss_path = os.path.join(temp_dir, "podcast.xml")
-            
-            # Create RSS file if it doesn't exist
-            if not os.path.exists(rss_path):
-                create_initial_rss_file(rss_path)
+            for episode in episodes:
+                file_base = get_episode_file_base(episode)
+                
+                # Link audio file
+                audio_filename = f"{file_base}.mp3"
+                link_or_copy(episode.audio_path, os.path.join(podcast_dir, audio_filename))
+                
+                # Write the script from the script store
+                script_filename = f"{file_base}.txt"
+                with open(os.path.join(podcast_dir, script_filename), "w", encoding="utf-8") as f:
+                    f.write(episode.script or "")
+                
+                audio_url = f"https://{github_username}.github.io/{github_repo}/podcasts/{audio_filename}"
+                published_urls[episode.id] = audio_url
+                rss_items.append((episode, audio_url))
             
-            # Update RSS file with new episode
-            update_rss_file(
-                rss_path, 
-                episode, 
-                audio_filename, 
-                f"https://{github_username}.github.io/{github_repo}/podcasts/{audio_filename}"
+            # Add all new episodes to the feed in one update
+            update_feed(
+                mirror_dir,
+                [build_feed_item(episode, audio_url) for episode, audio_url in rss_items],
+                f"https://{github_username}.github.io/{github_repo}/"
             )
             
             # Commit and push changes
-            git_commands = [
-                ["git", "config", "user.name", "AI Podcast Generator"],
-                ["git", "config", "user.email", "noreply@example.com"],
-                ["git", "add", "."],
-                ["git", "commit", "-m", f"Add podcast episode: {episode.title}"],
-                ["git", "push", "origin", branch]
-            ]
+            if len(episodes) == 1:
+                commit_message = f"Add podcast episode: {episodes[0].title}"
+            else:
+                commit_message = f"Add {len(episodes)} podcast episodes\n\n" + "\n".join(
+                    f"- {episode.title}" for episode in episodes
+                )
             
-            for cmd in git_commands:
-                logging.debug(f"Running git command: {cmd}")
-                process = subprocess.run(cmd, cwd=temp_dir, capture_output=True, text=True)
-                
-                if process.returncode != 0:
-                    error_msg = f"Git command failed: {process.stderr}"
-                    logging.error(error_msg)
-                    return False, error_msg
+            run_git(["add", "."], cwd=mirror_dir)
+            run_git(["commit", "-m", commit_message], cwd=mirror_dir)
+            run_git(["push", "origin", branch], cwd=mirror_dir, secret=github_token)
             
-            # Return published URL
-            published_url = f"https://{github_username}.github.io/{github_repo}/podcasts/{audio_filename}"
-            logging.info(f"Successfully published episode to {published_url}")
-            return True, published_url
+            logger.info(f"Successfully published {len(episodes)} episode(s) to {github_username}/{github_repo}")
+            return True, published_urls
     
     except Exception as e:
+        span.record_exception(e)
         error_msg = f"Error publishing to GitHub: {str(e)}"
-        logging.error(error_msg)
+        logger.error(error_msg)
         return False, error_msg
+    
+    finally:
+        span.end()
+        if len(episodes) > 1:
+            for episode, trace_id in zip(episodes, episode_trace_ids):
+                if trace_id:
+                    tracing.record_span("publish", span.start_time, span.end_time, trace_id=trace_id,
+                                        attributes={"episode.id": episode.id}, links=[span])
 
-def create_initial_rss_file(rss_path):
+def get_audio_metadata(episode):
     """
-    Create initial podcast RSS feed file
+    Get enclosure size and duration for an episode
+    
+    Uses the values stored on the episode at generation time; episodes created
+    before those were recorded get their MP3 headers scanned once.
     
     Args:
-        rss_path (str): Path to RSS file
+        episode (Episode): Episode
+        
+    Returns:
+        tuple: (size_in_bytes, duration_in_seconds)
     """
-    root = ET.Element("rss", version="2.0")
-    root.set("xmlns:itunes", "http://www.itunes.com/dtds/podcast-1.0.dtd")
-    root.set("xmlns:content", "http://purl.org/rss/1.0/modules/content/")
-    
-    channel = ET.SubElement(root, "channel")
-    
-    # Required RSS elements
-    ET.SubElement(channel, "title").text = "Daily Tech Insights"
-    ET.SubElement(channel, "description").text = "An AI-generated daily tech news podcast covering the latest in technology and startups."
-    ET.SubElement(channel, "link").text = "https://example.com"
-    ET.SubElement(channel, "language").text = "en-us"
-    ET.SubElement(channel, "lastBuildDate").text = datetime.now().strftime("%a, %d %b %Y %H:%M:%S GMT")
-    
-    # iTunes specific elements
-    ET.SubElement(channel, "itunes:author").text = "AI Podcast Generator"
-    ET.SubElement(channel, "itunes:summary").text = "An AI-generated daily tech news podcast covering the latest in technology and startups."
+    if episode.audio_size and episode.audio_duration:
+        return episode.audio_size, episode.audio_duration
     
-    # Write to file
-    tree = ET.ElementTree(root)
-    ET.indent(tree, space="  ", level=0)
-    tree.write(rss_path, encoding="utf-8", xml_declaration=True)
+    audio_info = read_mp3_info(episode.audio_path)
+    if not audio_info:
+        return os.path.getsize(episode.audio_path), 0
     
-    logging.info(f"Created initial RSS file at {rss_path}")
+    episode.audio_duration = audio_info["duration"]
+    episode.audio_bitrate = audio_info["bitrate"]
+    episode.audio_size = audio_info["size"]
+    return audio_info["size"], audio_info["duration"]
 
-def update_rss_file(rss_path, episode, audio_filename, audio_url):
+def build_feed_item(episode, audio_url):
     """
-    Update podcast RSS feed file with new episode
+    Build the compact feed index entry for an episode
     
     Args:
-        rss_path (str): Path to RSS file
         episode (Episode): Episode to add
-        audio_filename (str): Audio filename
         audio_url (str): Audio URL
-    """
-    try:
-        # Parse existing RSS file
-        tree = ET.parse(rss_path)
-        root = tree.getroot()
-        channel = root.find("channel")
-        
-        # Update lastBuildDate
-        lastBuildDate = channel.find("lastBuildDate")
-        if lastBuildDate is not None:
-            lastBuildDate.text = datetime.now().strftime("%a, %d %b %Y %H:%M:%S GMT")
-        
-        # Create new item element
-        item = ET.SubElement(channel, "item")
-        
-        # Add item elements
-        ET.SubElement(item, "title").text = episode.title
-        ET.SubElement(item, "description").text = episode.script[:200] + "..." if len(episode.script) > 200 else episode.script
-        ET.SubElement(item, "pubDate").text = episode.date.strftime("%a, %d %b %Y %H:%M:%S GMT")
-        ET.SubElement(item, "guid", isPermaLink="false").text = audio_url
-        
-        # Add enclosure (audio file)
-        audio_size = os.path.getsize(episode.audio_path)
-        ET.SubElement(item, "enclosure", url=audio_url, length=str(audio_size), type="audio/mpeg")
         
-        # Add iTunes specific elements
-        ET.SubElement(item, "itunes:duration").text = "00:10:00"  # Placeholder duration
-        ET.SubElement(item, "itunes:summary").text = episode.script[:200] + "..." if len(episode.script) > 200 else episode.script
-        
-        # Write updated RSS to file
-        ET.indent(tree, space="  ", level=0)
-        tree.write(rss_path, encoding="utf-8", xml_declaration=True)
-        
-        logging.info(f"Updated RSS file with episode {episode.id}")
+    Returns:
+        dict: Feed item
+    """
+    audio_size, audio_duration = get_audio_metadata(episode)
+    script = episode.script or ""
+    summary = script[:200] + "..." if len(script) > 200 else script
     
-    except Exception as e:
-        logging.error(f"Error updating RSS file: {str(e)}")
-        raise
+    return {
+        "guid": audio_url,
+        "title": episode.title,
+        "summary": summary,
+        "pub_date": episode.date.strftime("%a, %d %b %Y %H:%M:%S GMT"),
+        "url": audio_url,
+        "length": audio_size,
+        "duration": audio_duration,
+    }
@@ -1,11 +1,26 @@
 import os
+import re
+import json
+import time
 import logging
+import threading
+from collections import deque
 import base64
 import requests
 from io import BytesIO
 from openai import OpenAI
 from datetime import datetime
 
+import metrics
+import tracing
+import ratelimit
+import image_variants
+import openai
+from preprocess import prepare_article, get_token_budget
+from ranking import rank_articles
+
+logger = logging.getLogger(__name__)
+
 def get_openai_client():
     """
     Get OpenAI client with API key from environment variables or database
@@ -14,7 +29,7 @@ def get_openai_client():
         OpenAI: OpenAI client
     """
     # First try environment variable
-    openai_api_key = os.environ.get("OPENAI_API_KEY" # Add your key here)
+    openai_api_key = os.environ.get("OPENAI_API_KEY")
     
     # If not found in environment, check database
     if not openai_api_key:
@@ -26,14 +41,261 @@ def get_openai_client():
                 openai_api_key = api_key.value
         
     if not openai_api_key:
-        logging.error("OpenAI API key not found in environment variables or database")
+        logger.error("OpenAI API key not found in environment variables or database")
         return None
         
-    return OpenAI(api_key=openai_api_key)
+    # Retries are done by call_openai so they go through the shared rate limiter
+    return OpenAI(api_key=openai_api_key, max_retries=0)
 
-def generate_podcast_introduction(podcast_title, style_guidance="", host_info="", custom_instructions=None, model="gpt-3.5-turbo"):
+def classify_openai_error(error):
     """
-    Generate podcast introduction
+    Decide whether a failed OpenAI request is worth retrying
+    
+    Args:
+        error (Exception): Exception raised by the OpenAI client
+        
+    Returns:
+        tuple: (retryable, status_code, headers)
+    """
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in ratelimit.RETRYABLE_STATUS, error.status_code, error.response.headers
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True, None, None
+    return False, None, None
+
+class ScriptGenerationError(Exception):
+    """Part of a script could not be generated, and filler text would pass for a real episode"""
+
+def is_article_error(error):
+    """
+    Decide whether a failed summary request was caused by the article itself
+    
+    A 400 (too long for the context, rejected by the content policy) or 422
+    only affects the article that was sent. Key, model and service errors
+    affect every call, so the episode must fail instead.
+    
+    Args:
+        error (Exception): Exception raised by the OpenAI client
+        
+    Returns:
+        bool: True when only this article's summary is lost
+    """
+    return isinstance(error, openai.BadRequestError)
+
+def get_response_text(response, call_type):
+    """
+    Get the text of a chat completion
+    
+    Args:
+        response: Parsed chat completion
+        call_type (str): introduction, conclusion...
+        
+    Returns:
+        str: Generated text
+        
+    Raises:
+        ScriptGenerationError: The completion has no text
+    """
+    content = response.choices[0].message.content if response.choices else None
+    if not content or not content.strip():
+        raise ScriptGenerationError(f"OpenAI returned no text for the {call_type}")
+    return content
+
+def call_openai(client, method, **request):
+    """
+    Make an OpenAI request through the shared rate limiter
+    
+    Waits for a token of the key's bucket, feeds the response's rate limit
+    headers back into it and retries 429s, 5xx and connection errors with
+    jittered exponential backoff.
+    
+    Args:
+        client (OpenAI): OpenAI client
+        method (callable): A with_raw_response method, e.g. client.chat.completions.with_raw_response.create
+        **request: Request parameters
+        
+    Returns:
+        The parsed response
+        
+    Raises:
+        ratelimit.RetriesExhausted: The request kept failing
+    """
+    def attempt():
+        started = time.perf_counter()
+        raw = method(**request)
+        ratelimit.observe_response("openai", client.api_key, raw.status_code, raw.headers)
+        if not request.get("stream"):
+            # A stream returns once its headers arrive, which says nothing about the model's speed
+            record_model_latency(request.get("model"), time.perf_counter() - started)
+        return raw.parse()
+    
+    return ratelimit.call_with_retries("openai", client.api_key, attempt, classify_openai_error)
+
+# USD per million input/output tokens
+MODEL_COSTS = {
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4": (30.00, 60.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+# Typical seconds per call, used until a model has been observed
+MODEL_DEFAULT_LATENCY = {
+    "gpt-3.5-turbo": 2.0,
+    "gpt-4": 8.0,
+    "gpt-4-turbo": 6.0,
+    "gpt-4o": 3.5,
+    "gpt-4o-mini": 2.0,
+}
+
+# Candidate models per tier; "primary" is the podcast's own openai_model
+MODEL_TIERS = {
+    "fast": ["gpt-4o-mini", "gpt-3.5-turbo"],
+    "balanced": ["gpt-4o", "gpt-4-turbo"],
+    "premium": ["gpt-4", "gpt-4-turbo"],
+}
+
+# Tier per call type; the short intro and conclusion do not need the main model.
+# Can be replaced with a JSON object in MODEL_ROUTING and per podcast in Settings.model_routing.
+DEFAULT_ROUTING = {
+    "introduction": "fast",
+    "conclusion": "fast",
+    "summarize_article": "primary",
+    "summarize_batch": "primary",
+}
+
+# Dollar value of one second of latency when weighing cost against speed
+ROUTING_COST_PER_SECOND = float(os.environ.get("ROUTING_COST_PER_SECOND", "0.0005"))
+
+# Recent call latencies per model, in seconds
+LATENCY_WINDOW = 50
+_model_latencies = {}
+_model_latencies_lock = threading.Lock()
+
+def record_model_latency(model, seconds):
+    """
+    Remember how long a successful call to a model took
+    
+    Args:
+        model (str): OpenAI model name
+        seconds (float): Call duration
+    """
+    if not model:
+        return
+    with _model_latencies_lock:
+        _model_latencies.setdefault(model, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+def get_model_latency(model, pct=90):
+    """
+    Get a latency percentile of a model from recent calls
+    
+    Args:
+        model (str): OpenAI model name
+        pct (int): Percentile
+        
+    Returns:
+        tuple: (seconds, number of observations)
+    """
+    with _model_latencies_lock:
+        samples = sorted(_model_latencies.get(model, ()))
+    if not samples:
+        return MODEL_DEFAULT_LATENCY.get(model, 5.0), 0
+    index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+    return samples[index], len(samples)
+
+def estimate_cost(model, input_tokens, output_tokens):
+    """
+    Estimate the price of a call
+    
+    Args:
+        model (str): OpenAI model name
+        input_tokens (int): Prompt tokens
+        output_tokens (int): Completion tokens
+        
+    Returns:
+        float: USD, or None for models without a known price
+    """
+    if model not in MODEL_COSTS:
+        return None
+    input_price, output_price = MODEL_COSTS[model]
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+def get_routing(overrides=None):
+    """
+    Combine the default routing, MODEL_ROUTING and a podcast's overrides
+    
+    Args:
+        overrides (str or dict): Podcast overrides, e.g. '{"introduction": "primary"}'
+        
+    Returns:
+        dict: Call type to tier, model name or "primary"
+    """
+    routing = dict(DEFAULT_ROUTING)
+    for source in (os.environ.get("MODEL_ROUTING"), overrides):
+        if not source:
+            continue
+        try:
+            values = json.loads(source) if isinstance(source, str) else source
+            routing.update({key: value for key, value in values.items() if value})
+        except (ValueError, AttributeError):
+            logger.warning(f"Ignoring invalid model routing: {source}")
+    return routing
+
+def route_model(call_type, primary_model, routing=None, input_tokens=500, output_tokens=200):
+    """
+    Pick the model for one kind of call
+    
+    A tier's candidates are ranked by estimated cost plus observed p90
+    latency valued at ROUTING_COST_PER_SECOND; the cheapest-and-fastest wins.
+    
+    Args:
+        call_type (str): introduction, summarize_article, summarize_batch or conclusion
+        primary_model (str): The podcast's configured model
+        routing (dict): Result of get_routing()
+        input_tokens (int): Expected prompt tokens
+        output_tokens (int): Expected completion tokens
+        
+    Returns:
+        dict: Decision with model, tier, reason, estimated cost and latency
+    """
+    primary_model = primary_model or "gpt-3.5-turbo"
+    choice = (routing or get_routing()).get(call_type, "primary")
+    
+    if choice == "primary":
+        candidates, reason = [primary_model], "primary"
+    elif choice in MODEL_TIERS:
+        candidates, reason = MODEL_TIERS[choice], "tier"
+    else:
+        candidates, reason = [choice], "override"
+    
+    scored = []
+    for model in candidates:
+        latency, observations = get_model_latency(model)
+        cost = estimate_cost(model, input_tokens, output_tokens)
+        score = (cost or 0) + latency * ROUTING_COST_PER_SECOND
+        scored.append((score, model, cost, latency, observations))
+    score, model, cost, latency, observations = min(scored)
+    
+    decision = {
+        "call_type": call_type,
+        "model": model,
+        "tier": choice,
+        "reason": reason,
+        "estimated_cost": cost,
+        "p90_latency": round(latency, 3),
+        "latency_samples": observations,
+    }
+    metrics.MODEL_ROUTING.labels(call_type, model, reason).inc()
+    span = tracing.current_span()
+    if span:
+        span.set_attribute(f"routing.{call_type}", model)
+    logger.info(f"Routed {call_type} to {model} ({reason} {choice}, est. ${cost or 0:.5f}, p90 {latency:.2f}s over {observations} calls)")
+    return decision
+
+def build_introduction_request(podcast_title, style_guidance="", host_info="", custom_instructions=None, model="gpt-3.5-turbo"):
+    """
+    Build the chat request for a podcast introduction
     
     Args:
         podcast_title (str): Podcast title
@@ -41,14 +303,10 @@ def generate_podcast_introduction(podcast_title, style_guidance="", host_info=""
         host_info (str): Optional host information
         custom_instructions (str): Optional custom AI instructions
         model (str): OpenAI model to use
-        
+    
     Returns:
-        str: Generated introduction
+        dict: Request parameters for chat.completions.create
     """
-    client = get_openai_client()
-    if not client:
-        return "Welcome to today's podcast. Let's dive into the latest tech news."
-    
     today = datetime.now().strftime("%B %d, %Y")
     
     # Default prompt
@@ -73,54 +331,100 @@ def generate_podcast_introduction(podcast_title, style_guidance="", host_info=""
     if custom_instructions:
         system_message = custom_instructions
     
+    return {
+        "model": model if model else "gpt-3.5-turbo",
+        "messages": [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": 250,
+        "temperature": 0.7,
+    }
+
+def generate_podcast_introduction(podcast_title, style_guidance="", host_info="", custom_instructions=None, model="gpt-3.5-turbo"):
+    """
+    Generate podcast introduction
+    
+    Args:
+        podcast_title (str): Podcast title
+        style_guidance (str): Optional style guidance based on podcast description
+        host_info (str): Optional host information
+        custom_instructions (str): Optional custom AI instructions
+        model (str): OpenAI model to use
+    
+    Returns:
+        str: Generated introduction
+        
+    Raises:
+        ScriptGenerationError: No API key is configured or the model returned no text
+        openai.OpenAIError: The request failed and retrying would not help
+        ratelimit.RetriesExhausted: The request kept failing
+    """
+    client = get_openai_client()
+    if not client:
+        raise ScriptGenerationError("OpenAI API key not configured")
+    
+    request = build_introduction_request(podcast_title, style_guidance, host_info, custom_instructions, model)
+    
     try:
         # Use the specified model or fall back to gpt-3.5-turbo if invalid
-        ai_model = model if model else "gpt-3.5-turbo"
-        logging.info(f"Using OpenAI model: {ai_model} for introduction generation")
+        ai_model = request["model"]
+        logger.info(f"Using OpenAI model: {ai_model} for introduction generation")
         
-        response = client.chat.completions.create(
-            model=ai_model,
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=250,
-            temperature=0.7
-        )
+        with metrics.track_stage("introduction"), tracing.start_span("llm.introduction", attributes={"gen_ai.request.model": ai_model, "gen_ai.request.max_tokens": request["max_tokens"]}):
+            response = call_openai(client, client.chat.completions.with_raw_response.create, **request)
+        metrics.record_tokens(ai_model, "introduction", getattr(response, "usage", None))
         
-        return response.choices[0].message.content
+        return get_response_text(response, "introduction")
     except Exception as e:
-        logging.error(f"Error generating podcast introduction: {str(e)}")
-        return f"Welcome to {podcast_title} for {today}. Let's dive into the latest tech news."
+        # A script with canned filler must not look like a successful one
+        logger.error(f"Error generating podcast introduction: {str(e)}")
+        raise
 
-def summarize_article(article, podcast_duration=10, model="gpt-3.5-turbo"):
+# Models that accept response_format={"type": "json_object"}
+JSON_MODE_MODELS = {"gpt-3.5-turbo", "gpt-4-turbo", "gpt-4o", "gpt-4o-mini"}
+
+# Most articles packed into one batched summary request
+BATCH_SUMMARY_SIZE = 5
+
+SUMMARY_SYSTEM_MESSAGE = "You are a technology podcast host summarizing news articles. Your audience values detailed analysis and comprehensive coverage."
+
+def get_summary_word_count(podcast_duration):
     """
-    Summarize article using OpenAI
+    Get the target summary length for a podcast duration
     
     Args:
-        article (dict): Article dictionary
         podcast_duration (int): Target podcast duration in minutes
-        model (str): OpenAI model to use
         
     Returns:
-        str: Summarized article
+        str: Word count range, e.g. "80-120"
     """
-    client = get_openai_client()
-    if not client:
-        return f"An article titled '{article['title']}' was published by {article['source']}."
+    # Increase word count to create more detailed summaries
+    if podcast_duration < 5:
+        return "80-120"  # More detailed for short podcasts
+    elif podcast_duration <= 15:
+        return "150-200"  # Significantly more detailed for medium podcasts
+    else:
+        return "250-350"  # Very detailed for longer podcasts
+
+def build_summary_request(article, podcast_duration=10, model="gpt-3.5-turbo"):
+    """
+    Build the chat request that summarizes one prepared article
+    
+    Args:
+        article (dict): Article dictionary, already passed through prepare_article
+        podcast_duration (int): Target podcast duration in minutes
+        model (str): OpenAI model to use
     
+    Returns:
+        dict: Request parameters for chat.completions.create
+    """
     title = article.get('title', 'Untitled article')
     source = article.get('source', 'Unknown source')
     content = article.get('summary', '')
     
     # Adjust summary length based on podcast duration
-    # Increase word count to create more detailed summaries
-    if podcast_duration < 5:
-        word_count = "80-120"  # More detailed for short podcasts
-    elif podcast_duration <= 15:
-        word_count = "150-200"  # Significantly more detailed for medium podcasts
-    else:
-        word_count = "250-350"  # Very detailed for longer podcasts
+    word_count = get_summary_word_count(podcast_duration)
     
     # Calculate max_tokens based on word count to ensure we get full summaries
     max_tokens = int(word_count.split('-')[1]) * 2  # Rough estimate: 1 word ≈ 1.5-2 tokens
@@ -135,26 +439,458 @@ def summarize_article(article, podcast_duration=10, model="gpt-3.5-turbo"):
         f"why this news matters to listeners. Make it informative and conversational."
     )
     
+    return {
+        "model": model if model else "gpt-3.5-turbo",
+        "messages": [
+            {"role": "system", "content": SUMMARY_SYSTEM_MESSAGE},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": max_tokens,  # Increased token limit for longer summaries
+        "temperature": 0.7,
+    }
+
+def summarize_article(article, podcast_duration=10, model="gpt-3.5-turbo"):
+    """
+    Summarize article using OpenAI
+    
+    Args:
+        article (dict): Article dictionary
+        podcast_duration (int): Target podcast duration in minutes
+        model (str): OpenAI model to use
+    
+    Returns:
+        str: Summarized article, or a one-line mention of it when the
+            request was rejected because of the article
+        
+    Raises:
+        ScriptGenerationError: No API key is configured
+        openai.OpenAIError: The request failed for a reason other than the article
+        ratelimit.RetriesExhausted: The request kept failing
+    """
+    client = get_openai_client()
+    if not client:
+        raise ScriptGenerationError("OpenAI API key not configured")
+    
+    # Strip markup and boilerplate and fit the text into the model's token budget
+    if 'tokens_reduced' not in article:
+        article = prepare_article(article, model or "gpt-3.5-turbo")
+    
+    title = article.get('title', 'Untitled article')
+    source = article.get('source', 'Unknown source')
+    request = build_summary_request(article, podcast_duration, model)
+    
     try:
         # Use the specified model or fall back to gpt-3.5-turbo if invalid
-        ai_model = model if model else "gpt-3.5-turbo"
-        logging.info(f"Using OpenAI model: {ai_model} for article summarization")
+        ai_model = request["model"]
+        logger.info(f"Using OpenAI model: {ai_model} for article summarization")
         
-        response = client.chat.completions.create(
-            model=ai_model,
-            messages=[
-                {"role": "system", "content": "You are a technology podcast host summarizing news articles. Your audience values detailed analysis and comprehensive coverage."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=max_tokens,  # Increased token limit for longer summaries
-            temperature=0.7
-        )
+        with metrics.track_stage("summarize_article"), tracing.start_span("llm.summarize_article", attributes={
+            "gen_ai.request.model": ai_model,
+            "gen_ai.request.max_tokens": request["max_tokens"],
+            "article.tokens_original": article.get('tokens_original'),
+            "article.tokens_reduced": article.get('tokens_reduced'),
+        }):
+            response = call_openai(client, client.chat.completions.with_raw_response.create, **request)
+        metrics.record_tokens(ai_model, "summarize_article", getattr(response, "usage", None))
         
-        return response.choices[0].message.content
+        return get_response_text(response, "summary")
     except Exception as e:
-        logging.error(f"Error summarizing article: {str(e)}")
+        if not is_article_error(e) and not isinstance(e, ScriptGenerationError):
+            logger.error(f"Error summarizing article: {str(e)}")
+            raise
+        # Only this article is lost; the episode mentions it in one line
+        logger.warning(f"Degraded summary of '{title}' from {source}, the model gave none: {str(e)}")
+        metrics.record_retry("summarize_article", "degraded")
         return f"From {source}: An article titled '{title}' was published recently."
 
+# End of a sentence: terminal punctuation, closing quotes or brackets, then whitespace
+SENTENCE_END = re.compile(r"[.!?]+[\"'\u201d\u2019)\]]*\s+")
+
+def split_sentences(text):
+    """
+    Split text into sentences, keeping each sentence's trailing whitespace
+    
+    Args:
+        text (str): Text
+    
+    Returns:
+        list: Sentences; joined they give back the text
+    """
+    return list(iter_sentences([text or ""]))
+
+def iter_sentences(deltas):
+    """
+    Turn a stream of text fragments into a stream of complete sentences
+    
+    A sentence is only handed out once the whitespace after its punctuation
+    has arrived, so "3." followed by "5 billion" is not split. Whatever is
+    left when the stream ends is handed out as the last sentence.
+    
+    Args:
+        deltas (iterable): Text fragments as they arrive
+    
+    Yields:
+        str: Sentences with their trailing whitespace
+    """
+    buffer = ""
+    for delta in deltas:
+        if not delta:
+            continue
+        buffer += delta
+        consumed = 0
+        for match in SENTENCE_END.finditer(buffer):
+            yield buffer[consumed:match.end()]
+            consumed = match.end()
+        buffer = buffer[consumed:]
+    if buffer:
+        yield buffer
+
+def stream_chat_sentences(client, call_type, request, attributes=None):
+    """
+    Stream a chat completion and yield its sentences as they are completed
+    
+    The stream is opened through call_openai, so the rate limiter and its
+    retries apply until the first byte; a stream that breaks later is not
+    retried.
+    
+    Args:
+        client (OpenAI): OpenAI client
+        call_type (str): introduction, summarize_article...
+        request (dict): Request parameters for chat.completions.create
+        attributes (dict): Extra span attributes
+    
+    Yields:
+        str: Sentences with their trailing whitespace
+    """
+    model = request["model"]
+    request = dict(request, stream=True, stream_options={"include_usage": True})
+    started = time.perf_counter()
+    started_at = time.time()
+    first_sentence = None
+    error = None
+    
+    def deltas(stream):
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                metrics.record_tokens(model, call_type, chunk.usage)
+            if chunk.choices:
+                yield chunk.choices[0].delta.content or ""
+    
+    try:
+        stream = call_openai(client, client.chat.completions.with_raw_response.create, **request)
+        for sentence in iter_sentences(deltas(stream)):
+            if first_sentence is None:
+                first_sentence = time.perf_counter() - started
+                metrics.TIME_TO_FIRST_OUTPUT.labels(f"llm_{call_type}").observe(first_sentence)
+            yield sentence
+        # The whole completion is a fair latency sample for the router
+        record_model_latency(model, time.perf_counter() - started)
+    except Exception as e:
+        error = e
+        metrics.record_error(call_type, e)
+        raise
+    finally:
+        metrics.observe_stage(call_type, started, "error" if error else "success")
+        span_attributes = {
+            "gen_ai.request.model": model,
+            "gen_ai.request.max_tokens": request.get("max_tokens"),
+            "gen_ai.request.stream": True,
+            "llm.first_sentence_seconds": first_sentence,
+        }
+        span_attributes.update(attributes or {})
+        tracing.record_span(f"llm.{call_type}", started_at, time.time(), attributes=span_attributes, error=error)
+
+# Asks the model for the rest of a streamed answer that broke off
+CONTINUATION_PROMPT = (
+    "Your answer was cut off after the text above. Continue it right after its last sentence, "
+    "without repeating anything and without mentioning the interruption."
+)
+
+def complete_broken_stream(client, call_type, request, written):
+    """
+    Write the rest of a streamed answer that broke off, without streaming
+    
+    Args:
+        client (OpenAI): OpenAI client
+        call_type (str): introduction, summarize_article...
+        request (dict): Request parameters of the broken stream
+        written (str): Complete sentences already handed out
+    
+    Returns:
+        str: The rest of the answer, empty when the model has nothing to add
+    """
+    request = dict(request, messages=list(request["messages"]) + [
+        {"role": "assistant", "content": written.strip()},
+        {"role": "user", "content": CONTINUATION_PROMPT},
+    ])
+    with metrics.track_stage(call_type), tracing.start_span(f"llm.{call_type}", attributes={
+        "gen_ai.request.model": request["model"],
+        "gen_ai.request.max_tokens": request.get("max_tokens"),
+        "llm.continuation": True,
+    }):
+        response = call_openai(client, client.chat.completions.with_raw_response.create, **request)
+    metrics.record_tokens(request["model"], call_type, getattr(response, "usage", None))
+    return (response.choices[0].message.content or "") if response.choices else ""
+
+def stream_with_fallback(client, call_type, request, fallback, attributes=None):
+    """
+    Stream sentences, falling back to a regular request if streaming fails
+    
+    When the stream cannot be opened, fallback() makes the non-streaming
+    request and its text is split into sentences instead. When a stream
+    breaks after sentences were handed out, those cannot be taken back, so
+    a regular request asks the model to continue after them. If that fails
+    too the error is raised rather than leaving the text cut off.
+    
+    Args:
+        client (OpenAI): OpenAI client
+        call_type (str): introduction, summarize_article...
+        request (dict): Request parameters for chat.completions.create
+        fallback (callable): Makes the non-streaming request and returns its text
+        attributes (dict): Extra span attributes
+    
+    Yields:
+        str: Sentences with their trailing whitespace
+    """
+    handed_out = []
+    try:
+        for sentence in stream_chat_sentences(client, call_type, request, attributes):
+            handed_out.append(sentence)
+            yield sentence
+    except ratelimit.RetriesExhausted:
+        # A non-streaming request would be rate limited just the same
+        raise
+    except Exception as e:
+        if handed_out:
+            logger.warning(f"Streaming {call_type} broke after {len(handed_out)} sentences, requesting the rest: {str(e)}")
+            metrics.record_retry(call_type, "stream_continuation")
+            yield from split_sentences(complete_broken_stream(client, call_type, request, "".join(handed_out)))
+            return
+        logger.warning(f"Streaming {call_type} failed, using a regular request: {str(e)}")
+        metrics.record_retry(call_type, "stream_fallback")
+        yield from split_sentences(fallback())
+
+def stream_podcast_introduction(podcast_title, style_guidance="", host_info="", custom_instructions=None, model="gpt-3.5-turbo"):
+    """
+    Generate the podcast introduction, yielding sentences as they are written
+    
+    Args:
+        podcast_title (str): Podcast title
+        style_guidance (str): Optional style guidance based on podcast description
+        host_info (str): Optional host information
+        custom_instructions (str): Optional custom AI instructions
+        model (str): OpenAI model to use
+    
+    Yields:
+        str: Sentences of the introduction
+    """
+    def fallback():
+        return generate_podcast_introduction(podcast_title, style_guidance, host_info, custom_instructions, model)
+    
+    client = get_openai_client()
+    if not client:
+        yield from split_sentences(fallback())
+        return
+    
+    request = build_introduction_request(podcast_title, style_guidance, host_info, custom_instructions, model)
+    logger.info(f"Streaming introduction from OpenAI model: {request['model']}")
+    yield from stream_with_fallback(client, "introduction", request, fallback)
+
+def stream_summarize_article(article, podcast_duration=10, model="gpt-3.5-turbo"):
+    """
+    Summarize an article, yielding sentences as they are written
+    
+    Args:
+        article (dict): Article dictionary
+        podcast_duration (int): Target podcast duration in minutes
+        model (str): OpenAI model to use
+    
+    Yields:
+        str: Sentences of the summary
+    """
+    if 'tokens_reduced' not in article:
+        article = prepare_article(article, model or "gpt-3.5-turbo")
+    
+    def fallback():
+        return summarize_article(article, podcast_duration, model)
+    
+    client = get_openai_client()
+    if not client:
+        yield from split_sentences(fallback())
+        return
+    
+    request = build_summary_request(article, podcast_duration, model)
+    logger.info(f"Streaming summary from OpenAI model: {request['model']}")
+    yield from stream_with_fallback(client, "summarize_article", request, fallback, attributes={
+        "article.tokens_original": article.get('tokens_original'),
+        "article.tokens_reduced": article.get('tokens_reduced'),
+    })
+
+def pack_summary_batches(articles, model):
+    """
+    Split prepared articles into batches that fit one summary request
+    
+    Args:
+        articles (list): Prepared article dictionaries
+        model (str): OpenAI model to use
+        
+    Returns:
+        list: Lists of (index, article) tuples
+    """
+    # Two articles' worth of budget keeps a batch well inside the context window
+    token_limit = get_token_budget(model) * 2
+    batches = []
+    current = []
+    current_tokens = 0
+    
+    for index, article in enumerate(articles):
+        tokens = article.get('tokens_reduced', 0)
+        if current and (len(current) >= BATCH_SUMMARY_SIZE or current_tokens + tokens > token_limit):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append((index, article))
+        current_tokens += tokens
+    
+    if current:
+        batches.append(current)
+    return batches
+
+def parse_batch_summaries(content, article_ids, min_words):
+    """
+    Validate a batched summary response and split it per article
+    
+    Args:
+        content (str): Model output, expected {"summaries": {"a1": "...", ...}}
+        article_ids (list): IDs of the articles that were sent
+        min_words (int): Shortest acceptable summary in words
+        
+    Returns:
+        dict: Article ID to summary, only for summaries that passed validation
+    """
+    text = (content or "").strip()
+    # Models without JSON mode sometimes wrap the object in a code fence
+    if text.startswith("```"):
+        text = text.strip("`")
+        if text.startswith("json"):
+            text = text[4:]
+    
+    try:
+        data = json.loads(text)
+    except ValueError:
+        logger.warning("Batched summary response is not valid JSON")
+        return {}
+    
+    summaries = data.get("summaries", data) if isinstance(data, dict) else None
+    if not isinstance(summaries, dict):
+        logger.warning("Batched summary response has no summaries object")
+        return {}
+    
+    valid = {}
+    for article_id in article_ids:
+        summary = summaries.get(article_id)
+        if isinstance(summary, str) and len(summary.split()) >= min_words:
+            valid[article_id] = summary.strip()
+        else:
+            logger.warning(f"Batched summary for {article_id} is missing or too short")
+    return valid
+
+def summarize_articles_batch(articles, podcast_duration=10, model="gpt-3.5-turbo"):
+    """
+    Summarize several articles with one request per batch
+    
+    The articles are sent together and the model answers with a JSON object
+    keyed by article. Summaries that are missing or fail validation are
+    generated with individual summarize_article calls instead.
+    
+    Args:
+        articles (list): Article dictionaries
+        podcast_duration (int): Target podcast duration in minutes
+        model (str): OpenAI model to use
+        
+    Returns:
+        list: Summaries in the order of the articles
+        
+    Raises:
+        ScriptGenerationError: No API key is configured
+        openai.OpenAIError: A request failed and retrying would not help
+        ratelimit.RetriesExhausted: A request kept failing
+    """
+    ai_model = model if model else "gpt-3.5-turbo"
+    articles = [article if 'tokens_reduced' in article else prepare_article(article, ai_model) for article in articles]
+    summaries = [None] * len(articles)
+    
+    client = get_openai_client()
+    if not client:
+        raise ScriptGenerationError("OpenAI API key not configured")
+    word_count = get_summary_word_count(podcast_duration)
+    min_words, max_words = (int(part) for part in word_count.split('-'))
+    
+    for batch in pack_summary_batches(articles, ai_model):
+        article_ids = [f"a{index + 1}" for index, _ in batch]
+        
+        sections = []
+        for article_id, (_, article) in zip(article_ids, batch):
+            sections.append(
+                f"### Article {article_id}\n"
+                f"Title: {article.get('title', 'Untitled article')}\n"
+                f"Source: {article.get('source', 'Unknown source')}\n\n"
+                f"{article.get('summary', '')}"
+            )
+        
+        prompt = (
+            f"Summarize each of the following {len(batch)} articles for a tech podcast, highlighting key points, insights, and implications.\n\n"
+            + "\n\n".join(sections) +
+            f"\n\nFor each article write a comprehensive yet engaging summary ({word_count} words) that would sound natural when read aloud in a podcast. "
+            f"Start each summary with 'From <source>' and then dive into the content. Include specific details, quotes if relevant, and explain "
+            f"why this news matters to listeners. Make it informative and conversational.\n\n"
+            f"Respond only with a JSON object of the form {{\"summaries\": {{\"<article id>\": \"<summary>\"}}}} "
+            f"with one entry for each of these article ids: {', '.join(article_ids)}."
+        )
+        
+        request = {
+            "model": ai_model,
+            "messages": [
+                {"role": "system", "content": SUMMARY_SYSTEM_MESSAGE},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": max_words * 2 * len(batch) + 50 * len(batch),
+            "temperature": 0.7,
+        }
+        if ai_model in JSON_MODE_MODELS:
+            request["response_format"] = {"type": "json_object"}
+        
+        try:
+            logger.info(f"Summarizing {len(batch)} articles in one request with {ai_model}")
+            with metrics.track_stage("summarize_batch"), tracing.start_span("llm.summarize_batch", attributes={
+                "gen_ai.request.model": ai_model,
+                "gen_ai.request.max_tokens": request["max_tokens"],
+                "batch.size": len(batch),
+            }):
+                response = call_openai(client, client.chat.completions.with_raw_response.create, **request)
+            metrics.record_tokens(ai_model, "summarize_batch", getattr(response, "usage", None))
+            # Accept slightly short summaries; anything under half the target is a failed answer
+            valid = parse_batch_summaries(response.choices[0].message.content, article_ids, min_words // 2)
+        except Exception as e:
+            # Falling back to one request per article only helps when the batch itself was rejected
+            if not is_article_error(e):
+                logger.error(f"Error summarizing article batch: {str(e)}")
+                raise
+            logger.warning(f"Batched summary request was rejected, summarizing its articles one by one: {str(e)}")
+            valid = {}
+        
+        for article_id, (index, _) in zip(article_ids, batch):
+            if article_id in valid:
+                summaries[index] = valid[article_id]
+    
+    # Anything the batch did not deliver is summarized on its own
+    for index, article in enumerate(articles):
+        if summaries[index] is None:
+            metrics.record_retry("summarize_batch", "individual_fallback")
+            summaries[index] = summarize_article(article, podcast_duration, ai_model)
+    
+    return summaries
+
 def generate_transition():
     """
     Generate transition between articles
@@ -187,10 +923,15 @@ def generate_conclusion(model="gpt-3.5-turbo"):
         
     Returns:
         str: Generated conclusion
+        
+    Raises:
+        ScriptGenerationError: No API key is configured or the model returned no text
+        openai.OpenAIError: The request failed and retrying would not help
+        ratelimit.RetriesExhausted: The request kept failing
     """
     client = get_openai_client()
     if not client:
-        return "That's all for today's episode. Thanks for listening, and we'll be back tomorrow with more tech news!"
+        raise ScriptGenerationError("OpenAI API key not configured")
     
     prompt = (
         "Write a brief, friendly conclusion for a daily tech news podcast episode. "
@@ -201,22 +942,26 @@ def generate_conclusion(model="gpt-3.5-turbo"):
     try:
         # Use the specified model or fall back to gpt-3.5-turbo if invalid
         ai_model = model if model else "gpt-3.5-turbo"
-        logging.info(f"Using OpenAI model: {ai_model} for conclusion generation")
+        logger.info(f"Using OpenAI model: {ai_model} for conclusion generation")
         
-        response = client.chat.completions.create(
-            model=ai_model,
-            messages=[
-                {"role": "system", "content": "You are a professional podcast host concluding a technology news episode."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=150,
-            temperature=0.7
-        )
+        with metrics.track_stage("conclusion"), tracing.start_span("llm.conclusion", attributes={"gen_ai.request.model": ai_model, "gen_ai.request.max_tokens": 150}):
+            response = call_openai(
+                client,
+                client.chat.completions.with_raw_response.create,
+                model=ai_model,
+                messages=[
+                    {"role": "system", "content": "You are a professional podcast host concluding a technology news episode."},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=150,
+                temperature=0.7
+            )
+        metrics.record_tokens(ai_model, "conclusion", getattr(response, "usage", None))
         
-        return response.choices[0].message.content
+        return get_response_text(response, "conclusion")
     except Exception as e:
-        logging.error(f"Error generating podcast conclusion: {str(e)}")
-        return "That's all for today's episode. Thanks for listening, and we'll be back tomorrow with more tech news!"
+        logger.error(f"Error generating podcast conclusion: {str(e)}")
+        raise
 
 def generate_podcast_artwork(podcast_title, podcast_description=None, podcast_category="Technology", size="1024x1024"):
     """
@@ -264,7 +1009,7 @@ def generate_podcast_artwork(podcast_title, podcast_description=None, podcast_ca
     prompt += "Include the title prominently. Use a modern color palette. Make it visually appealing and professional. No text other than the title."
     
     try:
-        logging.info(f"Generating podcast artwork for '{podcast_title}'")
+        logger.info(f"Generating podcast artwork for '{podcast_title}'")
         
         # Generate image with DALL-E
         # Handle size parameter to make it compatible with DALL-E requirements
@@ -272,7 +1017,9 @@ def generate_podcast_artwork(podcast_title, podcast_description=None, podcast_ca
         if size not in valid_sizes:
             size = "1024x1024"  # Default to square format if invalid
             
-        response = client.images.generate(
+        response = call_openai(
+            client,
+            client.images.with_raw_response.generate,
             model="dall-e-3",
             prompt=prompt,
             size=size,
@@ -311,7 +1058,7 @@ def generate_podcast_artwork(podcast_title, podcast_description=None, podcast_ca
         filepath = os.path.join('static', relative_path)
         
         # Log what we're doing
-        logging.warning(f"COVER ART DEBUG - Saving podcast cover to: {filepath}")
+        logger.warning(f"COVER ART DEBUG - Saving podcast cover to: {filepath}")
         
         try:
             with open(filepath, 'wb') as f:
@@ -320,45 +1067,36 @@ def generate_podcast_artwork(podcast_title, podcast_description=None, podcast_ca
             # Verify the file was created
             if os.path.exists(filepath):
                 file_size = os.path.getsize(filepath)
-                logging.warning(f"COVER ART DEBUG - Cover art file created successfully at: {filepath} (size: {file_size} bytes)")
+                logger.warning(f"COVER ART DEBUG - Cover art file created successfully at: {filepath} (size: {file_size} bytes)")
             else:
-                logging.warning(f"COVER ART DEBUG - ERROR: File not created at {filepath} despite no exceptions")
+                logger.warning(f"COVER ART DEBUG - ERROR: File not created at {filepath} despite no exceptions")
                 
             # Return the path that should be saved in the database (relative to static/)
             db_path = relative_path
-            logging.warning(f"COVER ART DEBUG - Path to save in DB: {db_path}")
+            image_variants.schedule_variants(db_path, directory_art=True)
+            logger.warning(f"COVER ART DEBUG - Path to save in DB: {db_path}")
         except Exception as inner_e:
-            logging.error(f"COVER ART DEBUG - ERROR writing cover art file: {str(inner_e)}")
+            logger.error(f"COVER ART DEBUG - ERROR writing cover art file: {str(inner_e)}")
             raise inner_e  # Re-raise to be caught by outer exception handler
         
         return True, db_path
         
     except Exception as e:
-        logging.error(f"Error generating podcast artwork: {str(e)}")
+        logger.error(f"Error generating podcast artwork: {str(e)}")
         return False, f"Error generating podcast artwork: {str(e)}"
 
-def generate_podcast_script(articles, podcast_title="Daily Tech Insights", podcast_description=None, podcast_author=None, host_name=None, ai_instructions=None, podcast_duration=10, openai_model="gpt-3.5-turbo"):
+def get_script_guidance(podcast_description=None, podcast_author=None, host_name=None):
     """
-    Generate full podcast script
+    Build the style guidance and host lines added to the introduction prompt
     
     Args:
-        articles (list): List of article dictionaries
-        podcast_title (str): Podcast title
         podcast_description (str): Podcast description to use as style guidance
-        podcast_author (str): Podcast author for metadata
-        host_name (str): Name of the podcast host to mention in the script
-        ai_instructions (str): Custom AI instructions
-        podcast_duration (int): Target podcast duration in minutes
-        openai_model (str): OpenAI model to use for generation
-        
+        podcast_author (str): Podcast author, used when there is no host name
+        host_name (str): Name of the podcast host
+    
     Returns:
-        str: Generated podcast script
+        tuple: (style_guidance, host_info)
     """
-    logging.info(f"Generating podcast script for {podcast_title} with {len(articles)} articles using model {openai_model}")
-    
-    script_parts = []
-    
-    # Introduction with custom guidance if available
     style_guidance = ""
     if podcast_description:
         style_guidance = f"\nPodcast description: {podcast_description}"
@@ -368,11 +1106,35 @@ def generate_podcast_script(articles, podcast_title="Daily Tech Insights", podca
         host_info = f"\nHost: {host_name}"
     elif podcast_author:
         host_info = f"\nHost: {podcast_author}"
-        
-    intro = generate_podcast_introduction(podcast_title, style_guidance, host_info, ai_instructions, openai_model)
-    script_parts.append(intro)
-    script_parts.append("\n\n")
     
+    return style_guidance, host_info
+
+def get_ranking_query(podcast_description=None, ai_instructions=None):
+    """
+    Get the text articles are ranked against
+    
+    Args:
+        podcast_description (str): Podcast description
+        ai_instructions (str): Custom AI instructions
+    
+    Returns:
+        str: Query text
+    """
+    return " ".join(part for part in (podcast_description, ai_instructions) if part)
+
+def select_script_articles(articles, podcast_duration=10, openai_model="gpt-3.5-turbo", query_text=""):
+    """
+    Pick the articles an episode covers and prepare them for summarizing
+    
+    Args:
+        articles (list): List of article dictionaries
+        podcast_duration (int): Target podcast duration in minutes
+        openai_model (str): OpenAI model the articles are sent to
+        query_text (str): What the podcast is about, used to rank the articles
+    
+    Returns:
+        list: Prepared articles
+    """
     # Calculate appropriate number of articles based on podcast duration
     # Use more articles for longer podcasts while ensuring each gets sufficient coverage
     if podcast_duration < 5:
@@ -381,15 +1143,76 @@ def generate_podcast_script(articles, podcast_title="Daily Tech Insights", podca
         max_articles = min(10, len(articles))  # 10 articles for medium podcasts
     else:
         max_articles = min(15, len(articles))  # 15 articles for longer podcasts
-        
+    
     # Always include at least 5 articles if available, regardless of duration
     max_articles = max(min(5, len(articles)), max_articles)
     
-    logging.info(f"Using {max_articles} articles for a {podcast_duration} minute podcast")
+    logger.info(f"Using {max_articles} articles for a {podcast_duration} minute podcast")
+    
+    # Relevance, coverage by several sources and diversity decide, not just publish date
+    chosen = rank_articles(articles, query_text, max_articles)
+    
+    # Clean and truncate the selected articles before any of them is sent
+    selected = [prepare_article(article, openai_model or "gpt-3.5-turbo") for article in chosen]
+    tokens_original = sum(article['tokens_original'] for article in selected)
+    tokens_reduced = sum(article['tokens_reduced'] for article in selected)
+    logger.info(f"Article input reduced from {tokens_original} to {tokens_reduced} tokens")
+    return selected
+
+def generate_podcast_script(articles, podcast_title="Daily Tech Insights", podcast_description=None, podcast_author=None, host_name=None, ai_instructions=None, podcast_duration=10, openai_model="gpt-3.5-turbo", model_routing=None):
+    """
+    Generate full podcast script
+    
+    Args:
+        articles (list): List of article dictionaries
+        podcast_title (str): Podcast title
+        podcast_description (str): Podcast description to use as style guidance
+        podcast_author (str): Podcast author for metadata
+        host_name (str): Name of the podcast host to mention in the script
+        ai_instructions (str): Custom AI instructions
+        podcast_duration (int): Target podcast duration in minutes
+        openai_model (str): OpenAI model to use for generation
+        model_routing (str): Optional per-podcast routing overrides (JSON object of call type to tier or model)
+    
+    Returns:
+        str: Generated podcast script
+    """
+    logger.info(f"Generating podcast script for {podcast_title} with {len(articles)} articles using model {openai_model}")
+    
+    script_parts = []
+    
+    # Introduction with custom guidance if available
+    style_guidance, host_info = get_script_guidance(podcast_description, podcast_author, host_name)
+    
+    # Each call type gets its own model; decisions go to the log, metrics and trace
+    routing = get_routing(model_routing)
+    intro_model = route_model("introduction", openai_model, routing, input_tokens=300, output_tokens=250)["model"]
+    
+    intro = generate_podcast_introduction(podcast_title, style_guidance, host_info, ai_instructions, intro_model)
+    script_parts.append(intro)
+    script_parts.append("\n\n")
+    
+    selected = select_script_articles(articles, podcast_duration, openai_model, get_ranking_query(podcast_description, ai_instructions))
+    max_articles = len(selected)
+    tokens_reduced = sum(article['tokens_reduced'] for article in selected)
+    
+    # Short shows summarize all their articles in one batched request
+    summary_output_tokens = int(get_summary_word_count(podcast_duration).split('-')[1]) * 2
+    if podcast_duration < 5 and len(selected) > 1:
+        summary_model = route_model(
+            "summarize_batch", openai_model, routing,
+            input_tokens=tokens_reduced, output_tokens=summary_output_tokens * len(selected)
+        )["model"]
+        summaries = summarize_articles_batch(selected, podcast_duration, summary_model)
+    else:
+        summary_model = route_model(
+            "summarize_article", openai_model, routing,
+            input_tokens=tokens_reduced // max(1, len(selected)), output_tokens=summary_output_tokens
+        )["model"]
+        summaries = [summarize_article(article, podcast_duration, summary_model) for article in selected]
     
     # Process all available articles up to max_articles
-    for i, article in enumerate(articles[:max_articles]):
-        article_summary = summarize_article(article, podcast_duration, openai_model)
+    for i, article_summary in enumerate(summaries):
         script_parts.append(article_summary)
         script_parts.append("\n\n")
         
@@ -399,7 +1222,54 @@ def generate_podcast_script(articles, podcast_title="Daily Tech Insights", podca
             script_parts.append("\n\n")
     
     # Conclusion
-    conclusion = generate_conclusion(openai_model)
+    conclusion_model = route_model("conclusion", openai_model, routing, input_tokens=80, output_tokens=150)["model"]
+    conclusion = generate_conclusion(conclusion_model)
     script_parts.append(conclusion)
     
     return "".join(script_parts)
+
+def stream_podcast_script(articles, podcast_title="Daily Tech Insights", podcast_description=None, podcast_author=None, host_name=None, ai_instructions=None, podcast_duration=10, openai_model="gpt-3.5-turbo", model_routing=None):
+    """
+    Generate the full podcast script, yielding it sentence by sentence
+    
+    The introduction and each summary are streamed, so the first sentences
+    can go to convert_to_speech while the rest is still being written.
+    Every article gets its own streamed summary, also for short shows that
+    generate_podcast_script would batch. Joined, the sentences form the
+    same script layout as generate_podcast_script.
+    
+    Args:
+        Same as generate_podcast_script
+    
+    Yields:
+        str: Sentences and paragraph breaks of the script
+    """
+    logger.info(f"Streaming podcast script for {podcast_title} with {len(articles)} articles using model {openai_model}")
+    
+    style_guidance, host_info = get_script_guidance(podcast_description, podcast_author, host_name)
+    routing = get_routing(model_routing)
+    
+    intro_model = route_model("introduction", openai_model, routing, input_tokens=300, output_tokens=250)["model"]
+    yield from stream_podcast_introduction(podcast_title, style_guidance, host_info, ai_instructions, intro_model)
+    yield "\n\n"
+    
+    selected = select_script_articles(articles, podcast_duration, openai_model, get_ranking_query(podcast_description, ai_instructions))
+    tokens_reduced = sum(article['tokens_reduced'] for article in selected)
+    summary_model = route_model(
+        "summarize_article", openai_model, routing,
+        input_tokens=tokens_reduced // max(1, len(selected)),
+        output_tokens=int(get_summary_word_count(podcast_duration).split('-')[1]) * 2
+    )["model"]
+    
+    for i, article in enumerate(selected):
+        yield from stream_summarize_article(article, podcast_duration, summary_model)
+        yield "\n\n"
+        
+        # Add transition between articles, but not after the last one
+        if i < len(selected) - 1:
+            yield generate_transition()
+            yield "\n\n"
+    
+    # The conclusion is short and comes last, so there is nothing to gain from streaming it
+    conclusion_model = route_model("conclusion", openai_model, routing, input_tokens=80, output_tokens=150)["model"]
+    yield from split_sentences(generate_conclusion(conclusion_model))
@@ -0,0 +1,16 @@
+import os
+import shutil
+
+bind = "0.0.0.0:5000"
+
+# Workers share their Prometheus samples through this directory
+multiproc_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join("storage", "prometheus"))
+
+def on_starting(server):
+    # Samples from a previous run would be added to the new totals
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+def child_exit(server, worker):
+    from metrics import mark_process_dead
+    mark_process_dead(worker.pid)
@@ -0,0 +1,302 @@
+"""
+Resized variants of uploaded and generated images.
+
+Avatars and cover art are stored as uploaded (or as DALL-E returned them,
+1024px+ PNGs of several MB), but pages only show them as small
+thumbnails. A background worker makes WebP thumbnails of each image in a
+few sizes, plus for cover art the square JPEG podcast directories require
+(1400 to 3000px), and stores them in static/variants under the hash of the
+original's content. The names never change for the same image, so the
+files can be cached forever and are shared between processes.
+
+Templates pick a variant with image_url(path, size). Until the variants of
+an image exist it returns the original and queues them, so images saved
+before this existed get variants the first time they are shown.
+"""
+import os
+import glob
+import hashlib
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import url_for
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = "static"
+
+# Variants are stored in static/variants; their names start with the original's content hash
+VARIANT_DIR = "variants"
+
+# Longest side (px) of the WebP thumbnails
+THUMBNAIL_SIZES = sorted(int(size) for size in os.environ.get("IMAGE_THUMBNAIL_SIZES", "128,256,512").split(","))
+
+# Side (px) of the square JPEG cover for podcast directories, which accept 1400 to 3000
+DIRECTORY_ART_SIZE = min(max(int(os.environ.get("IMAGE_DIRECTORY_ART_SIZE", "1400")), 1400), 3000)
+
+# Encoder quality of the variants
+WEBP_QUALITY = int(os.environ.get("IMAGE_WEBP_QUALITY", "80"))
+JPEG_QUALITY = int(os.environ.get("IMAGE_JPEG_QUALITY", "88"))
+
+# Thumbnails are picked for this many device pixels per CSS pixel
+PIXEL_DENSITY = 2
+
+# Threads making variants per process
+IMAGE_VARIANT_WORKERS = int(os.environ.get("IMAGE_VARIANT_WORKERS", "1"))
+
+# Hex characters of the content hash in variant names
+HASH_LENGTH = 20
+
+# Static path -> (mtime_ns, size, content hash or None when the image cannot be read)
+_variants = {}
+_pending = set()
+_executor = None
+_lock = threading.Lock()
+
+def get_content_hash(filepath):
+    """
+    Get the hash of an image file that names its variants
+    
+    Args:
+        filepath (str): Path of the file
+    
+    Returns:
+        str: Hex digest, HASH_LENGTH characters
+    """
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+def get_thumbnail_name(content_hash, size):
+    """Get the static path of a thumbnail variant"""
+    return f"{VARIANT_DIR}/{content_hash}-{size}.webp"
+
+def get_directory_art_name(content_hash):
+    """Get the static path of the square directory cover variant"""
+    return f"{VARIANT_DIR}/{content_hash}-{DIRECTORY_ART_SIZE}sq.jpg"
+
+def get_variant_names(content_hash, directory_art=False):
+    """Get the static paths of the variants of an image, with the directory cover for cover art"""
+    names = [get_thumbnail_name(content_hash, size) for size in THUMBNAIL_SIZES]
+    if directory_art:
+        names.append(get_directory_art_name(content_hash))
+    return names
+
+def save_image(image, name, **options):
+    """
+    Write a variant, replacing it atomically so readers never see part of a file
+    
+    Args:
+        image (Image): Image to write
+        name (str): Static path of the variant
+        **options: Encoder options for Image.save
+    """
+    path = os.path.join(STATIC_DIR, name)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            image.save(f, **options)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def make_variants(filepath, content_hash, directory_art=False):
+    """
+    Make the variants of an image that do not exist yet
+    
+    Args:
+        filepath (str): Path of the original
+        content_hash (str): Its content hash
+        directory_art (bool): Whether to make the directory cover too
+    
+    Returns:
+        int: Number of variants written
+    """
+    missing = [name for name in get_variant_names(content_hash, directory_art) if not os.path.exists(os.path.join(STATIC_DIR, name))]
+    if not missing:
+        return 0
+    os.makedirs(os.path.join(STATIC_DIR, VARIANT_DIR), exist_ok=True)
+    
+    with Image.open(filepath) as original:
+        # Decode large JPEGs at a reduced scale right away
+        largest = DIRECTORY_ART_SIZE if directory_art else THUMBNAIL_SIZES[-1]
+        original.draft("RGB", (largest, largest))
+        # Only the first frame of an animated GIF, turned the way the camera was held
+        image = ImageOps.exif_transpose(original)
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    
+    for size in THUMBNAIL_SIZES:
+        name = get_thumbnail_name(content_hash, size)
+        if name in missing:
+            thumbnail = image.copy()
+            thumbnail.thumbnail((size, size), Image.LANCZOS)
+            save_image(thumbnail, name, format="WEBP", quality=WEBP_QUALITY, method=4)
+    
+    name = get_directory_art_name(content_hash)
+    if name in missing:
+        if has_alpha:
+            # Directories want RGB without transparency
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        # Smaller covers (DALL-E's are 1024px) are scaled up to the required minimum
+        square = ImageOps.fit(image, (DIRECTORY_ART_SIZE, DIRECTORY_ART_SIZE), Image.LANCZOS)
+        save_image(square, name, format="JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    
+    return len(missing)
+
+def build_variants(static_path, directory_art=False):
+    """
+    Make the variants of an image and remember where they are
+    
+    Runs in the worker; failures are logged and remembered, so an image
+    that cannot be read is served as it is instead of being retried on
+    every page.
+    
+    Args:
+        static_path (str): Path of the image relative to static/
+        directory_art (bool): Whether to make the directory cover too
+    """
+    filepath = os.path.join(STATIC_DIR, static_path)
+    try:
+        stat = os.stat(filepath)
+        content_hash = get_content_hash(filepath)
+        try:
+            written = make_variants(filepath, content_hash, directory_art)
+            if written:
+                logger.info(f"Made {written} variants of {static_path}")
+        except Exception as e:
+            logger.warning(f"Could not make variants of {static_path}: {str(e)}")
+            content_hash = None
+        with _lock:
+            _variants[static_path] = (stat.st_mtime_ns, stat.st_size, content_hash)
+    except OSError as e:
+        logger.warning(f"Could not read {static_path} for variants: {str(e)}")
+    finally:
+        with _lock:
+            _pending.discard((static_path, directory_art))
+
+def schedule_variants(static_path, directory_art=False):
+    """
+    Queue making the variants of an image in the background
+    
+    Args:
+        static_path (str): Path of the image relative to static/, as stored
+            in cover_art_path and avatar_path
+        directory_art (bool): Whether to make the directory cover too, for
+            cover art only
+    """
+    global _executor
+    
+    if not static_path:
+        return
+    with _lock:
+        if (static_path, directory_art) in _pending:
+            return
+        _pending.add((static_path, directory_art))
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=IMAGE_VARIANT_WORKERS, thread_name_prefix="image-variants")
+        _executor.submit(build_variants, static_path, directory_art)
+
+def get_content_hash_if_ready(static_path, directory_art=False):
+    """
+    Get the content hash of an image whose variants have been made
+    
+    Queues making them when the image is new or has changed since.
+    
+    Args:
+        static_path (str): Path of the image relative to static/
+        directory_art (bool): Whether the directory cover is needed
+    
+    Returns:
+        str: Content hash, or None while the variants are not ready
+    """
+    if not static_path:
+        return None
+    try:
+        stat = os.stat(os.path.join(STATIC_DIR, static_path))
+    except OSError:
+        return None
+    
+    with _lock:
+        entry = _variants.get(static_path)
+    if entry and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+        content_hash = entry[2]
+        # Variants removed together with another image of the same content are made again
+        if content_hash is None or os.path.exists(os.path.join(STATIC_DIR, get_variant_names(content_hash, directory_art)[-1])):
+            return content_hash
+    schedule_variants(static_path, directory_art)
+    return None
+
+def get_thumbnail(static_path, size):
+    """
+    Get the smallest thumbnail that shows an image sharply at a size
+    
+    Args:
+        static_path (str): Path of the image relative to static/
+        size (int): Displayed size in CSS pixels
+    
+    Returns:
+        str: Static path of the thumbnail, or the original while there is none
+    """
+    content_hash = get_content_hash_if_ready(static_path)
+    if content_hash is None:
+        return static_path
+    wanted = size * PIXEL_DENSITY
+    variant_size = next((variant_size for variant_size in THUMBNAIL_SIZES if variant_size >= wanted), THUMBNAIL_SIZES[-1])
+    return get_thumbnail_name(content_hash, variant_size)
+
+def get_directory_art(static_path):
+    """
+    Get the square JPEG of a cover for podcast directories
+    
+    Args:
+        static_path (str): Path of the cover relative to static/
+    
+    Returns:
+        str: Static path of the variant, or the original while there is none
+    """
+    content_hash = get_content_hash_if_ready(static_path, directory_art=True)
+    if content_hash is None:
+        return static_path
+    return get_directory_art_name(content_hash)
+
+def image_url(static_path, size):
+    """
+    Template helper: URL of an image for showing it at a size
+    
+    Args:
+        static_path (str): Path of the image relative to static/
+        size (int): Displayed size in CSS pixels
+    
+    Returns:
+        str: URL of a thumbnail, or of the original while there is none
+    """
+    return url_for("static", filename=get_thumbnail(static_path, size))
+
+def remove_variants(static_path):
+    """
+    Delete the variants of an image that is about to be deleted
+    
+    Args:
+        static_path (str): Path of the image relative to static/
+    """
+    filepath = os.path.join(STATIC_DIR, static_path)
+    try:
+        content_hash = get_content_hash(filepath)
+    except OSError:
+        return
+    for path in glob.glob(os.path.join(STATIC_DIR, VARIANT_DIR, f"{content_hash}-*")):
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning(f"Could not delete variant {path}: {str(e)}")
+    with _lock:
+        _variants.pop(static_path, None)
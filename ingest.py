@@ -0,0 +1,175 @@
+"""
+Background feed ingestion.
+
+A thread polls every active RSS feed on its own schedule (adapted to how
+often the feed publishes, see feed_health.py) and adds new entries to the article archive, so generating an episode only has to read
+the archive instead of waiting for every feed. Gunicorn runs several
+workers; a file lock makes sure only one of them polls, and another worker
+takes over when that one exits. Generation still fetches a feed live when
+its last successful fetch is older than FEED_INGEST_MAX_AGE.
+"""
+import os
+import time
+import fcntl
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import rss
+import websub
+import feed_health
+
+logger = logging.getLogger(__name__)
+
+# Set to "off" to only fetch feeds while generating
+FEED_INGESTION = os.environ.get("FEED_INGESTION", "on").lower()
+
+# Seconds between two fetches of a feed until its publishing rate is known
+INGEST_INTERVAL = feed_health.DEFAULT_POLL_INTERVAL
+
+# Seconds after which generation no longer trusts the archive and fetches the feed itself
+INGEST_MAX_AGE = int(os.environ.get("FEED_INGEST_MAX_AGE", str(INGEST_INTERVAL * 2)))
+
+INGEST_LOCK_FILE = os.environ.get("FEED_INGEST_LOCK", os.path.join("storage", "feed_ingest.lock"))
+
+# Seconds between attempts to take over polling from another worker
+LOCK_RETRY_INTERVAL = 60
+
+# Longest sleep between two polls, so feeds added in the meantime are picked up soon
+MAX_SLEEP = 60
+
+_ingest_thread = None
+_thread_lock = threading.Lock()
+
+def is_enabled():
+    """Check whether background ingestion is switched on"""
+    return FEED_INGESTION not in ("off", "false", "0", "no")
+
+def get_max_age():
+    """
+    Get how old ingested feed data may be before generation fetches the feed itself
+    
+    Returns:
+        timedelta: Maximum age, or None when background ingestion is off
+    """
+    if not is_enabled():
+        return None
+    return timedelta(seconds=INGEST_MAX_AGE)
+
+def get_due_feeds(now):
+    """
+    Get the active feeds whose next fetch or circuit breaker probe is due
+    
+    Feeds whose WebSub hub pushes their entries are only polled every
+    websub.WEBSUB_FALLBACK_INTERVAL seconds.
+    
+    Args:
+        now (datetime): Current time (UTC)
+    
+    Returns:
+        tuple: (due feed URLs, seconds until the next feed is due or None)
+    """
+    import models
+    
+    # The same URL can be configured for several podcasts; it is fetched once
+    urls = [url for url, in models.RssFeed.query.with_entities(models.RssFeed.url).filter(
+        models.RssFeed.active == True
+    ).distinct().all()]
+    health = feed_health.get_health(urls)
+    pushed = websub.get_pushed_feeds(urls, now)
+    
+    due = []
+    next_due = None
+    for url in urls:
+        next_fetch = health[url].next_fetch if url in health else None
+        if url in pushed and next_fetch is not None and health[url].updated_at is not None:
+            # updated_at is the time of the last poll
+            next_fetch = max(next_fetch, health[url].updated_at + timedelta(seconds=websub.WEBSUB_FALLBACK_INTERVAL))
+        if next_fetch is None or next_fetch <= now:
+            due.append(url)
+            continue
+        wait = (next_fetch - now).total_seconds()
+        next_due = wait if next_due is None else min(next_due, wait)
+    return due, next_due
+
+def ingest_due_feeds(now=None):
+    """
+    Fetch every feed that is due and store its new entries, then send due
+    WebSub (re)subscriptions
+    
+    Args:
+        now (datetime): Current time (UTC), defaults to now
+    
+    Returns:
+        float: Seconds until the next feed is due, or None if there are no active feeds
+    """
+    now = now or datetime.utcnow()
+    websub.maintain_subscriptions(now)
+    due, next_due = get_due_feeds(now)
+    if not due:
+        return next_due
+    
+    started = time.perf_counter()
+    results = rss.ingest_feeds(due)
+    rss.mark_feeds_fetched([url for url, new_articles in results.items() if new_articles is not None])
+    stored = sum(new_articles for new_articles in results.values() if new_articles)
+    
+    logger.info(f"Ingested {len(due)} feed(s) in {time.perf_counter() - started:.1f}s, {stored} new article(s)")
+    return INGEST_INTERVAL if next_due is None else next_due
+
+def acquire_lock():
+    """
+    Try to become the worker that polls the feeds
+    
+    Returns:
+        file: The locked file, to be kept open, or None if another process holds the lock
+    """
+    os.makedirs(os.path.dirname(INGEST_LOCK_FILE) or ".", exist_ok=True)
+    lock_file = open(INGEST_LOCK_FILE, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+def ingest_loop(app):
+    """
+    Poll the feeds forever once this process holds the ingestion lock
+    
+    Args:
+        app: Flask application, for the database session
+    """
+    lock_file = acquire_lock()
+    while lock_file is None:
+        time.sleep(LOCK_RETRY_INTERVAL)
+        lock_file = acquire_lock()
+    logger.info(f"Feed ingestion started in process {os.getpid()}")
+    
+    while True:
+        wait = MAX_SLEEP
+        try:
+            with app.app_context():
+                next_due = ingest_due_feeds()
+            if next_due is not None:
+                wait = min(max(next_due, 1), MAX_SLEEP)
+        except Exception as e:
+            logger.error(f"Error ingesting feeds: {str(e)}")
+        time.sleep(wait)
+
+def start_ingestion(app):
+    """
+    Start the background ingestion thread of this process
+    
+    Args:
+        app: Flask application
+    """
+    global _ingest_thread
+    
+    if not is_enabled():
+        logger.info("Background feed ingestion is off")
+        return
+    with _thread_lock:
+        if _ingest_thread is None or not _ingest_thread.is_alive():
+            _ingest_thread = threading.Thread(target=ingest_loop, args=(app,), name="feed-ingest", daemon=True)
+            _ingest_thread.start()
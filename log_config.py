@@ -0,0 +1,99 @@
+"""
+Logging setup for the app.
+
+Records are put on an in-memory queue by the calling thread and written out
+by a QueueListener thread, so request handlers and pipeline threads never
+wait on log I/O. Levels are configured from the environment:
+
+    LOG_LEVEL=INFO                              root level (default INFO)
+    LOG_LEVELS=tts=WARNING,gitpush=DEBUG        per-module levels
+    LOG_FILE=storage/app.log                    also write to a file
+"""
+import os
+import sys
+import queue
+import atexit
+import logging
+import logging.handlers
+
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s")
+
+_listener = None
+_listener_pid = None
+
+class TraceContextFilter(logging.Filter):
+    """Add the active trace ID to every record so log lines can be matched to spans"""
+    
+    def filter(self, record):
+        if not hasattr(record, "trace_id"):
+            from tracing import current_trace_id
+            record.trace_id = current_trace_id() or "-"
+        return True
+
+def parse_module_levels(value):
+    """
+    Parse per-module levels like "tts=WARNING,gitpush=DEBUG"
+    
+    Args:
+        value (str): Comma separated name=LEVEL pairs
+    
+    Returns:
+        dict: Logger name to level name
+    """
+    levels = {}
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        name, level = name.strip(), level.strip().upper()
+        if name and level:
+            levels[name] = level
+    return levels
+
+def configure_logging(level=None):
+    """
+    Route all logging through a queue and a background writer thread
+    
+    Safe to call more than once; only the first call in a process applies.
+    
+    Args:
+        level (str or int): Root level, defaults to LOG_LEVEL or INFO
+    """
+    global _listener, _listener_pid
+    
+    if _listener is not None and _listener_pid == os.getpid():
+        return
+    
+    if _listener is not None:
+        # Forked from a configured parent: its writer thread did not survive the fork
+        _listener = None
+    
+    output_handlers = [logging.StreamHandler(sys.stderr)]
+    log_file = os.environ.get("LOG_FILE")
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+        output_handlers.append(logging.FileHandler(log_file))
+    
+    formatter = logging.Formatter(LOG_FORMAT)
+    for handler in output_handlers:
+        handler.setFormatter(formatter)
+    
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(TraceContextFilter())
+    
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level or os.environ.get("LOG_LEVEL", "INFO").upper())
+    
+    for name, module_level in parse_module_levels(os.environ.get("LOG_LEVELS")).items():
+        logging.getLogger(name).setLevel(module_level)
+    
+    _listener = logging.handlers.QueueListener(log_queue, *output_handlers, respect_handler_level=True)
+    _listener.start()
+    _listener_pid = os.getpid()
+    
+    # Write out whatever is still queued when the process exits
+    atexit.register(_listener.stop)
@@ -1,4 +1,7 @@
-from app import app
+# Feed parse workers (parse_pool.py) import this script again as __mp_main__;
+# they must not create the app and start its background threads
+if __name__ != '__mp_main__':
+    from app import app
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
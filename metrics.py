@@ -0,0 +1,184 @@
+"""
+Prometheus metrics for the podcast pipeline.
+
+When PROMETHEUS_MULTIPROC_DIR is set (see gunicorn.conf.py) every worker
+writes its samples to that directory and /metrics aggregates them, so the
+numbers are correct no matter which worker serves the scrape. Without
+prometheus_client installed all helpers are no-ops.
+"""
+import os
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+try:
+    from prometheus_client import Counter, Histogram, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST
+    from prometheus_client import multiprocess
+except ImportError:
+    Counter = Histogram = None
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+# Buckets from fast local steps (git add) up to slow remote calls (long TTS chunks)
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+class NoopMetric:
+    """Stand-in used when prometheus_client is not installed"""
+    
+    def labels(self, *args, **kwargs):
+        return self
+    
+    def inc(self, amount=1):
+        pass
+    
+    def observe(self, value):
+        pass
+
+if Counter is not None:
+    STAGE_DURATION = Histogram(
+        "podcast_stage_duration_seconds",
+        "Time spent in each pipeline stage",
+        ["stage", "outcome"],
+        buckets=DURATION_BUCKETS,
+    )
+    STAGE_ERRORS = Counter(
+        "podcast_stage_errors_total",
+        "Pipeline stage failures by exception type",
+        ["stage", "error_type"],
+    )
+    STAGE_RETRIES = Counter(
+        "podcast_stage_retries_total",
+        "Retries performed inside a pipeline stage",
+        ["stage", "reason"],
+    )
+    LLM_TOKENS = Counter(
+        "podcast_llm_tokens_total",
+        "OpenAI tokens consumed",
+        ["model", "call_type", "kind"],
+    )
+    MODEL_ROUTING = Counter(
+        "podcast_model_routing_total",
+        "Model chosen per call type by the router",
+        ["call_type", "model", "reason"],
+    )
+    TIME_TO_FIRST_OUTPUT = Histogram(
+        "podcast_time_to_first_output_seconds",
+        "Time until a streamed stage hands out its first sentence or audio chunk",
+        ["stage"],
+        buckets=DURATION_BUCKETS,
+    )
+    TTS_CHARACTERS = Counter(
+        "podcast_tts_characters_total",
+        "Characters sent to ElevenLabs text-to-speech",
+    )
+    ARTICLE_TOKENS = Counter(
+        "podcast_article_tokens_total",
+        "Article input tokens before and after preprocessing",
+        ["stage"],
+    )
+    FEED_ARTICLES = Counter(
+        "podcast_feed_articles_total",
+        "Articles kept from fetched feeds after time frame filtering",
+    )
+    GIT_COMMAND_DURATION = Histogram(
+        "podcast_git_command_duration_seconds",
+        "Time spent in each git command while publishing",
+        ["command", "outcome"],
+        buckets=DURATION_BUCKETS,
+    )
+else:
+    STAGE_DURATION = STAGE_ERRORS = STAGE_RETRIES = LLM_TOKENS = MODEL_ROUTING = TIME_TO_FIRST_OUTPUT = NoopMetric()
+    TTS_CHARACTERS = FEED_ARTICLES = ARTICLE_TOKENS = GIT_COMMAND_DURATION = NoopMetric()
+
+def observe_stage(stage, started, outcome="success"):
+    """
+    Record the duration of a stage that was timed by hand
+    
+    Args:
+        stage (str): Stage name
+        started (float): time.perf_counter() value when the stage began
+        outcome (str): success or error
+    """
+    STAGE_DURATION.labels(stage, outcome).observe(time.perf_counter() - started)
+
+def record_error(stage, error):
+    """
+    Count a stage failure
+    
+    Args:
+        stage (str): Stage name
+        error (Exception): The exception that was raised
+    """
+    STAGE_ERRORS.labels(stage, type(error).__name__).inc()
+
+def record_retry(stage, reason):
+    """
+    Count a retry inside a stage
+    
+    Args:
+        stage (str): Stage name
+        reason (str): Short reason, e.g. http_429 or timeout
+    """
+    STAGE_RETRIES.labels(stage, reason).inc()
+
+def record_tokens(model, call_type, usage):
+    """
+    Count tokens reported by an OpenAI response
+    
+    Args:
+        model (str): Model name
+        call_type (str): introduction, summary, conclusion...
+        usage: The response's usage object, may be None
+    """
+    if usage is None:
+        return
+    LLM_TOKENS.labels(model, call_type, "prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    LLM_TOKENS.labels(model, call_type, "completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+@contextmanager
+def track_stage(stage):
+    """
+    Time a block as a pipeline stage and count its failures
+    
+    Args:
+        stage (str): Stage name
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        observe_stage(stage, started, "error")
+        record_error(stage, e)
+        raise
+    observe_stage(stage, started)
+
+def render_metrics():
+    """
+    Render all metrics in the Prometheus text format
+    
+    Returns:
+        tuple: (body, content_type)
+    """
+    if Counter is None:
+        return b"# prometheus_client is not installed\n", CONTENT_TYPE_LATEST
+    
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # Aggregate the samples every worker wrote to the shared directory
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    
+    from prometheus_client import REGISTRY
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+def mark_process_dead(pid):
+    """
+    Drop the live samples of a worker that exited (called from gunicorn's child_exit hook)
+    
+    Args:
+        pid (int): Worker process ID
+    """
+    if Counter is not None and os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
+        logger.debug(f"Marked metrics of worker {pid} as dead")
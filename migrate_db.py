@@ -122,6 +122,177 @@ def add_time_frame_to_settings():
             logger.error(f"Error adding time_frame to settings table: {str(e)}")
             raise
 
+def add_audio_metadata_to_episodes():
+    """Add audio duration, bitrate and size columns to episodes table"""
+    from app import app, db
+    
+    with app.app_context():
+        try:
+            conn = db.engine.connect()
+            inspector = db.inspect(db.engine)
+            columns = [col['name'] for col in inspector.get_columns('episodes')]
+            
+            new_columns = {
+                'audio_duration': 'FLOAT NULL',
+                'audio_bitrate': 'INTEGER NULL',
+                'audio_size': 'INTEGER NULL',
+            }
+            
+            for name, definition in new_columns.items():
+                if name not in columns:
+                    logger.info(f"Adding {name} column to episodes table")
+                    conn.execute(text(f"ALTER TABLE episodes ADD COLUMN {name} {definition}"))
+            
+            conn.commit()
+            logger.info("Episodes table audio metadata columns added successfully")
+                
+        except Exception as e:
+            logger.error(f"Error adding audio metadata to episodes table: {str(e)}")
+            raise
+
+def add_trace_id_to_episodes():
+    """Add trace_id column to episodes table"""
+    from app import app, db
+    
+    with app.app_context():
+        try:
+            conn = db.engine.connect()
+            inspector = db.inspect(db.engine)
+            columns = [col['name'] for col in inspector.get_columns('episodes')]
+            
+            if 'trace_id' not in columns:
+                logger.info("Adding trace_id column to episodes table")
+                conn.execute(text("ALTER TABLE episodes ADD COLUMN trace_id VARCHAR(32) NULL"))
+                conn.commit()
+                logger.info("trace_id column added successfully")
+            else:
+                logger.info("trace_id column already exists")
+                
+        except Exception as e:
+            logger.error(f"Error adding trace_id to episodes table: {str(e)}")
+            raise
+
+def add_model_routing_to_settings():
+    """Add model_routing column to settings table"""
+    from app import app, db
+    
+    with app.app_context():
+        try:
+            conn = db.engine.connect()
+            inspector = db.inspect(db.engine)
+            columns = [col['name'] for col in inspector.get_columns('settings')]
+            
+            if 'model_routing' not in columns:
+                logger.info("Adding model_routing column to settings table")
+                conn.execute(text("ALTER TABLE settings ADD COLUMN model_routing TEXT NULL"))
+                conn.commit()
+                logger.info("Settings table model_routing column added successfully")
+                
+        except Exception as e:
+            logger.error(f"Error adding model_routing to settings table: {str(e)}")
+            raise
+
+def add_script_hash_to_episodes():
+    """Add script_hash column to episodes table"""
+    from app import app, db
+    
+    with app.app_context():
+        try:
+            conn = db.engine.connect()
+            inspector = db.inspect(db.engine)
+            columns = [col['name'] for col in inspector.get_columns('episodes')]
+            
+            if 'script_hash' not in columns:
+                logger.info("Adding script_hash column to episodes table")
+                conn.execute(text("ALTER TABLE episodes ADD COLUMN script_hash VARCHAR(64) NULL"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_episodes_script_hash ON episodes (script_hash)"))
+                conn.commit()
+                logger.info("script_hash column added successfully")
+            else:
+                logger.info("script_hash column already exists")
+                
+        except Exception as e:
+            logger.error(f"Error adding script_hash to episodes table: {str(e)}")
+            raise
+
+def move_scripts_to_store(batch_size=100):
+    """Move scripts from the episodes table into the compressed script store"""
+    from app import app, db
+    from models import Episode
+    
+    with app.app_context():
+        try:
+            moved = 0
+            while True:
+                episodes = Episode.query.filter(
+                    Episode.script_hash.is_(None), Episode.legacy_script.isnot(None)
+                ).limit(batch_size).all()
+                if not episodes:
+                    break
+                for episode in episodes:
+                    # The setter stores the text and clears the old column
+                    episode.script = episode.legacy_script
+                db.session.commit()
+                moved += len(episodes)
+            
+            logger.info(f"Moved {moved} episode scripts to the script store")
+                
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error moving scripts to the script store: {str(e)}")
+            raise
+
+def delete_unreferenced_scripts():
+    """Delete stored scripts that no episode references any more"""
+    from app import app
+    import script_store
+    
+    with app.app_context():
+        try:
+            deleted = script_store.delete_unreferenced_scripts()
+            logger.info(f"Deleted {deleted} unreferenced scripts from the script store")
+                
+        except Exception as e:
+            logger.error(f"Error deleting unreferenced scripts: {str(e)}")
+            raise
+
+def make_article_keys_unique_per_feed():
+    """Make articles unique per (feed_url, key) instead of per key, so feeds sharing an article each keep it"""
+    from app import app, db
+    from models import Article
+    
+    with app.app_context():
+        try:
+            inspector = db.inspect(db.engine)
+            if 'articles' not in inspector.get_table_names():
+                return
+            if any(constraint['name'] == 'uq_articles_feed_key' for constraint in inspector.get_unique_constraints('articles')):
+                logger.info("Articles are already unique per feed")
+                return
+            
+            logger.info("Making articles unique per feed")
+            with db.engine.begin() as conn:
+                if db.engine.dialect.name == 'postgresql':
+                    for constraint in inspector.get_unique_constraints('articles'):
+                        if constraint['column_names'] == ['key']:
+                            conn.execute(text(f'ALTER TABLE articles DROP CONSTRAINT "{constraint["name"]}"'))
+                    conn.execute(text("ALTER TABLE articles ADD CONSTRAINT uq_articles_feed_key UNIQUE (feed_url, key)"))
+                    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_articles_key ON articles (key)"))
+                else:
+                    # SQLite cannot drop a column's UNIQUE, so the table is rebuilt
+                    for index in inspector.get_indexes('articles'):
+                        conn.execute(text(f'DROP INDEX "{index["name"]}"'))
+                    conn.execute(text("ALTER TABLE articles RENAME TO articles_old"))
+                    Article.__table__.create(conn)
+                    columns = ", ".join(column.name for column in Article.__table__.columns)
+                    conn.execute(text(f"INSERT INTO articles ({columns}) SELECT {columns} FROM articles_old"))
+                    conn.execute(text("DROP TABLE articles_old"))
+            logger.info("Articles are now unique per feed")
+                
+        except Exception as e:
+            logger.error(f"Error making articles unique per feed: {str(e)}")
+            raise
+
 def migrate_database():
     """Run all migration steps"""
     from app import app, db
@@ -135,6 +306,13 @@ def migrate_database():
             drop_and_recreate_settings()
             add_user_id_to_settings()
             add_time_frame_to_settings()
+            add_audio_metadata_to_episodes()
+            add_trace_id_to_episodes()
+            add_model_routing_to_settings()
+            add_script_hash_to_episodes()
+            move_scripts_to_store()
+            delete_unreferenced_scripts()
+            make_article_keys_unique_per_feed()
             
             logger.info("Database migration completed successfully")
         except Exception as e:
@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -39,6 +40,7 @@ class Settings(db.Model):
     ai_instructions = db.Column(db.Text, nullable=True, default=None)  # Custom instructions for the AI
     podcast_duration = db.Column(db.Integer, nullable=False, default=10)  # Target duration in minutes
     openai_model = db.Column(db.String(50), nullable=False, default="gpt-3.5-turbo")  # AI model to use for generation
+    model_routing = db.Column(db.Text, nullable=True)  # JSON of call type to model tier or name, see gpt.route_model
     blocked_terms = db.Column(db.Text, nullable=True)  # List of blocked words/terms for content filtering
     cover_art_path = db.Column(db.String(255), nullable=True)
     voice_id = db.Column(db.String(255), nullable=True)  # Podcast-specific voice ID
@@ -69,6 +71,22 @@ class Settings(db.Model):
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def get_model_routing(self):
+        try:
+            return json.loads(self.model_routing) if self.model_routing else {}
+        except ValueError:
+            return {}
+    
+    def set_short_call_model(self, value):
+        """Route the introduction and conclusion to a tier or model ('auto' keeps the default)"""
+        routing = self.get_model_routing()
+        for call_type in ("introduction", "conclusion"):
+            if value and value != "auto":
+                routing[call_type] = value
+            else:
+                routing.pop(call_type, None)
+        self.model_routing = json.dumps(routing) if routing else None
 
 class RssFeed(db.Model):
     __tablename__ = 'rss_feeds'
@@ -83,21 +101,119 @@ class RssFeed(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+class Article(db.Model):
+    __tablename__ = 'articles'
+    __table_args__ = (
+        db.Index('ix_articles_feed_published', 'feed_url', 'published'),
+        # Feeds that carry the same article each keep their own row
+        db.UniqueConstraint('feed_url', 'key', name='uq_articles_feed_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(64), nullable=False, index=True)  # SHA-256 of the normalized link, see article_store.article_key
+    guid = db.Column(db.String(512), nullable=True, index=True)  # Entry id from the feed, if it has one
+    link = db.Column(db.Text, nullable=False)
+    title = db.Column(db.String(512), nullable=False)
+    source = db.Column(db.String(255), nullable=True)  # Feed title
+    feed_url = db.Column(db.String(255), nullable=False)
+    summary = db.Column(db.Text, nullable=True)  # Raw entry content as published in the feed
+    published = db.Column(db.DateTime, nullable=False, index=True)
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        """Article dictionary in the format returned by rss.fetch_rss_feeds"""
+        return {
+            'title': self.title,
+            'link': self.link,
+            'published': self.published.isoformat(),
+            'source': self.source,
+            'summary': self.summary or '',
+        }
+
+class FeedHealth(db.Model):
+    __tablename__ = 'feed_health'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(255), unique=True, nullable=False)  # Shared by every RssFeed with this URL
+    fetch_count = db.Column(db.Integer, default=0, nullable=False)
+    success_rate = db.Column(db.Float, nullable=True)  # Moving average of successful fetches, 0 to 1
+    avg_latency = db.Column(db.Float, nullable=True)  # Moving average of fetch time in seconds
+    items_per_day = db.Column(db.Float, nullable=True)  # Entries published per day over the last two weeks
+    last_new_item = db.Column(db.DateTime, nullable=True)  # Publish time of the newest archived entry
+    consecutive_failures = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.String(255), nullable=True)
+    poll_interval = db.Column(db.Integer, nullable=True)  # Seconds between background fetches
+    next_fetch = db.Column(db.DateTime, nullable=True)  # UTC; while the circuit is open, the next probe
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    @property
+    def circuit_open(self):
+        """Whether the feed failed often enough to be skipped until its next probe"""
+        from feed_health import FAILURE_THRESHOLD
+        return self.consecutive_failures >= FAILURE_THRESHOLD
+
+class WebSubSubscription(db.Model):
+    __tablename__ = 'websub_subscriptions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    feed_url = db.Column(db.String(255), unique=True, nullable=False)  # Shared by every RssFeed with this URL
+    topic = db.Column(db.Text, nullable=False)  # The feed's self URL, which the hub knows it by
+    hub = db.Column(db.Text, nullable=False)
+    token = db.Column(db.String(64), unique=True, nullable=False)  # Last part of the callback URL
+    secret = db.Column(db.String(64), nullable=False)  # HMAC key the hub signs pushed content with
+    state = db.Column(db.String(20), default="new", nullable=False)  # new, pending, active, unsubscribing, denied, failed
+    lease_seconds = db.Column(db.Integer, nullable=True)  # Lease the hub granted
+    lease_expires = db.Column(db.DateTime, nullable=True)  # UTC
+    requested_at = db.Column(db.DateTime, nullable=True)  # UTC time of the last (un)subscribe request
+    last_push = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class Episode(db.Model):
     __tablename__ = 'episodes'
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow)
-    script = db.Column(db.Text, nullable=True)
-    script_path = db.Column(db.String(255), nullable=True)
+    # Key in the script store, see script_store.py; the previous key is loaded on change so its script can be released
+    script_hash = db.column_property(db.Column(db.String(64), nullable=True, index=True), active_history=True)
+    legacy_script = db.deferred(db.Column('script', db.Text, nullable=True))  # Only episodes not moved to the script store yet
+    script_path = db.Column(db.String(255), nullable=True)  # Only older episodes, which also wrote the script to a file
     audio_path = db.Column(db.String(255), nullable=True)
+    audio_duration = db.Column(db.Float, nullable=True)  # Duration in seconds, read from the MP3 headers
+    audio_bitrate = db.Column(db.Integer, nullable=True)  # Average bitrate in kbps
+    audio_size = db.Column(db.Integer, nullable=True)  # File size in bytes for the RSS enclosure
     publish_url = db.Column(db.String(255), nullable=True)
     publish_date = db.Column(db.DateTime, nullable=True)
+    trace_id = db.Column(db.String(32), nullable=True)  # Ties generation, audio and publish spans together
     status = db.Column(db.String(50), default="draft")  # draft, script_generated, audio_generated, published
     podcast_id = db.Column(db.Integer, db.ForeignKey('settings.id'), nullable=True)  # Associate with specific podcast
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    @property
+    def script(self):
+        """The episode script, read from the script store on first use"""
+        import script_store
+        if self.script_hash:
+            return script_store.get_script(self.script_hash)
+        return self.legacy_script
+    
+    @script.setter
+    def script(self, script):
+        import script_store
+        self.script_hash = script_store.put_script(script) if script else None
+        self.legacy_script = None
+
+class Script(db.Model):
+    __tablename__ = 'scripts'
+    
+    hash = db.Column(db.String(64), primary_key=True)  # SHA-256 of the UTF-8 text
+    data = db.Column(db.LargeBinary, nullable=False)  # zstd-compressed UTF-8 text
+    size = db.Column(db.Integer, nullable=False)  # Uncompressed bytes
+    compressed_size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class ElevenLabsVoice(db.Model):
     __tablename__ = 'elevenlabs_voices'
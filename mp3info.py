@@ -0,0 +1,278 @@
+import os
+import struct
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bitrates in kbps indexed by [version_is_mpeg1][layer][bitrate_index]
+BITRATES = {
+    True: {
+        1: [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+        2: [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+        3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    },
+    False: {
+        1: [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+        2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+        3: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    },
+}
+
+# Sample rates indexed by version bits (0 = MPEG 2.5, 2 = MPEG 2, 3 = MPEG 1)
+SAMPLE_RATES = {
+    0: [11025, 12000, 8000],
+    2: [22050, 24000, 16000],
+    3: [44100, 48000, 32000],
+}
+
+# How far into the file to look for the first frame (after any ID3v2 tag)
+MAX_SYNC_SEARCH = 64 * 1024
+
+def parse_frame_header(header):
+    """
+    Parse a 4-byte MPEG audio frame header
+    
+    Args:
+        header (bytes): Four header bytes
+    
+    Returns:
+        dict: Frame properties, or None if the bytes are not a valid header
+    """
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    
+    version_bits = (header[1] >> 3) & 0x03
+    layer_bits = (header[1] >> 1) & 0x03
+    protected = not (header[1] & 0x01)
+    bitrate_index = (header[2] >> 4) & 0x0F
+    sample_rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+    channel_mode = (header[3] >> 6) & 0x03
+    
+    # Reserved or free-format values cannot be measured
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    
+    mpeg1 = version_bits == 3
+    layer = 4 - layer_bits
+    bitrate = BITRATES[mpeg1][layer][bitrate_index]
+    sample_rate = SAMPLE_RATES[version_bits][sample_rate_index]
+    
+    if layer == 1:
+        samples = 384
+        frame_length = (12 * bitrate * 1000 // sample_rate + padding) * 4
+    elif layer == 2 or mpeg1:
+        samples = 1152
+        frame_length = 144 * bitrate * 1000 // sample_rate + padding
+    else:
+        samples = 576
+        frame_length = 72 * bitrate * 1000 // sample_rate + padding
+    
+    return {
+        "mpeg1": mpeg1,
+        "layer": layer,
+        "protected": protected,
+        "bitrate": bitrate,
+        "sample_rate": sample_rate,
+        "samples": samples,
+        "frame_length": frame_length,
+        "mono": channel_mode == 3,
+    }
+
+def skip_id3v2(f):
+    """
+    Get the offset of the audio data after an optional ID3v2 tag
+    
+    Args:
+        f (file): Binary file positioned at the start
+    
+    Returns:
+        int: Offset of the first byte after the tag
+    """
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+    
+    # Tag size is a 28-bit syncsafe integer that excludes the 10-byte header
+    size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+    footer = 10 if header[5] & 0x10 else 0
+    return 10 + size + footer
+
+def find_first_frame(f, start):
+    """
+    Find the first frame header, confirmed by the header of the frame after it
+    
+    Args:
+        f (file): Binary file
+        start (int): Offset to start searching from
+    
+    Returns:
+        tuple: (offset, frame) or (None, None) if no frame was found
+    """
+    f.seek(start)
+    data = f.read(MAX_SYNC_SEARCH)
+    
+    position = data.find(b"\xff")
+    while position != -1 and position + 4 <= len(data):
+        frame = parse_frame_header(data[position:position + 4])
+        if frame:
+            f.seek(start + position + frame["frame_length"])
+            following = parse_frame_header(f.read(4))
+            if following and following["sample_rate"] == frame["sample_rate"]:
+                return start + position, frame
+        position = data.find(b"\xff", position + 1)
+    
+    return None, None
+
+def read_vbr_header(frame_data, frame):
+    """
+    Read the frame count from a Xing/Info or VBRI header in the first frame
+    
+    Args:
+        frame_data (bytes): Contents of the first frame
+        frame (dict): Parsed header of the first frame
+    
+    Returns:
+        tuple: (frame_count, encoder_delay_and_padding) or (None, 0) if there is no usable header
+    """
+    # Xing/Info sits right after the side information
+    if frame["mpeg1"]:
+        side_info = 17 if frame["mono"] else 32
+    else:
+        side_info = 9 if frame["mono"] else 17
+    offset = 4 + side_info + (2 if frame["protected"] else 0)
+    
+    tag = frame_data[offset:offset + 4]
+    if tag in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", frame_data[offset + 4:offset + 8])[0]
+        position = offset + 8
+        frame_count = None
+        if flags & 0x1:
+            frame_count = struct.unpack(">I", frame_data[position:position + 4])[0]
+            position += 4
+        if flags & 0x2:
+            position += 4
+        if flags & 0x4:
+            position += 100
+        if flags & 0x8:
+            position += 4
+        
+        # LAME extension records the encoder delay and padding in samples
+        gapless = 0
+        lame = frame_data[position:position + 36]
+        if frame_count is not None and len(lame) == 36 and lame[:4] in (b"LAME", b"Lavf", b"Lavc"):
+            delay_padding = lame[21:24]
+            delay = (delay_padding[0] << 4) | (delay_padding[1] >> 4)
+            padding = ((delay_padding[1] & 0x0F) << 8) | delay_padding[2]
+            if delay + padding < frame_count * frame["samples"]:
+                gapless = delay + padding
+        
+        return frame_count, gapless
+    
+    # Fraunhofer VBRI header always sits 32 bytes after the frame header
+    if frame_data[36:40] == b"VBRI":
+        frame_count = struct.unpack(">I", frame_data[50:54])[0]
+        return frame_count, 0
+    
+    return None, 0
+
+def count_frames(f, offset, file_size):
+    """
+    Walk the frame headers from an offset to the end of the audio data
+    
+    Only the four header bytes of each frame are read, the audio itself is skipped.
+    
+    Args:
+        f (file): Binary file
+        offset (int): Offset of the first frame
+        file_size (int): Total file size
+    
+    Returns:
+        tuple: (total_samples, sample_rate, audio_bytes)
+    """
+    total_samples = 0
+    sample_rate = None
+    audio_bytes = 0
+    
+    while offset + 4 <= file_size:
+        f.seek(offset)
+        frame = parse_frame_header(f.read(4))
+        if not frame:
+            # ID3v1/APE tags or trailing garbage end the audio
+            break
+        total_samples += frame["samples"]
+        sample_rate = sample_rate or frame["sample_rate"]
+        audio_bytes += frame["frame_length"]
+        offset += frame["frame_length"]
+    
+    return total_samples, sample_rate, audio_bytes
+
+def read_mp3_info(path):
+    """
+    Compute duration, bitrate and size of an MP3 file from its headers without decoding audio
+    
+    Uses the Xing/Info or VBRI header when the encoder wrote one and
+    otherwise walks the frame headers.
+    
+    Args:
+        path (str): Path to the MP3 file
+    
+    Returns:
+        dict: duration (seconds), bitrate (kbps), size (bytes), sample_rate and vbr,
+              or None if the file is not a readable MP3
+    """
+    try:
+        file_size = os.path.getsize(path)
+        
+        with open(path, "rb") as f:
+            start = skip_id3v2(f)
+            offset, frame = find_first_frame(f, start)
+            if offset is None:
+                logger.warning(f"No MPEG audio frames found in {path}")
+                return None
+            
+            f.seek(offset)
+            frame_data = f.read(frame["frame_length"])
+            frame_count, gapless = read_vbr_header(frame_data, frame)
+            
+            if frame_count:
+                total_samples = frame_count * frame["samples"] - gapless
+                sample_rate = frame["sample_rate"]
+                audio_bytes = file_size - offset - frame["frame_length"]
+                vbr = frame_data.find(b"Xing") != -1 or frame_data[36:40] == b"VBRI"
+            else:
+                total_samples, sample_rate, audio_bytes = count_frames(f, offset, file_size)
+                vbr = False
+        
+        if not total_samples or not sample_rate:
+            return None
+        
+        duration = total_samples / sample_rate
+        bitrate = int(round(audio_bytes * 8 / duration / 1000)) if duration else frame["bitrate"]
+        if not vbr:
+            bitrate = frame["bitrate"]
+        
+        return {
+            "duration": duration,
+            "bitrate": bitrate,
+            "size": file_size,
+            "sample_rate": sample_rate,
+            "vbr": vbr,
+        }
+    
+    except Exception as e:
+        logger.error(f"Error reading MP3 info from {path}: {str(e)}")
+        return None
+
+def format_duration(seconds):
+    """
+    Format a duration for itunes:duration
+    
+    Args:
+        seconds (float): Duration in seconds
+    
+    Returns:
+        str: Duration as HH:MM:SS
+    """
+    seconds = int(round(seconds or 0))
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
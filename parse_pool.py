@@ -0,0 +1,104 @@
+"""
+Process pool for CPU-bound feed parsing.
+
+Parsing is pure Python, so parsing many large feeds on threads would
+serialize on the GIL and stall the web requests served by the same gunicorn
+worker. Downloaded feeds are parsed in a bounded pool of worker processes
+instead, started with forkserver so they do not inherit the app's threads
+and locks. The fork server preloads rss, and neither it nor the workers
+import the app (see main.py). The pool is created on first use and
+reused, and is sized to the cores this process may run on. Small documents
+are parsed in the calling thread, where sending them to another process
+costs more than it saves.
+"""
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+def get_available_cores():
+    """Get the number of cores this process may run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+# Worker processes; 0 parses everything in the calling thread
+FEED_PARSE_WORKERS = int(os.environ.get("FEED_PARSE_WORKERS", str(get_available_cores())))
+
+# Documents smaller than this are parsed in the calling thread
+FEED_PARSE_INLINE_BYTES = int(os.environ.get("FEED_PARSE_INLINE_BYTES", str(64 * 1024)))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """
+    Get the shared worker pool, creating it on first use
+    
+    Returns:
+        ProcessPoolExecutor: The pool, or None if parsing runs in the calling thread
+    """
+    global _pool
+    
+    if FEED_PARSE_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            if context.get_start_method() == "forkserver":
+                # The server would import __main__ by default, which under `python main.py` is the app
+                context.set_forkserver_preload(["rss"])
+            _pool = ProcessPoolExecutor(max_workers=FEED_PARSE_WORKERS, mp_context=context)
+            logger.info(f"Started feed parse pool with {FEED_PARSE_WORKERS} worker(s)")
+        return _pool
+
+def reset_pool():
+    """Drop a pool whose worker died, so the next call starts a new one"""
+    global _pool
+    
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def run_inline(function, *args):
+    """
+    Call a function now and wrap its outcome in a finished future
+    
+    Returns:
+        Future: Future holding the result or the exception
+    """
+    future = Future()
+    try:
+        future.set_result(function(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def submit(function, content, *args):
+    """
+    Parse a document in the pool
+    
+    Args:
+        function: Module-level parse function, called as function(content, *args)
+        content (bytes): Document; small ones are parsed in the calling thread
+        *args: Further picklable arguments
+    
+    Returns:
+        Future: Future of the function's result
+    """
+    pool = get_pool() if len(content) >= FEED_PARSE_INLINE_BYTES else None
+    if pool is None:
+        return run_inline(function, content, *args)
+    try:
+        return pool.submit(function, content, *args)
+    except (BrokenProcessPool, RuntimeError) as e:
+        logger.warning(f"Feed parse pool is unavailable, parsing in this thread: {str(e)}")
+        reset_pool()
+        return run_inline(function, content, *args)
@@ -0,0 +1,78 @@
+import logging
+import xml.etree.ElementTree as ET
+from flask import url_for
+from mp3info import format_duration
+from feed_writer import itunes
+import image_variants
+import script_store
+
+logger = logging.getLogger(__name__)
+
+def generate_podcast_rss(podcast, episodes):
+    """
+    Generate the RSS feed for a podcast from its published episodes
+    
+    Enclosure sizes and durations come from the metadata stored on each
+    episode when its audio was generated, so the audio files are never read.
+    
+    Args:
+        podcast (Settings): Podcast settings
+        episodes (list): Published episodes, newest first
+    
+    Returns:
+        bytes: RSS XML document
+    """
+    root = ET.Element("rss", version="2.0")
+    channel = ET.SubElement(root, "channel")
+    
+    description = podcast.rss_description or podcast.podcast_description
+    ET.SubElement(channel, "title").text = podcast.podcast_title
+    ET.SubElement(channel, "description").text = description
+    ET.SubElement(channel, "link").text = url_for('podcast_rss', slug=podcast.rss_slug, _external=True)
+    ET.SubElement(channel, "language").text = podcast.podcast_language
+    if podcast.rss_copyright:
+        ET.SubElement(channel, "copyright").text = podcast.rss_copyright
+    if episodes:
+        ET.SubElement(channel, "lastBuildDate").text = episodes[0].date.strftime("%a, %d %b %Y %H:%M:%S GMT")
+    
+    # iTunes specific elements
+    ET.SubElement(channel, itunes("author")).text = podcast.podcast_author
+    ET.SubElement(channel, itunes("summary")).text = description
+    ET.SubElement(channel, itunes("category"), text=podcast.podcast_category)
+    ET.SubElement(channel, itunes("explicit")).text = "true" if podcast.podcast_explicit else "false"
+    
+    if podcast.rss_owner_name or podcast.rss_owner_email:
+        owner = ET.SubElement(channel, itunes("owner"))
+        if podcast.rss_owner_name:
+            ET.SubElement(owner, itunes("name")).text = podcast.rss_owner_name
+        if podcast.rss_owner_email:
+            ET.SubElement(owner, itunes("email")).text = podcast.rss_owner_email
+    
+    image_url = podcast.rss_image_url
+    if not image_url and podcast.cover_art_path:
+        # Directories need a square JPEG of 1400 to 3000px
+        image_url = url_for('static', filename=image_variants.get_directory_art(podcast.cover_art_path), _external=True)
+    if image_url:
+        ET.SubElement(channel, itunes("image"), href=image_url)
+    
+    # One query for all scripts instead of one per episode
+    scripts = script_store.get_scripts(episode.script_hash for episode in episodes if episode.publish_url and episode.script_hash)
+    
+    for episode in episodes:
+        if not episode.publish_url:
+            continue
+        
+        script = scripts.get(episode.script_hash, "") if episode.script_hash else episode.legacy_script or ""
+        summary = script[:200] + "..." if len(script) > 200 else script
+        
+        item = ET.SubElement(channel, "item")
+        ET.SubElement(item, "title").text = episode.title
+        ET.SubElement(item, "description").text = summary
+        ET.SubElement(item, "pubDate").text = episode.date.strftime("%a, %d %b %Y %H:%M:%S GMT")
+        ET.SubElement(item, "guid", isPermaLink="false").text = episode.publish_url
+        ET.SubElement(item, "enclosure", url=episode.publish_url, length=str(episode.audio_size or 0), type="audio/mpeg")
+        ET.SubElement(item, itunes("duration")).text = format_duration(episode.audio_duration)
+        ET.SubElement(item, itunes("summary")).text = summary
+    
+    logger.debug(f"Generated RSS for podcast {podcast.id} with {len(episodes)} episodes")
+    return ET.tostring(root, encoding="utf-8", xml_declaration=True)
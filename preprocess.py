@@ -0,0 +1,223 @@
+"""
+Article preprocessing before LLM calls.
+
+Feed content arrives as raw HTML with navigation, share buttons and
+"appeared first on" footers. prepare_article() turns it into plain text and
+cuts it to a per-model token budget so each summary request stays small.
+"""
+import os
+import re
+import html
+import logging
+from functools import lru_cache
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Input tokens allowed for one article's text, per model
+ARTICLE_TOKEN_BUDGETS = {
+    "gpt-3.5-turbo": 3000,
+    "gpt-4": 4000,
+    "gpt-4-turbo": 8000,
+    "gpt-4o": 8000,
+    "gpt-4o-mini": 8000,
+}
+DEFAULT_TOKEN_BUDGET = 3000
+
+# Rough characters per token for English text, used when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+DROP_BLOCKS = re.compile(
+    r"<(script|style|noscript|iframe|svg|form|nav|footer|aside|figure|button)\b[^>]*>.*?</\1\s*>",
+    re.IGNORECASE | re.DOTALL
+)
+COMMENTS = re.compile(r"<!--.*?-->", re.DOTALL)
+BLOCK_BREAKS = re.compile(r"<\s*(br|/p|/div|/li|/h[1-6]|/blockquote|/tr)\b[^>]*>", re.IGNORECASE)
+TAGS = re.compile(r"<[^>]+>")
+SPACES = re.compile(r"[ \t\r\f\v\xa0]+")
+BLANK_LINES = re.compile(r"\n\s*\n+")
+
+# Lines that are feed or site furniture rather than article text
+BOILERPLATE = re.compile(
+    r"^(the post .* appeared first on .*"
+    r"|this (article|post|story) (was )?(originally )?(appeared|published) (first )?(on|at|in) .*"
+    r"|originally published (on|at) .*"
+    r"|(continue|keep) reading.*"
+    r"|read (the )?(more|full (article|story)).*"
+    r"|(click|tap) here.*"
+    r"|share (this|on) .*"
+    r"|follow us on .*"
+    r"|(sign up|subscribe) (for|to) .*"
+    r"|advertisement"
+    r"|related( articles| stories| posts)?:?"
+    r"|(©|copyright( ©)?) ?\d{4}.*"
+    r"|all rights reserved.*"
+    r"|\[?(…|\.\.\.)\]?)$",
+    re.IGNORECASE
+)
+
+def strip_html(markup):
+    """
+    Convert HTML to plain text, keeping paragraph breaks
+    
+    Args:
+        markup (str): HTML or plain text
+    
+    Returns:
+        str: Plain text
+    """
+    if not markup:
+        return ""
+    if "<" in markup:
+        text = COMMENTS.sub(" ", markup)
+        text = DROP_BLOCKS.sub(" ", text)
+        text = BLOCK_BREAKS.sub("\n", text)
+        text = TAGS.sub(" ", text)
+    else:
+        text = markup
+    text = html.unescape(text)
+    text = SPACES.sub(" ", text)
+    return BLANK_LINES.sub("\n\n", text).strip()
+
+def remove_boilerplate(text):
+    """
+    Drop boilerplate lines and repeated lines
+    
+    Args:
+        text (str): Plain text
+    
+    Returns:
+        str: Text without boilerplate
+    """
+    kept = []
+    seen = set()
+    for line in text.split("\n"):
+        stripped = line.strip()
+        if stripped and (BOILERPLATE.match(stripped) or stripped in seen):
+            continue
+        seen.add(stripped)
+        kept.append(stripped)
+    return BLANK_LINES.sub("\n\n", "\n".join(kept)).strip()
+
+@lru_cache(maxsize=None)
+def get_encoder(model):
+    """
+    Get the tokenizer for a model, loaded once per process
+    
+    Args:
+        model (str): OpenAI model name
+    
+    Returns:
+        Encoding: tiktoken encoding, or None when unavailable
+    """
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # The encoding files are downloaded on first use and may be unreachable
+        logger.warning("Tokenizer for %s unavailable, estimating token counts: %s", model, e)
+        return None
+
+def get_token_budget(model):
+    """
+    Get the input token budget for one article
+    
+    Args:
+        model (str): OpenAI model name
+    
+    Returns:
+        int: Token budget
+    """
+    budget = os.environ.get("ARTICLE_TOKEN_BUDGET")
+    if budget:
+        return int(budget)
+    return ARTICLE_TOKEN_BUDGETS.get(model, DEFAULT_TOKEN_BUDGET)
+
+def count_tokens(text, model):
+    """
+    Count the tokens of a text
+    
+    Args:
+        text (str): Text
+        model (str): OpenAI model name
+    
+    Returns:
+        int: Token count (estimated without a tokenizer)
+    """
+    encoder = get_encoder(model)
+    if encoder is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoder.encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text, budget, model):
+    """
+    Cut a text to at most budget tokens, preferring to end on a sentence
+    
+    Args:
+        text (str): Text
+        budget (int): Maximum tokens
+        model (str): OpenAI model name
+    
+    Returns:
+        tuple: (text, original token count, reduced token count)
+    """
+    encoder = get_encoder(model)
+    if encoder is None:
+        original = (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        if original <= budget:
+            return text, original, original
+        cut = text[:budget * CHARS_PER_TOKEN]
+    else:
+        tokens = encoder.encode(text, disallowed_special=())
+        original = len(tokens)
+        if original <= budget:
+            return text, original, original
+        cut = encoder.decode(tokens[:budget])
+    
+    # Drop the trailing partial sentence unless that would lose too much
+    sentence_end = max(cut.rfind(". "), cut.rfind("! "), cut.rfind("? "), cut.rfind("\n"))
+    if sentence_end > len(cut) * 0.8:
+        cut = cut[:sentence_end + 1]
+    cut = cut.rstrip()
+    return cut, original, count_tokens(cut, model)
+
+def prepare_article(article, model="gpt-3.5-turbo", budget=None):
+    """
+    Clean an article's content and fit it into the model's token budget
+    
+    Args:
+        article (dict): Article dictionary with the raw content in 'summary'
+        model (str): OpenAI model the text is sent to
+        budget (int): Token budget, defaults to the model's budget
+    
+    Returns:
+        dict: Copy of the article with cleaned 'summary', 'tokens_original' and 'tokens_reduced'
+    """
+    raw = article.get("summary", "") or ""
+    text = remove_boilerplate(strip_html(raw))
+    if not text:
+        text = f"Article titled '{article.get('title', 'Untitled article')}'."
+    
+    text, _, reduced = truncate_to_tokens(text, budget or get_token_budget(model), model)
+    # The original count is of the raw content as it would have been sent
+    original = count_tokens(raw, model) if raw else reduced
+    
+    metrics.ARTICLE_TOKENS.labels("original").inc(original)
+    metrics.ARTICLE_TOKENS.labels("reduced").inc(reduced)
+    logger.debug("Prepared article '%s': %s -> %s tokens", article.get("title"), original, reduced)
+    
+    prepared = dict(article)
+    prepared["summary"] = text
+    prepared["tokens_original"] = original
+    prepared["tokens_reduced"] = reduced
+    return prepared
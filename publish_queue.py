@@ -0,0 +1,254 @@
+import os
+import logging
+import threading
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Episode status values used by the publish queue
+QUEUED_STATUS = "publish_queued"
+PUBLISHING_STATUS = "publishing"
+
+# Seconds after which a claim is taken to belong to a publisher that died mid-push
+PUBLISH_CLAIM_TIMEOUT = int(os.environ.get("PUBLISH_CLAIM_TIMEOUT", "1800"))
+
+# Seconds an auto-published episode waits for others to finish, so they are pushed together
+AUTO_PUBLISH_DELAY = int(os.environ.get("AUTO_PUBLISH_DELAY", "300"))
+
+# Auto-publishing podcasts' episodes dated within this many seconds before a flush are published
+AUTO_PUBLISH_WINDOW = 3600
+
+_flush_timer = None
+_flush_lock = threading.Lock()
+
+def get_github_settings():
+    """
+    Get GitHub settings from environment variables or database
+    
+    Returns:
+        tuple: (github_token, github_username, github_repo), missing values are None
+    """
+    import models
+    
+    settings = {}
+    for name in ("GITHUB_TOKEN", "GITHUB_USERNAME", "GITHUB_REPO"):
+        value = os.environ.get(name)
+        
+        # If not found in environment, check database
+        if not value:
+            api_key = models.ApiKey.query.filter_by(name=name).first()
+            if api_key:
+                value = api_key.value
+        
+        settings[name] = value
+    
+    return settings["GITHUB_TOKEN"], settings["GITHUB_USERNAME"], settings["GITHUB_REPO"]
+
+def queue_episodes(episode_ids):
+    """
+    Mark episodes with generated audio as pending publication
+    
+    Args:
+        episode_ids (list): Episode IDs to queue
+    
+    Returns:
+        int: Number of episodes queued
+    """
+    from app import db
+    import models
+    
+    queued = models.Episode.query.filter(
+        models.Episode.id.in_(episode_ids),
+        models.Episode.status == "audio_generated"
+    ).update({"status": QUEUED_STATUS}, synchronize_session=False)
+    db.session.commit()
+    
+    logger.info(f"Queued {queued} episode(s) for publishing")
+    return queued
+
+def queue_auto_publish_episodes(since):
+    """
+    Queue every episode with audio produced since a given time for podcasts
+    that have auto publishing enabled, e.g. everything the scheduler produced this hour
+    
+    Args:
+        since (datetime): Only episodes dated at or after this time are queued
+    
+    Returns:
+        int: Number of episodes queued
+    """
+    import models
+    
+    episode_ids = [
+        episode.id for episode in models.Episode.query.join(
+            models.Settings, models.Episode.podcast_id == models.Settings.id
+        ).filter(
+            models.Settings.auto_publish == True,
+            models.Episode.status == "audio_generated",
+            models.Episode.date >= since
+        ).all()
+    ]
+    
+    if not episode_ids:
+        return 0
+    return queue_episodes(episode_ids)
+
+def flush_auto_publish(app):
+    """
+    Queue the auto-publishing podcasts' new episodes and publish the whole queue in one push
+    
+    Args:
+        app: Flask application
+    """
+    global _flush_timer
+    
+    with _flush_lock:
+        _flush_timer = None
+    
+    with app.app_context():
+        try:
+            if queue_auto_publish_episodes(datetime.utcnow() - timedelta(seconds=AUTO_PUBLISH_WINDOW)) or get_queued_episodes():
+                success, result = publish_queued_episodes()
+                if not success:
+                    logger.error(f"Auto publishing failed, episodes stay queued: {result}")
+        except Exception as e:
+            logger.error(f"Error auto publishing episodes: {str(e)}")
+
+def schedule_auto_publish(app):
+    """
+    Flush the publish queue after AUTO_PUBLISH_DELAY, unless a flush is already due
+    
+    Called when an episode of an auto-publishing podcast has its audio, so
+    every episode finished within the delay (e.g. a morning's scheduled
+    podcasts) goes out in one commit and push.
+    
+    Args:
+        app: Flask application
+    """
+    global _flush_timer
+    
+    with _flush_lock:
+        if _flush_timer is not None:
+            return
+        _flush_timer = threading.Timer(AUTO_PUBLISH_DELAY, flush_auto_publish, args=(app,))
+        _flush_timer.daemon = True
+        _flush_timer.start()
+    logger.info(f"Auto publishing queued episodes in {AUTO_PUBLISH_DELAY} seconds")
+
+def requeue_stale_claims():
+    """
+    Put episodes claimed by a publisher that crashed or was killed back in the queue
+    
+    A claim is stale once the episode has been publishing for longer than
+    PUBLISH_CLAIM_TIMEOUT; the claim time is the episode's updated_at.
+    
+    Returns:
+        int: Number of episodes queued again
+    """
+    from app import db
+    import models
+    
+    requeued = models.Episode.query.filter(
+        models.Episode.status == PUBLISHING_STATUS,
+        models.Episode.updated_at < datetime.utcnow() - timedelta(seconds=PUBLISH_CLAIM_TIMEOUT)
+    ).update({"status": QUEUED_STATUS}, synchronize_session=False)
+    db.session.commit()
+    
+    if requeued:
+        logger.warning(f"Queued {requeued} episode(s) again whose publisher did not finish")
+    return requeued
+
+def get_queued_episodes(episode_ids=None):
+    """
+    Get episodes waiting in the publish queue, including stale claims
+    
+    Args:
+        episode_ids (list): Optional subset of episode IDs
+    
+    Returns:
+        list: Queued episodes, oldest first
+    """
+    import models
+    
+    requeue_stale_claims()
+    query = models.Episode.query.filter(models.Episode.status == QUEUED_STATUS)
+    if episode_ids:
+        query = query.filter(models.Episode.id.in_(episode_ids))
+    return query.order_by(models.Episode.date.asc()).all()
+
+def publish_queued_episodes(episode_ids=None, remote_url=None):
+    """
+    Publish queued episodes to GitHub Pages in a single commit and push
+    
+    The episodes are claimed first so a concurrent flush cannot publish them
+    twice. Episode rows are only marked as published, all in one transaction,
+    once the push succeeded; on failure they go back to the queue. Claims a
+    crashed publisher left behind go back to the queue after
+    PUBLISH_CLAIM_TIMEOUT.
+    
+    Args:
+        episode_ids (list): Optional subset of queued episode IDs to publish
+        remote_url (str): Optional repository URL overriding github.com
+    
+    Returns:
+        tuple: (success, {episode_id: url} or error message)
+    """
+    from app import db
+    import models
+    from gitpush import publish_episodes_to_github
+    
+    github_token, github_username, github_repo = get_github_settings()
+    if not github_token or not github_username or not github_repo:
+        return False, "GitHub settings not found! Please configure GitHub integration first."
+    
+    queued_ids = [episode.id for episode in get_queued_episodes(episode_ids)]
+    if not queued_ids:
+        return False, "No episodes are waiting to be published"
+    
+    # Claim the episodes one by one; another worker may have picked some of them up already
+    claimed_ids = []
+    for episode_id in queued_ids:
+        claimed = models.Episode.query.filter(
+            models.Episode.id == episode_id,
+            models.Episode.status == QUEUED_STATUS
+        ).update({"status": PUBLISHING_STATUS, "updated_at": datetime.utcnow()}, synchronize_session=False)
+        if claimed:
+            claimed_ids.append(episode_id)
+    db.session.commit()
+    
+    if not claimed_ids:
+        return False, "No episodes are waiting to be published"
+    
+    episodes = models.Episode.query.filter(
+        models.Episode.id.in_(claimed_ids)
+    ).order_by(models.Episode.date.asc()).all()
+    
+    success, result = publish_episodes_to_github(
+        episodes,
+        github_token,
+        github_username,
+        github_repo,
+        remote_url=remote_url
+    )
+    
+    try:
+        publish_date = datetime.now()
+        for episode in episodes:
+            if success:
+                episode.publish_url = result[episode.id]
+                episode.status = "published"
+                episode.publish_date = publish_date
+            else:
+                episode.status = QUEUED_STATUS
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error updating published episodes: {str(e)}")
+        raise
+    
+    if success:
+        logger.info(f"Published {len(episodes)} queued episode(s)")
+    else:
+        logger.error(f"Failed to publish queued episodes: {result}")
+    
+    return success, result
@@ -0,0 +1,325 @@
+"""
+Relevance ranking of candidate articles.
+
+rank_articles() decides which articles make an episode instead of simply
+taking the newest ones. Each candidate is scored with BM25 against the
+podcast's description and AI instructions, boosted when other sources
+cover the same story and slightly by recency. Articles are then picked
+one by one with Maximal Marginal Relevance, so a story covered by five
+feeds is summarized once and the rest of the budget goes to other topics.
+
+All scoring is vectorized with NumPy; only tokenization runs per article.
+"""
+import re
+import time
+import logging
+import itertools
+
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Words, keeping names like gpt-4o, node.js and c++ together (trailing dots are stripped later)
+TOKEN = re.compile(r"[a-z0-9][a-z0-9+#.-]*")
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have having
+he her here hers herself him himself his how i if in into is it its itself just me more most my myself new
+no nor not now of off on once only or other our ours ourselves out over own said same she should so some
+such than that the their theirs them themselves then there these they this those through to too under
+until up very was we were what when where which while who whom why will with would you your yours yourself
+yourselves podcast episode news today week latest article articles story stories read via one two get
+""".split())
+
+# Characters of an article's text used for ranking; the lead carries the topic
+RANK_TEXT_CHARS = 400
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Width of the hashed similarity vectors; comparing every pair of articles costs N x N x this
+SIMILARITY_DIMENSIONS = 256
+
+# Cosine similarity above which two articles are taken to cover the same story
+SAME_STORY_SIMILARITY = 0.45
+
+# Weights of the relevance score parts
+RELEVANCE_WEIGHT = 0.6
+COVERAGE_WEIGHT = 0.25
+RECENCY_WEIGHT = 0.15
+
+# MMR trade-off between relevance (1.0) and diversity (0.0)
+MMR_LAMBDA = 0.7
+
+# Rows of the similarity matrix computed at once when counting covering sources
+SIMILARITY_BLOCK = 512
+
+TAGS = re.compile(r"<[^>]+>")
+
+def tokenize(text):
+    """
+    Split text into lowercase terms (stopwords are dropped by build_term_counts)
+    
+    Args:
+        text (str): Text, may contain HTML
+    
+    Returns:
+        list: Terms
+    """
+    if not text:
+        return []
+    if "<" in text:
+        text = TAGS.sub(" ", text)
+    return TOKEN.findall(text.lower())
+
+def stem(term):
+    """
+    Reduce plural forms to the singular ("models" -> "model", "batteries" -> "battery")
+    
+    Args:
+        term (str): Lowercase term
+    
+    Returns:
+        str: Stem
+    """
+    term = term.rstrip(".-")
+    if len(term) > 4 and term.endswith("ies"):
+        return term[:-3] + "y"
+    if len(term) > 3 and term.endswith("s") and not term.endswith(("ss", "us", "is")):
+        return term[:-1]
+    return term
+
+def get_article_text(article):
+    """
+    Get the text an article is ranked by: its title (counted twice) and the start of its content
+    
+    Args:
+        article (dict): Article dictionary
+    
+    Returns:
+        str: Text
+    """
+    title = article.get('title') or ""
+    return f"{title} {title} {(article.get('summary') or '')[:RANK_TEXT_CHARS]}"
+
+def build_term_counts(documents):
+    """
+    Count the terms of every document
+    
+    Args:
+        documents (list): Term lists
+    
+    Returns:
+        tuple: (stem to term index dict, doc index array, term index array, count array,
+            document lengths, size of the term index range)
+    """
+    all_terms = list(itertools.chain.from_iterable(documents))
+    doc_ids = np.repeat(np.arange(len(documents), dtype=np.int64), [len(terms) for terms in documents])
+    
+    # A term's index is the position of its first occurrence; gaps in the index range are harmless
+    vocabulary = {}
+    term_ids = np.fromiter(map(vocabulary.setdefault, all_terms, itertools.count()), dtype=np.int64, count=len(all_terms))
+    
+    # Stemming and stopword removal per distinct term are much cheaper than per occurrence
+    stems = {}
+    stem_ids = np.full(max(1, len(all_terms)), -1, dtype=np.int64)
+    for term, term_id in vocabulary.items():
+        term = term.rstrip(".-")
+        if len(term) > 1 and term not in STOPWORDS:
+            stem_ids[term_id] = stems.setdefault(stem(term), term_id)
+    term_ids = stem_ids[term_ids]
+    kept = term_ids >= 0
+    doc_ids, term_ids = doc_ids[kept], term_ids[kept]
+    lengths = np.bincount(doc_ids, minlength=len(documents)).astype(np.float32)
+    
+    # One entry per (document, term) pair with its count
+    vocab_size = max(1, len(all_terms))
+    pairs, counts = np.unique(doc_ids * vocab_size + term_ids, return_counts=True)
+    return stems, pairs // vocab_size, pairs % vocab_size, counts.astype(np.float32), lengths, vocab_size
+
+def bm25_scores(query_terms, vocabulary, pair_docs, pair_terms, pair_counts, lengths, df):
+    """
+    Score every document against a query with BM25
+    
+    Args:
+        query_terms (list): Query terms
+        vocabulary (dict): Stem to term index
+        pair_docs, pair_terms, pair_counts: Term counts from build_term_counts
+        lengths (ndarray): Document lengths
+        df (ndarray): Document frequency per term
+    
+    Returns:
+        ndarray: Score per document
+    """
+    scores = np.zeros(len(lengths), dtype=np.float32)
+    query_ids = [vocabulary[term] for term in set(map(stem, query_terms)) if term in vocabulary]
+    if not query_ids or not len(pair_docs):
+        return scores
+    
+    doc_count = len(lengths)
+    idf = np.log1p((doc_count - df + 0.5) / (df + 0.5)).astype(np.float32)
+    average_length = lengths.mean() or 1.0
+    
+    mask = np.isin(pair_terms, query_ids)
+    docs = pair_docs[mask]
+    counts = pair_counts[mask]
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[docs] / average_length)
+    weights = idf[pair_terms[mask]] * counts * (BM25_K1 + 1) / (counts + norm)
+    return np.bincount(docs, weights=weights, minlength=doc_count).astype(np.float32)
+
+def similarity_vectors(pair_docs, pair_terms, pair_counts, df, doc_count):
+    """
+    Build L2-normalized TF-IDF vectors for comparing articles with each other
+    
+    Terms are hashed into SIMILARITY_DIMENSIONS signed buckets, which keeps
+    cosine similarities close to the exact ones while making the article x
+    article comparison cheap enough for thousands of candidates.
+    
+    Args:
+        pair_docs, pair_terms, pair_counts: Term counts from build_term_counts
+        df (ndarray): Document frequency per term
+        doc_count (int): Number of documents
+    
+    Returns:
+        ndarray: doc_count x SIMILARITY_DIMENSIONS matrix (float32)
+    """
+    # A term in a single document cannot make two documents similar
+    keep = df[pair_terms] >= 2
+    docs = pair_docs[keep]
+    terms = pair_terms[keep]
+    
+    # Fixed seed: the same term lands in the same bucket on every call
+    rng = np.random.default_rng(0)
+    buckets = rng.integers(0, SIMILARITY_DIMENSIONS, size=len(df))
+    signs = rng.choice(np.array([-1.0, 1.0], dtype=np.float32), size=len(df))
+    
+    idf = np.log((1 + doc_count) / (1 + df[terms])) + 1
+    weights = (1 + np.log(pair_counts[keep])) * idf * signs[terms]
+    flat = np.bincount(docs * SIMILARITY_DIMENSIONS + buckets[terms], weights=weights,
+                       minlength=doc_count * SIMILARITY_DIMENSIONS)
+    vectors = flat.reshape(doc_count, SIMILARITY_DIMENSIONS).astype(np.float32)
+    
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+def count_covering_sources(vectors, sources):
+    """
+    Count for each article how many other sources have a similar article
+    
+    Args:
+        vectors (ndarray): Normalized similarity vectors
+        sources (list): Source name per article
+    
+    Returns:
+        ndarray: Number of other sources per article
+    """
+    source_ids = {}
+    source_index = np.asarray([source_ids.setdefault(source, len(source_ids)) for source in sources], dtype=np.int64)
+    one_hot = np.zeros((len(sources), len(source_ids)), dtype=np.float32)
+    one_hot[np.arange(len(sources)), source_index] = 1
+    
+    covering = np.zeros(len(sources), dtype=np.float32)
+    for start in range(0, len(sources), SIMILARITY_BLOCK):
+        block = vectors[start:start + SIMILARITY_BLOCK]
+        same_story = (block @ vectors.T >= SAME_STORY_SIMILARITY).astype(np.float32)
+        sources_seen = (same_story @ one_hot) > 0
+        # The article's own source does not count
+        sources_seen[np.arange(len(block)), source_index[start:start + len(block)]] = False
+        covering[start:start + len(block)] = sources_seen.sum(axis=1)
+    return covering
+
+def recency_scores(articles):
+    """
+    Score articles by age, 1.0 for the newest and 0.0 for the oldest
+    
+    Args:
+        articles (list): Article dictionaries with ISO 'published' dates
+    
+    Returns:
+        ndarray: Score per article
+    """
+    # ISO dates of the same format sort like the times they stand for
+    published = np.asarray([article.get('published') or "" for article in articles])
+    order = np.argsort(published, kind="stable")
+    scores = np.empty(len(articles), dtype=np.float32)
+    scores[order] = np.arange(len(articles), dtype=np.float32)
+    return scores / max(1, len(articles) - 1)
+
+def select_mmr(relevance, vectors, limit, diversity_lambda=MMR_LAMBDA):
+    """
+    Pick articles by Maximal Marginal Relevance
+    
+    Args:
+        relevance (ndarray): Relevance per article, between 0 and 1
+        vectors (ndarray): Normalized similarity vectors
+        limit (int): Number of articles to pick
+        diversity_lambda (float): Weight of relevance against redundancy
+    
+    Returns:
+        list: Indexes of the picked articles in pick order
+    """
+    picked = []
+    max_similarity = np.zeros(len(relevance), dtype=np.float32)
+    available = np.ones(len(relevance), dtype=bool)
+    
+    for _ in range(min(limit, len(relevance))):
+        marginal = diversity_lambda * relevance - (1 - diversity_lambda) * max_similarity
+        marginal[~available] = -np.inf
+        choice = int(np.argmax(marginal))
+        picked.append(choice)
+        available[choice] = False
+        np.maximum(max_similarity, vectors @ vectors[choice], out=max_similarity)
+    return picked
+
+def rank_articles(articles, query_text="", limit=None, diversity_lambda=MMR_LAMBDA):
+    """
+    Choose the most relevant and diverse articles for an episode
+    
+    Args:
+        articles (list): Candidate article dictionaries
+        query_text (str): What the podcast is about, e.g. its description and AI instructions
+        limit (int): Number of articles to return, defaults to all
+        diversity_lambda (float): MMR weight of relevance against redundancy
+    
+    Returns:
+        list: Copies of the chosen articles in ranked order, with 'rank_score'
+            and 'covering_sources'
+    """
+    if not articles:
+        return []
+    limit = len(articles) if limit is None else limit
+    
+    with metrics.track_stage("rank_articles"):
+        started = time.perf_counter()
+        documents = [tokenize(get_article_text(article)) for article in articles]
+        vocabulary, pair_docs, pair_terms, pair_counts, lengths, vocab_size = build_term_counts(documents)
+        df = np.bincount(pair_terms, minlength=vocab_size).astype(np.float32)
+        
+        relevance = bm25_scores(tokenize(query_text), vocabulary, pair_docs, pair_terms, pair_counts, lengths, df)
+        if relevance.max() > 0:
+            relevance /= relevance.max()
+        
+        vectors = similarity_vectors(pair_docs, pair_terms, pair_counts, df, len(articles))
+        covering = count_covering_sources(vectors, [article.get('source') for article in articles])
+        coverage = covering / covering.max() if covering.max() > 0 else covering
+        
+        score = RELEVANCE_WEIGHT * relevance + COVERAGE_WEIGHT * coverage + RECENCY_WEIGHT * recency_scores(articles)
+        picked = select_mmr(score, vectors, limit, diversity_lambda)
+    
+    logger.info(
+        "Ranked %s candidate articles in %.1f ms, picked %s",
+        len(articles), (time.perf_counter() - started) * 1000, len(picked)
+    )
+    
+    ranked = []
+    for index in picked:
+        article = dict(articles[index])
+        article['rank_score'] = round(float(score[index]), 4)
+        article['covering_sources'] = int(covering[index])
+        ranked.append(article)
+    return ranked
@@ -0,0 +1,264 @@
+"""
+Client-side rate limiting for the OpenAI and ElevenLabs APIs.
+
+Each provider and API key gets a token bucket whose state lives in a small
+JSON file under RATE_LIMIT_DIR, updated under an exclusive file lock, so all
+threads and all gunicorn workers draw from the same bucket. The bucket
+follows what the API reports: a 429's Retry-After (or x-ratelimit-reset-*)
+pauses every caller until the reset, and x-ratelimit-limit/remaining-requests
+headers adjust the rate. Failed calls are retried with jittered exponential
+backoff; when the attempts run out RetriesExhausted is raised.
+"""
+import os
+import re
+import json
+import time
+import fcntl
+import random
+import hashlib
+import logging
+from email.utils import parsedate_to_datetime
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_DIR = os.environ.get("RATE_LIMIT_DIR", os.path.join("storage", "ratelimit"))
+
+# Requests per minute allowed before the API has told us its actual limit
+DEFAULT_RPM = {
+    "openai": int(os.environ.get("RATE_LIMIT_OPENAI_RPM", "500")),
+    "elevenlabs": int(os.environ.get("RATE_LIMIT_ELEVENLABS_RPM", "60")),
+}
+
+# Longest a caller waits for a token before giving up
+MAX_WAIT = float(os.environ.get("RATE_LIMIT_MAX_WAIT", "300"))
+
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+
+class RetriesExhausted(Exception):
+    """An API call still failed after all retry attempts"""
+    
+    def __init__(self, provider, attempts, last_error):
+        super().__init__(f"{provider} request failed after {attempts} attempts: {last_error}")
+        self.provider = provider
+        self.attempts = attempts
+        self.last_error = last_error
+
+def get_bucket_path(provider, api_key):
+    """
+    Get the state file of a provider/key bucket (the key itself is never written)
+    
+    Args:
+        provider (str): openai or elevenlabs
+        api_key (str): API key
+    
+    Returns:
+        str: Path of the JSON state file
+    """
+    key_hash = hashlib.sha256((api_key or "").encode()).hexdigest()[:16]
+    return os.path.join(RATE_LIMIT_DIR, f"{provider}-{key_hash}.json")
+
+def update_bucket(provider, api_key, change):
+    """
+    Read, change and write a bucket's state while holding its file lock
+    
+    Args:
+        provider (str): openai or elevenlabs
+        api_key (str): API key
+        change (callable): Receives the refilled state dict and the current
+            time, modifies the state in place and returns a result
+    
+    Returns:
+        The result of change()
+    """
+    os.makedirs(RATE_LIMIT_DIR, exist_ok=True)
+    path = get_bucket_path(provider, api_key)
+    
+    with open(path, "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        try:
+            state = json.loads(f.read() or "{}")
+        except ValueError:
+            state = {}
+        
+        now = time.time()
+        rpm = state.get("rpm") or DEFAULT_RPM.get(provider, 60)
+        rate = rpm / 60.0
+        capacity = max(1.0, rpm / 10.0)
+        tokens = state.get("tokens", capacity)
+        updated = state.get("updated", now)
+        state["rpm"] = rpm
+        state["tokens"] = min(capacity, tokens + (now - updated) * rate)
+        state["updated"] = now
+        state.setdefault("blocked_until", 0)
+        
+        result = change(state, now)
+        
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps(state))
+        return result
+
+def acquire(provider, api_key, max_wait=MAX_WAIT):
+    """
+    Wait until the bucket allows one more request and take its token
+    
+    Args:
+        provider (str): openai or elevenlabs
+        api_key (str): API key
+        max_wait (float): Seconds to wait at most
+    
+    Returns:
+        float: Seconds spent waiting
+    """
+    def take(state, now):
+        if state["blocked_until"] > now:
+            return state["blocked_until"] - now
+        if state["tokens"] >= 1:
+            state["tokens"] -= 1
+            return 0
+        return (1 - state["tokens"]) / (state["rpm"] / 60.0)
+    
+    waited = 0.0
+    while True:
+        wait = update_bucket(provider, api_key, take)
+        if wait <= 0:
+            if waited:
+                logger.debug("Waited %.2fs for a %s rate limit token", waited, provider)
+            return waited
+        if waited + wait > max_wait:
+            raise RetriesExhausted(provider, 0, f"rate limit wait of {waited + wait:.0f}s exceeds {max_wait:.0f}s")
+        # A little jitter so waiting workers do not wake up in lockstep
+        wait += random.uniform(0, min(0.25, wait / 4))
+        time.sleep(wait)
+        waited += wait
+
+def parse_duration(value):
+    """
+    Parse a Retry-After or x-ratelimit-reset value
+    
+    Accepts seconds ("20"), OpenAI style durations ("1s", "6m0s", "250ms")
+    and HTTP dates.
+    
+    Args:
+        value (str): Header value
+    
+    Returns:
+        float: Seconds, or None if the value cannot be parsed
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    
+    parts = DURATION_PART.findall(value)
+    if parts:
+        scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(number) * scale[unit] for number, unit in parts)
+    
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def observe_response(provider, api_key, status_code, headers):
+    """
+    Adapt the bucket to an API response's status and rate limit headers
+    
+    Args:
+        provider (str): openai or elevenlabs
+        api_key (str): API key
+        status_code (int): HTTP status
+        headers (Mapping): Response headers (case-insensitive)
+    
+    Returns:
+        float: Seconds the API asked us to wait, or None
+    """
+    headers = headers or {}
+    retry_after = parse_duration(headers.get("retry-after")) if status_code == 429 else None
+    reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+    limit = headers.get("x-ratelimit-limit-requests")
+    remaining = headers.get("x-ratelimit-remaining-requests")
+    
+    def adapt(state, now):
+        pause = None
+        if status_code == 429:
+            pause = retry_after if retry_after is not None else reset
+            if pause is None:
+                # No hint from the API; back off for a share of the bucket's refill time
+                pause = min(BACKOFF_CAP, max(1.0, 60.0 / state["rpm"] * 5))
+            state["tokens"] = 0
+        elif remaining is not None and remaining.isdigit():
+            state["tokens"] = min(state["tokens"], float(remaining))
+            if int(remaining) == 0 and reset:
+                pause = reset
+        
+        if limit is not None and limit.isdigit() and int(limit) > 0:
+            state["rpm"] = int(limit)
+        
+        if pause:
+            state["blocked_until"] = max(state["blocked_until"], now + pause)
+        return pause
+    
+    pause = update_bucket(provider, api_key, adapt)
+    if status_code == 429:
+        logger.warning("%s rate limited, pausing requests for %.1fs", provider, pause)
+    return pause
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """
+    Jittered exponential backoff ("full jitter")
+    
+    Args:
+        attempt (int): Number of failed attempts so far, starting at 1
+        base (float): Delay scale in seconds
+        cap (float): Longest delay in seconds
+    
+    Returns:
+        float: Seconds to sleep
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def call_with_retries(provider, api_key, func, classify, max_attempts=5):
+    """
+    Call an API through the rate limiter, retrying transient failures
+    
+    Args:
+        provider (str): openai or elevenlabs
+        api_key (str): API key
+        func (callable): Makes one request and returns its result
+        classify (callable): Maps an exception raised by func to
+            (retryable, status_code, headers)
+        max_attempts (int): Attempts before RetriesExhausted is raised
+    
+    Returns:
+        The result of func()
+    """
+    for attempt in range(1, max_attempts + 1):
+        acquire(provider, api_key)
+        try:
+            return func()
+        except Exception as e:
+            retryable, status_code, headers = classify(e)
+            if status_code is not None:
+                observe_response(provider, api_key, status_code, headers)
+            if not retryable:
+                raise
+            if attempt == max_attempts:
+                raise RetriesExhausted(provider, attempt, e) from e
+            
+            reason = f"http_{status_code}" if status_code else type(e).__name__
+            metrics.record_retry(provider, reason)
+            delay = backoff_delay(attempt)
+            logger.info("Retrying %s request in %.1fs after %s (attempt %s of %s)", provider, delay, reason, attempt + 1, max_attempts)
+            time.sleep(delay)
@@ -1,138 +1,536 @@
 import os
-import json
+import re
 import feedparser
 import logging
+import time
+import calendar
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
-from time import mktime
 from urllib.parse import urlparse
 
-def fetch_rss_feeds(feed_urls, max_articles_per_feed=15, time_frame='today'):
+import metrics
+import article_store
+import feed_health
+import feed_transport
+import feed_stream
+import parse_pool
+import websub
+
+logger = logging.getLogger(__name__)
+
+# Entries per batch when deciding whether to stop reading a sorted feed
+STREAM_BATCH_SIZE = 10
+
+# Most entries read from one download of a feed sorted newest first
+FEED_MAX_ENTRIES = int(os.environ.get("FEED_MAX_ENTRIES", "100"))
+
+# An entry this many seconds newer than the one before it means the feed is not sorted newest first
+ORDER_TOLERANCE = 3600
+
+class FeedParseError(Exception):
+    """A downloaded feed is not a valid RSS or Atom document"""
+
+def get_cutoff_date(time_frame='today', now=None):
+    """
+    Get the earliest publish time a time frame includes
+    
+    Args:
+        time_frame (str): 'today', 'week' or 'month'
+        now (datetime): Reference time, defaults to now
+        
+    Returns:
+        datetime: Cutoff date
+    """
+    now = now or datetime.now()
+    if time_frame == 'week':
+        return now - timedelta(days=7)
+    elif time_frame == 'month':
+        return now - timedelta(days=30)
+    # Default to today
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def parse_blocked_terms(blocked_terms):
+    """
+    Parse a podcast's blocked terms setting
+    
+    Args:
+        blocked_terms (str): Terms separated by commas or new lines
+        
+    Returns:
+        list: Lowercase terms
+    """
+    if not blocked_terms:
+        return []
+    return [term.strip().lower() for term in re.split(r"[,\n]", blocked_terms) if term.strip()]
+
+def is_blocked(article, terms):
+    """
+    Check whether an article's title or content mentions a blocked term
+    
+    Args:
+        article (ArticleRecord): Article
+        terms (list): Lowercase blocked terms
+        
+    Returns:
+        bool: True if the article should be left out
+    """
+    text = f"{article.title} {article.summary}".lower()
+    return any(term in text for term in terms)
+
+def get_entry_published(entry):
+    """
+    Get an entry's publish time
+    
+    Args:
+        entry: feedparser entry
+        
+    Returns:
+        int: Publish time in UTC epoch seconds, or the current time when the entry has none
+    """
+    # feedparser's parsed dates are UTC; mktime would read them as local time
+    if hasattr(entry, 'published_parsed') and entry.published_parsed:
+        return calendar.timegm(entry.published_parsed)
+    elif hasattr(entry, 'updated_parsed') and entry.updated_parsed:
+        return calendar.timegm(entry.updated_parsed)
+    
+    # If no date available, use current time; the entry is only stored once, so it keeps it
+    logger.warning(f"No date found for article: {entry.title if hasattr(entry, 'title') else 'Unknown'}, using current time")
+    return int(time.time())
+
+def get_entry_content(entry, feed_title):
+    """
+    Get an entry's content with improved handling
+    
+    Args:
+        entry: feedparser entry
+        feed_title (str): Title of the feed, for entries without content
+        
+    Returns:
+        str: Content (usually HTML)
+    """
+    content = ''
+    
+    # Try multiple content sources in order of preference
+    if hasattr(entry, 'content') and entry.content:
+        content = entry.content[0].value
+    elif hasattr(entry, 'summary_detail') and entry.summary_detail:
+        content = entry.summary_detail.value
+    elif hasattr(entry, 'summary'):
+        content = entry.summary
+    elif hasattr(entry, 'description'):
+        content = entry.description
+    
+    # If we still have no content, create a minimal entry
+    if not content.strip():
+        content = f"Article titled '{entry.title}' from {feed_title}. Visit {entry.link} for more information."
+    return content
+
+def read_parsed_entries(feed, domain):
+    """
+    Get the entries of a feed parsed in full by feedparser
+    
+    Args:
+        feed: feedparser result
+        domain (str): Feed host, the source name if the feed has no title
+        
+    Returns:
+        tuple: (number of entries read, ArticleRecords)
+    """
+    feed_title = feed.feed.title if hasattr(feed, 'feed') and hasattr(feed.feed, 'title') else domain
+    
+    # Entries need a link to be stored
+    entries = [entry for entry in feed.entries if entry.get('link')]
+    articles = [article_store.ArticleRecord(
+        title=entry.get('title') or 'Untitled article',
+        link=entry.link,
+        published=get_entry_published(entry),
+        source=feed_title,
+        summary=get_entry_content(entry, feed_title),
+        guid=entry.get('id'),
+    ) for entry in entries]
+    return len(entries), articles
+
+def read_streamed_entries(content, domain, known_keys, known_guids, cutoff):
+    """
+    Get the entries of a feed that are not known yet, reading it incrementally
+    
+    In a feed sorted newest first, reading stops at the first batch of
+    STREAM_BATCH_SIZE entries without an unknown entry inside the cutoff, or
+    after FEED_MAX_ENTRIES entries; a feed that turns out to be unsorted is
+    read to the end.
+    
+    Args:
+        content (bytes): Feed document
+        domain (str): Feed host, the source name if the feed has no title
+        known_keys (set): Article keys of the feed's newest archived entries
+        known_guids (set): GUIDs of the feed's newest archived entries
+        cutoff (int): Entries published before this (UTC epoch seconds) are skipped
+        
+    Returns:
+        tuple: (number of entries read, ArticleRecords)
+        
+    Raises:
+        feed_stream.UnsupportedFeed: The feed has to be parsed with feedparser
+    """
+    articles = []
+    read = 0
+    in_batch = 0
+    batch_has_new = False
+    ordered = True
+    previous = None
+    
+    for article in feed_stream.iter_entries(content, domain):
+        if not article.link:
+            continue
+        read += 1
+        in_batch += 1
+        published = article.published
+        if published is not None:
+            if previous and published > previous + ORDER_TOLERANCE:
+                ordered = False
+            previous = published
+        
+        known = article_store.article_key(article.link) in known_keys or article.guid in known_guids
+        if not known and (published is None or published >= cutoff):
+            if published is None:
+                article.published = int(time.time())
+            if not article.summary:
+                article.summary = f"Article titled '{article.title}' from {article.source}. Visit {article.link} for more information."
+            articles.append(article)
+            batch_has_new = True
+        
+        if in_batch == STREAM_BATCH_SIZE:
+            if ordered and (not batch_has_new or read >= FEED_MAX_ENTRIES):
+                break
+            in_batch = 0
+            batch_has_new = False
+    return read, articles
+
+def parse_feed_content(content, feed_url, headers, known_keys, known_guids, cutoff):
+    """
+    Parse a downloaded feed into ArticleRecords
+    
+    Runs in the parse pool (see parse_pool.py), so it must not use the
+    database; the caller removes entries the archive already has.
+    
+    Args:
+        content (bytes): Feed document
+        feed_url (str): RSS feed URL
+        headers (dict): Response headers for feedparser
+        known_keys (set): Article keys of the feed's newest archived entries
+        known_guids (set): GUIDs of the feed's newest archived entries
+        cutoff (int): Streamed entries published before this (UTC epoch seconds) are skipped
+        
+    Returns:
+        tuple: (number of entries read, ArticleRecords, error message or None)
+    """
+    domain = urlparse(feed_url).netloc
+    try:
+        return read_streamed_entries(content, domain, known_keys, known_guids, cutoff) + (None,)
+    except feed_stream.UnsupportedFeed:
+        # Malformed or unusual documents get feedparser's lenient full parse
+        pass
+    
+    feed = feedparser.parse(content, response_headers=headers)
+    if feed.bozo:
+        return 0, [], f"{type(feed.bozo_exception).__name__}: {feed.bozo_exception}"
+    return read_parsed_entries(feed, domain) + (None,)
+
+def submit_download(download, cutoff):
+    """
+    Start parsing a downloaded feed in the parse pool
+    
+    Args:
+        download (FeedDownload): Successful result of feed_transport.fetch_feed
+        cutoff (int): Streamed entries published before this (UTC epoch seconds) are skipped
+        
+    Returns:
+        tuple: (future of parse_feed_content, its arguments)
+    """
+    known_keys, known_guids = article_store.get_recent_keys(download.feed_url, FEED_MAX_ENTRIES)
+    args = (download.content, download.feed_url, download.headers, known_keys, known_guids, cutoff)
+    return parse_pool.submit(parse_feed_content, *args), args
+
+def get_parse_result(future, args):
+    """
+    Wait for a parse, parsing in this thread instead if a pool worker died
+    
+    Args:
+        future (Future): Future of parse_feed_content
+        args (tuple): Arguments the future was submitted with
+        
+    Returns:
+        tuple: Result of parse_feed_content
+    """
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        parse_pool.reset_pool()
+        return parse_feed_content(*args)
+
+def store_new_articles(feed_url, articles):
+    """
+    Store the parsed articles the archive does not have yet
+    
+    Args:
+        feed_url (str): RSS feed URL
+        articles (list): ArticleRecords
+        
+    Returns:
+        int: Number of articles stored
+    """
+    # Only the newest archived entries were known to the parser
+    unseen = article_store.find_unseen(feed_url, [(article.guid, article.link) for article in articles])
+    return article_store.store_articles(feed_url, [articles[index] for index in unseen])
+
+def store_parsed(download, future, args, fetch_started):
+    """
+    Store the new entries of a parsed feed
+    
+    The outcome updates the feed's health (see feed_health.py).
+    
+    Args:
+        download (FeedDownload): Result of feed_transport.fetch_feed
+        future (Future): Future of parse_feed_content, None if the download failed
+        args (tuple): Arguments the future was submitted with
+        fetch_started (float): time.perf_counter() value when the fetch began
+        
+    Returns:
+        int: Number of new articles, or None if the feed could not be fetched
+    """
+    feed_url = download.feed_url
+    try:
+        if download.error is not None:
+            raise download.error
+        
+        entry_count, articles, error = get_parse_result(future, args)
+        if error:
+            logger.warning(f"Error parsing feed {feed_url}: {error}")
+            metrics.observe_stage("feed_fetch", fetch_started, "error")
+            parse_error = FeedParseError(error)
+            metrics.record_error("feed_fetch", parse_error)
+            feed_health.record_fetch(feed_url, download.seconds, error=parse_error)
+            return None
+        
+        stored = store_new_articles(feed_url, articles)
+        metrics.observe_stage("feed_fetch", fetch_started)
+        feed_health.record_fetch(feed_url, download.seconds)
+        websub.record_hub(feed_url, download.content, download.headers)
+        logger.info(f"Fetched {feed_url}: {entry_count} entries read, {stored} new")
+        return stored
+        
+    except Exception as e:
+        metrics.observe_stage("feed_fetch", fetch_started, "error")
+        metrics.record_error("feed_fetch", e)
+        logger.error(f"Error fetching feed {feed_url}: {str(e)}")
+        feed_health.record_fetch(feed_url, download.seconds, error=e)
+        return None
+
+def ingest_feeds(feed_urls):
+    """
+    Fetch feeds and store the entries the archive has not seen yet
+    
+    Feeds are downloaded concurrently and each one is handed to the parse
+    pool as soon as its download finishes; parsed feeds are stored in the
+    order they complete.
+    
+    Args:
+        feed_urls (list): RSS feed URLs
+        
+    Returns:
+        dict: URL to number of new articles, None for feeds that could not be fetched
+    """
+    cutoff = int(get_cutoff_date('month').timestamp())
+    results = {}
+    parsing = {}
+    for download in feed_transport.fetch_feeds(feed_urls):
+        fetch_started = time.perf_counter() - download.seconds
+        if download.error is not None:
+            results[download.feed_url] = store_parsed(download, None, None, fetch_started)
+            continue
+        future, args = submit_download(download, cutoff)
+        parsing[future] = (download, args, fetch_started)
+    
+    for future in as_completed(parsing):
+        download, args, fetch_started = parsing[future]
+        results[download.feed_url] = store_parsed(download, future, args, fetch_started)
+    return results
+
+def ingest_content(feed_url, content, headers=None):
+    """
+    Store the new entries of a feed document that was pushed instead of fetched
+    
+    Used for WebSub deliveries (see websub.py); unlike a fetch, it does not
+    count towards the feed's health.
+    
+    Args:
+        feed_url (str): RSS feed URL the entries are stored under
+        content (bytes): Feed document
+        headers (dict): Headers for feedparser
+        
+    Returns:
+        int: Number of new articles, or None if the document could not be parsed
+    """
+    download = feed_transport.FeedDownload(feed_url, content, headers or {}, 0.0, None)
+    try:
+        future, args = submit_download(download, int(get_cutoff_date('month').timestamp()))
+        _, articles, error = get_parse_result(future, args)
+        if error:
+            logger.warning(f"Error parsing pushed content of feed {feed_url}: {error}")
+            return None
+        return store_new_articles(feed_url, articles)
+    except Exception as e:
+        logger.error(f"Error storing pushed content of feed {feed_url}: {str(e)}")
+        return None
+
+def ingest_feed(feed_url):
+    """
+    Fetch one feed and store the entries the archive has not seen yet
+    
+    Args:
+        feed_url (str): RSS feed URL
+        
+    Returns:
+        int: Number of new articles, or None if the feed could not be fetched
+    """
+    return ingest_feeds([feed_url]).get(feed_url)
+
+def get_stale_feeds(feed_urls, max_age, now=None, health=None):
+    """
+    Get the feeds whose archived entries were last refreshed too long ago
+    
+    A feed polled less often than max_age because it rarely publishes is
+    only stale once its own polling interval has passed, and a feed whose
+    WebSub hub pushes its entries only after the fallback polling interval.
+    
+    Args:
+        feed_urls (list): RSS feed URLs
+        max_age (timedelta): Longest time since the last successful fetch
+        now (datetime): Reference time (UTC), defaults to now
+        health (dict): URL to FeedHealth, looked up when not given
+        
+    Returns:
+        list: Feed URLs that need a live fetch, in the given order
+    """
+    import models
+    from sqlalchemy import func
+    
+    if not feed_urls:
+        return []
+    now = now or datetime.utcnow()
+    
+    # The same URL can be configured for several podcasts; any recent fetch counts
+    fetched = dict(models.RssFeed.query.with_entities(
+        models.RssFeed.url, func.max(models.RssFeed.last_fetched)
+    ).filter(models.RssFeed.url.in_(list(feed_urls))).group_by(models.RssFeed.url).all())
+    if health is None:
+        health = feed_health.get_health(feed_urls)
+    pushed = websub.get_pushed_feeds(feed_urls, now)
+    
+    stale = []
+    for url in feed_urls:
+        allowed = max_age
+        if url in health and health[url].poll_interval:
+            allowed = max(max_age, timedelta(seconds=health[url].poll_interval))
+        if url in pushed:
+            allowed = max(allowed, timedelta(seconds=websub.WEBSUB_FALLBACK_INTERVAL))
+        if not fetched.get(url) or now - fetched[url] > allowed:
+            stale.append(url)
+    return stale
+
+def mark_feeds_fetched(feed_urls, when=None):
+    """
+    Set last_fetched of every configured feed with one of the given URLs
+    
+    Args:
+        feed_urls (list): RSS feed URLs that were fetched successfully
+        when (datetime): Fetch time (UTC), defaults to now
+    """
+    from app import db
+    import models
+    
+    if not feed_urls:
+        return
+    models.RssFeed.query.filter(models.RssFeed.url.in_(list(feed_urls))).update(
+        {"last_fetched": when or datetime.utcnow()}, synchronize_session=False
+    )
+    db.session.commit()
+
+def fetch_rss_feeds(feed_urls, max_articles_per_feed=15, time_frame='today', blocked_terms=None, max_age=None):
     """
     Fetch articles from multiple RSS feed URLs with time frame filtering
     
+    New entries are added to the article archive, and the result is read
+    from the archive, so articles that have dropped out of a feed still
+    count for weekly and monthly time frames. With max_age, feeds that the
+    background ingestion (see ingest.py) refreshed recently are not fetched
+    again. Feeds whose circuit is open after repeated failures are read
+    from the archive only, until their next probe is due.
+    
     Args:
         feed_urls (list): List of RSS feed URLs
         max_articles_per_feed (int): Maximum number of articles to fetch per feed
         time_frame (str): Time frame for filtering articles ('today', 'week', 'month')
+        blocked_terms (str): Comma separated terms; articles mentioning one are left out
+        max_age (timedelta): Only fetch feeds last fetched longer ago than this, None fetches all
         
     Returns:
-        list: List of article dictionaries
+        list: List of article dictionaries, newest first
     """
-    logging.info(f"Fetching RSS feeds: {feed_urls} with time frame: {time_frame} and max_articles_per_feed: {max_articles_per_feed}")
-    all_articles = []
+    logger.info(f"Fetching RSS feeds: {feed_urls} with time frame: {time_frame} and max_articles_per_feed: {max_articles_per_feed}")
     
     # Calculate the cutoff date based on time_frame
-    now = datetime.now()
-    if time_frame == 'today':
-        cutoff_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    elif time_frame == 'week':
-        cutoff_date = now - timedelta(days=7)
-    elif time_frame == 'month':
-        cutoff_date = now - timedelta(days=30)
-    else:
-        cutoff_date = now.replace(hour=0, minute=0, second=0, microsecond=0)  # Default to today
-    
-    logging.info(f"Using cutoff date: {cutoff_date.isoformat()} for time frame: {time_frame}")
-    
-    for feed_url in feed_urls:
-        try:
-            feed = feedparser.parse(feed_url)
-            
-            if feed.bozo:
-                logging.warning(f"Error parsing feed {feed_url}: {feed.bozo_exception}")
-                continue
-                
-            domain = urlparse(feed_url).netloc
-            feed_title = feed.feed.title if hasattr(feed, 'feed') and hasattr(feed.feed, 'title') else domain
-            
-            # Get articles from feed
-            articles = []
-            for entry in feed.entries:
-                published_time = None
-                
-                # Try to get published time in different formats
-                if hasattr(entry, 'published_parsed') and entry.published_parsed:
-                    published_time = datetime.fromtimestamp(mktime(entry.published_parsed))
-                elif hasattr(entry, 'updated_parsed') and entry.updated_parsed:
-                    published_time = datetime.fromtimestamp(mktime(entry.updated_parsed))
-                else:
-                    # If no date available, use current time but mark it
-                    published_time = datetime.now()
-                    logging.warning(f"No date found for article: {entry.title if hasattr(entry, 'title') else 'Unknown'}, using current time")
-                
-                # Apply time frame filter
-                if published_time and published_time >= cutoff_date:
-                    # Get article content with improved handling
-                    content = ''
-                    
-                    # Try multiple content sources in order of preference
-                    if hasattr(entry, 'content') and entry.content:
-                        content = entry.content[0].value
-                    elif hasattr(entry, 'summary_detail') and entry.summary_detail:
-                        content = entry.summary_detail.value
-                    elif hasattr(entry, 'summary'):
-                        content = entry.summary
-                    elif hasattr(entry, 'description'):
-                        content = entry.description
-                    
-                    # If we still have no content, create a minimal entry
-                    if not content.strip():
-                        content = f"Article titled '{entry.title}' from {feed_title}. Visit {entry.link} for more information."
-                    
-                    article = {
-                        'title': entry.title,
-                        'link': entry.link,
-                        'published': published_time.isoformat(),
-                        'source': feed_title,
-                        'summary': content
-                    }
-                    articles.append(article)
-                    
-                    # Break if we've reached the maximum articles per feed
-                    if len(articles) >= max_articles_per_feed:
-                        break
-            
-            all_articles.extend(articles)
-            logging.info(f"Successfully fetched {len(articles)} articles from {feed_url} after time frame filtering")
-            
-        except Exception as e:
-            logging.error(f"Error fetching feed {feed_url}: {str(e)}")
-    
-    # Only sort if we have articles
-    if all_articles:
-        # Sort articles by published date (newest first)
-        all_articles.sort(
-            key=lambda x: datetime.fromisoformat(x['published']) if x['published'] else datetime.min,
-            reverse=True
-        )
-    
-    logging.info(f"Total articles fetched from all feeds: {len(all_articles)}")
-    return all_articles
-
-def get_feed_data(date_str=None):
-    """
-    Get saved feed data for a specific date
+    cutoff_date = get_cutoff_date(time_frame)
+    logger.info(f"Using cutoff date: {cutoff_date.isoformat()} for time frame: {time_frame}")
+    
+    health = feed_health.get_health(feed_urls)
+    stale_urls = feed_urls if max_age is None else get_stale_feeds(feed_urls, max_age, health=health)
+    if len(stale_urls) < len(feed_urls):
+        logger.info(f"Reading {len(feed_urls) - len(stale_urls)} recently ingested feeds from the archive")
+    
+    failing_urls = [feed_url for feed_url in stale_urls if feed_health.is_skipped(health.get(feed_url))]
+    if failing_urls:
+        logger.warning(f"Skipping {len(failing_urls)} failing feed(s) until their next probe: {failing_urls}")
+        stale_urls = [feed_url for feed_url in stale_urls if feed_url not in failing_urls]
+    
+    fetched_urls = [feed_url for feed_url, stored in ingest_feeds(stale_urls).items() if stored is not None]
+    mark_feeds_fetched(fetched_urls)
+    
+    # Blocked articles are left out before the per-feed limit, so feeds still fill their share
+    terms = parse_blocked_terms(blocked_terms)
+    blocked = []
+    def exclude(article):
+        if is_blocked(article, terms):
+            blocked.append(article)
+            return True
+        return False
+    
+    all_articles = article_store.get_articles(
+        cutoff_date, feed_urls=feed_urls, per_feed_limit=max_articles_per_feed, exclude=exclude if terms else None
+    )
+    if blocked:
+        logger.info(f"Left out {len(blocked)} articles mentioning blocked terms")
+    
+    metrics.FEED_ARTICLES.inc(len(all_articles))
+    logger.info(f"Total articles fetched from all feeds: {len(all_articles)}")
+    return [article.to_dict() for article in all_articles]
+
+def get_feed_data(date_str=None, feed_urls=None):
+    """
+    Get archived articles published on a specific date
     
     Args:
         date_str (str): Date string in YYYYMMDD format. If None, use today's date.
+        feed_urls (list): Only articles of these feeds, defaults to all feeds
         
     Returns:
         list: List of article dictionaries
     """
-    if not date_str:
-        date_str = datetime.now().strftime('%Y%m%d')
-        
-    storage_dir = f'storage/{date_str}'
-    data_file = f'{storage_dir}/data.json'
-    
-    if not os.path.exists(data_file):
-        logging.warning(f"No feed data found for {date_str}")
-        return []
-        
     try:
-        with open(data_file, 'r') as f:
-            data = json.load(f)
-        return data
+        day = datetime.strptime(date_str, '%Y%m%d') if date_str else datetime.now()
+        day = day.replace(hour=0, minute=0, second=0, microsecond=0)
+        return [article.to_dict() for article in article_store.get_articles(day, day + timedelta(days=1), feed_urls=feed_urls)]
     except Exception as e:
-        logging.error(f"Error loading feed data for {date_str}: {str(e)}")
+        logger.error(f"Error loading feed data for {date_str}: {str(e)}")
         return []
@@ -0,0 +1,300 @@
+"""
+Compressed, content-addressed storage of episode scripts.
+
+Each script is stored once in the scripts table, zstd-compressed and
+keyed by the SHA-256 of its text; an episode only keeps the hash
+(Episode.script_hash). Listing episodes no longer loads their scripts,
+identical scripts are stored once, and a script is only read and
+decompressed when Episode.script is used. Recently used scripts are kept
+decompressed in a small in-process cache, which never goes stale because
+a hash always names the same text. A script is deleted in the same
+transaction as the last episode that referenced it is deleted or given
+another script, or RELEASE_GRACE later when it was only just stored.
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import zstandard
+from sqlalchemy import bindparam, event, inspect, text
+
+logger = logging.getLogger(__name__)
+
+# zstd compression level; scripts are written once and read many times
+SCRIPT_ZSTD_LEVEL = int(os.environ.get("SCRIPT_ZSTD_LEVEL", "10"))
+
+# Decompressed scripts kept in memory per process
+SCRIPT_CACHE_SIZE = int(os.environ.get("SCRIPT_CACHE_SIZE", "64"))
+
+# Hashes per IN (...) query when reading several scripts
+LOOKUP_BATCH_SIZE = 500
+
+# Scripts stored this recently are not deleted, since another transaction may be about to reference them
+RELEASE_GRACE = timedelta(seconds=60)
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+# Released hashes that may have been kept for RELEASE_GRACE -> when to try them again (time.monotonic())
+_deferred = {}
+_deferred_lock = threading.Lock()
+_deferred_timer = None
+
+def get_script_hash(script):
+    """
+    Get the key a script is stored under
+    
+    Args:
+        script (str): Script text
+    
+    Returns:
+        str: SHA-256 of the UTF-8 text, 64 hex characters
+    """
+    return hashlib.sha256(script.encode("utf-8")).hexdigest()
+
+def compress(script):
+    """Compress a script for storage"""
+    # Compressor objects must not be shared between threads
+    return zstandard.ZstdCompressor(level=SCRIPT_ZSTD_LEVEL).compress(script.encode("utf-8"))
+
+def decompress(data):
+    """Decompress a stored script"""
+    return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+
+def remember(script_hash, script):
+    """Add a script to the in-process cache"""
+    with _cache_lock:
+        _cache[script_hash] = script
+        _cache.move_to_end(script_hash)
+        while len(_cache) > SCRIPT_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+def recall(script_hash):
+    """Get a script from the in-process cache, or None"""
+    with _cache_lock:
+        script = _cache.get(script_hash)
+        if script is not None:
+            _cache.move_to_end(script_hash)
+        return script
+
+def put_script(script):
+    """
+    Store a script unless the store has it already
+    
+    The row is written in the current transaction, so it is committed
+    together with the episode that references it. Storing a script the
+    store has already refreshes its created_at, which keeps release_scripts
+    in another transaction from deleting it meanwhile.
+    
+    Args:
+        script (str): Script text
+    
+    Returns:
+        str: The script's hash
+    """
+    from app import db
+    
+    script_hash = get_script_hash(script)
+    data = compress(script)
+    # Another episode, or another process at the same moment, may have stored the same text
+    db.session.execute(text(
+        "INSERT INTO scripts (hash, data, size, compressed_size, created_at) "
+        "VALUES (:hash, :data, :size, :compressed_size, :created_at) "
+        "ON CONFLICT (hash) DO UPDATE SET created_at = excluded.created_at"
+    ), {
+        "hash": script_hash,
+        "data": data,
+        "size": len(script.encode("utf-8")),
+        "compressed_size": len(data),
+        "created_at": datetime.utcnow(),
+    })
+    remember(script_hash, script)
+    return script_hash
+
+def get_script(script_hash, connection=None):
+    """
+    Read a script from the store
+    
+    Args:
+        script_hash (str): The script's hash
+        connection: SQLAlchemy connection to read with, e.g. inside a flush;
+            defaults to the session
+    
+    Returns:
+        str: Script text, or None if the store does not have it
+    """
+    script = recall(script_hash)
+    if script is not None:
+        return script
+    
+    query = text("SELECT data FROM scripts WHERE hash = :hash")
+    if connection is None:
+        from app import db
+        connection = db.session
+    data = connection.execute(query, {"hash": script_hash}).scalar()
+    if data is None:
+        logger.error(f"Script {script_hash} is missing from the script store")
+        return None
+    
+    script = decompress(data)
+    remember(script_hash, script)
+    return script
+
+def get_scripts(script_hashes, connection=None):
+    """
+    Read several scripts from the store with one query per batch
+    
+    Args:
+        script_hashes (iterable): Script hashes
+        connection: SQLAlchemy connection to read with, defaults to the session
+    
+    Returns:
+        dict: Script text by hash; hashes the store does not have are left out
+    """
+    scripts = {}
+    missing = []
+    for script_hash in set(script_hashes):
+        script = recall(script_hash) if script_hash else None
+        if script is not None:
+            scripts[script_hash] = script
+        elif script_hash:
+            missing.append(script_hash)
+    
+    if connection is None and missing:
+        from app import db
+        connection = db.session
+    for start in range(0, len(missing), LOOKUP_BATCH_SIZE):
+        batch = missing[start:start + LOOKUP_BATCH_SIZE]
+        query = text("SELECT hash, data FROM scripts WHERE hash IN :hashes").bindparams(bindparam("hashes", expanding=True))
+        for script_hash, data in connection.execute(query, {"hashes": batch}):
+            script = decompress(data)
+            remember(script_hash, script)
+            scripts[script_hash] = script
+    
+    for script_hash in missing:
+        if script_hash not in scripts:
+            logger.error(f"Script {script_hash} is missing from the script store")
+    return scripts
+
+def delete_scripts(connection, script_hashes):
+    """
+    Delete the scripts of a set of hashes that no episode references
+    
+    Args:
+        connection: SQLAlchemy connection
+        script_hashes (iterable): Hashes to check
+    
+    Returns:
+        list: Hashes that were kept, still referenced or within RELEASE_GRACE
+    """
+    kept = []
+    for script_hash in {script_hash for script_hash in script_hashes if script_hash}:
+        result = connection.execute(text(
+            "DELETE FROM scripts WHERE hash = :hash AND created_at < :stored_before "
+            "AND NOT EXISTS (SELECT 1 FROM episodes WHERE script_hash = :hash)"
+        ), {"hash": script_hash, "stored_before": datetime.utcnow() - RELEASE_GRACE})
+        if not result.rowcount:
+            kept.append(script_hash)
+    return kept
+
+def release_scripts(connection, script_hashes):
+    """
+    Delete scripts that no episode references any more
+    
+    A script stored within RELEASE_GRACE is kept for now and tried again
+    once the grace period is over, e.g. the script of a failed generation
+    that is deleted right away.
+    
+    Args:
+        connection: SQLAlchemy connection, e.g. inside a flush
+        script_hashes (iterable): Hashes an episode stopped referencing
+    """
+    kept = delete_scripts(connection, script_hashes)
+    if kept:
+        defer_release(connection.engine, kept)
+
+def defer_release(engine, script_hashes):
+    """
+    Try releasing scripts again once RELEASE_GRACE has passed
+    
+    Args:
+        engine: SQLAlchemy engine to connect with from the timer thread
+        script_hashes (list): Hashes to try again
+    """
+    global _deferred_timer
+    
+    due = time.monotonic() + RELEASE_GRACE.total_seconds() + 1
+    with _deferred_lock:
+        for script_hash in script_hashes:
+            _deferred[script_hash] = due
+        if _deferred_timer is None:
+            _deferred_timer = threading.Timer(due - time.monotonic(), release_deferred, args=(engine,))
+            _deferred_timer.daemon = True
+            _deferred_timer.start()
+
+def release_deferred(engine):
+    """
+    Timer: delete the deferred scripts that are due and wait for the rest
+    
+    Scripts that are still referenced are not deferred again; the episode
+    holding on to them releases them in its turn.
+    
+    Args:
+        engine: SQLAlchemy engine
+    """
+    global _deferred_timer
+    
+    now = time.monotonic()
+    with _deferred_lock:
+        script_hashes = [script_hash for script_hash, due in _deferred.items() if due <= now]
+        for script_hash in script_hashes:
+            del _deferred[script_hash]
+    
+    try:
+        with engine.begin() as connection:
+            delete_scripts(connection, script_hashes)
+    except Exception as e:
+        logger.error(f"Could not release {len(script_hashes)} deferred script(s): {str(e)}")
+    
+    with _deferred_lock:
+        _deferred_timer = None
+        if _deferred:
+            _deferred_timer = threading.Timer(max(min(_deferred.values()) - time.monotonic(), 0), release_deferred, args=(engine,))
+            _deferred_timer.daemon = True
+            _deferred_timer.start()
+
+def on_update(mapper, connection, episode):
+    release_scripts(connection, inspect(episode).attrs.script_hash.history.deleted)
+
+def on_delete(mapper, connection, episode):
+    release_scripts(connection, [episode.script_hash])
+
+def init_store():
+    """Delete scripts from now on when their last episode lets go of them"""
+    import models
+    
+    for name, listener in (("after_update", on_update), ("after_delete", on_delete)):
+        if not event.contains(models.Episode, name, listener):
+            event.listen(models.Episode, name, listener)
+
+def delete_unreferenced_scripts():
+    """
+    Delete every script no episode references, e.g. ones left behind
+    before scripts were released, or deferred by a process that exited
+    before RELEASE_GRACE was over
+    
+    Returns:
+        int: Number of scripts deleted
+    """
+    from app import db
+    
+    result = db.session.execute(text(
+        "DELETE FROM scripts WHERE created_at < :stored_before "
+        "AND NOT EXISTS (SELECT 1 FROM episodes WHERE episodes.script_hash = scripts.hash)"
+    ), {"stored_before": datetime.utcnow() - RELEASE_GRACE})
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,375 @@
+"""
+Full-text search over episode titles and scripts.
+
+The index is a table next to episodes: an FTS5 table on SQLite, and a
+tsvector table with a GIN index on PostgreSQL. SQLAlchemy events update it
+in the same transaction whenever an episode is added, its title or script
+changes, or it is deleted, so it never has to be rebuilt. The database
+ranks the matches (BM25 on SQLite, ts_rank_cd on PostgreSQL, title
+matches weighted higher), and only the episodes on the requested page are
+loaded to cut highlighted snippets from.
+"""
+import re
+import time
+import logging
+from collections import namedtuple
+
+from markupsafe import Markup, escape
+from sqlalchemy import event, inspect, text
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL text search configuration, i.e. stemming language
+SEARCH_CONFIG = "english"
+
+RESULTS_PER_PAGE = 20
+MAX_RESULTS_PER_PAGE = 100
+
+# Longer searches are cut off
+MAX_QUERY_LENGTH = 200
+
+# Weight of a title match relative to a script match in SQLite's BM25
+TITLE_WEIGHT = 4.0
+
+# Characters of script shown around the first match
+SNIPPET_CHARS = 240
+
+# Episodes per batch when indexing existing episodes
+INDEX_BATCH_SIZE = 200
+
+SUPPORTED_DIALECTS = ("sqlite", "postgresql")
+
+SQLITE_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS episode_search USING fts5(title, script, tokenize='porter unicode61')",
+)
+POSTGRESQL_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS episode_search (episode_id INTEGER PRIMARY KEY, document TSVECTOR NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_episode_search_document ON episode_search USING GIN (document)",
+)
+
+# Quoted phrases and single words, either optionally excluded with a leading '-'
+TOKEN_PATTERN = re.compile(r'(-?)"([^"]*)"?|(-?)(\S+)')
+
+SearchResult = namedtuple("SearchResult", ["episode", "score", "title", "snippet"])
+
+def index_episode(connection, episode_id, title, script):
+    """
+    Add an episode to the index or replace its entry
+    
+    Args:
+        connection: SQLAlchemy connection
+        episode_id (int): Episode ID
+        title (str): Episode title
+        script (str): Episode script
+    """
+    params = {"id": episode_id, "title": title or "", "script": script or "", "config": SEARCH_CONFIG}
+    if connection.dialect.name == "sqlite":
+        connection.execute(text("DELETE FROM episode_search WHERE rowid = :id"), params)
+        connection.execute(text(
+            "INSERT INTO episode_search (rowid, title, script) VALUES (:id, :title, :script)"
+        ), params)
+    elif connection.dialect.name == "postgresql":
+        connection.execute(text(
+            "INSERT INTO episode_search (episode_id, document) VALUES (:id, "
+            "setweight(to_tsvector(CAST(:config AS regconfig), :title), 'A') || "
+            "setweight(to_tsvector(CAST(:config AS regconfig), :script), 'B')) "
+            "ON CONFLICT (episode_id) DO UPDATE SET document = EXCLUDED.document"
+        ), params)
+
+def unindex_episode(connection, episode_id):
+    """
+    Remove an episode from the index
+    
+    Args:
+        connection: SQLAlchemy connection
+        episode_id (int): Episode ID
+    """
+    if connection.dialect.name == "sqlite":
+        connection.execute(text("DELETE FROM episode_search WHERE rowid = :id"), {"id": episode_id})
+    elif connection.dialect.name == "postgresql":
+        connection.execute(text("DELETE FROM episode_search WHERE episode_id = :id"), {"id": episode_id})
+
+def get_episode_script(connection, episode):
+    """Get an episode's script inside a flush, where the session cannot query"""
+    import script_store
+    if episode.script_hash:
+        return script_store.get_script(episode.script_hash, connection)
+    return episode.legacy_script
+
+def on_insert(mapper, connection, episode):
+    index_episode(connection, episode.id, episode.title, get_episode_script(connection, episode))
+
+def on_update(mapper, connection, episode):
+    state = inspect(episode)
+    if state.attrs.title.history.has_changes() or state.attrs.script_hash.history.has_changes():
+        index_episode(connection, episode.id, episode.title, get_episode_script(connection, episode))
+
+def on_delete(mapper, connection, episode):
+    unindex_episode(connection, episode.id)
+
+def rebuild_index(connection):
+    """
+    Index every episode
+    
+    Args:
+        connection: SQLAlchemy connection
+    
+    Returns:
+        int: Number of episodes indexed
+    """
+    import script_store
+    
+    count = 0
+    last_id = 0
+    while True:
+        rows = connection.execute(text(
+            "SELECT id, title, script, script_hash FROM episodes WHERE id > :last_id ORDER BY id LIMIT :limit"
+        ), {"last_id": last_id, "limit": INDEX_BATCH_SIZE}).all()
+        if not rows:
+            return count
+        for episode_id, title, script, script_hash in rows:
+            if script_hash:
+                script = script_store.get_script(script_hash, connection)
+            index_episode(connection, episode_id, title, script)
+        count += len(rows)
+        last_id = rows[-1][0]
+
+def init_index():
+    """
+    Create the search index if needed and keep it up to date from now on
+    
+    Episodes that existed before the index was created are indexed once.
+    
+    Returns:
+        bool: True if search is available on this database
+    """
+    from app import db
+    import models
+    
+    dialect = db.engine.dialect.name
+    if dialect not in SUPPORTED_DIALECTS:
+        logger.warning(f"Episode search is not available on {dialect}")
+        return False
+    
+    with db.engine.begin() as connection:
+        created = not inspect(connection).has_table("episode_search")
+        for statement in SQLITE_SCHEMA if dialect == "sqlite" else POSTGRESQL_SCHEMA:
+            connection.execute(text(statement))
+        if created:
+            logger.info(f"Indexed {rebuild_index(connection)} episodes for search")
+    
+    for name, listener in (("after_insert", on_insert), ("after_update", on_update), ("after_delete", on_delete)):
+        if not event.contains(models.Episode, name, listener):
+            event.listen(models.Episode, name, listener)
+    return True
+
+def parse_query(query):
+    """
+    Split a search into terms
+    
+    Words must all appear; "quoted words" must appear as a phrase, a leading
+    '-' excludes a word or phrase and OR between two terms accepts either.
+    
+    Args:
+        query (str): Search as typed
+    
+    Returns:
+        list: (operator, words) tuples, operator being 'AND', 'OR' or 'NOT'
+    """
+    terms = []
+    operator = "AND"
+    for match in TOKEN_PATTERN.finditer(query[:MAX_QUERY_LENGTH]):
+        excluded = match.group(1) or match.group(3)
+        phrase = match.group(2) if match.group(2) is not None else match.group(4)
+        if match.group(4) == "OR" and terms:
+            operator = "OR"
+            continue
+        words = re.findall(r"\w+", phrase.lower())
+        if words:
+            terms.append(("NOT" if excluded else operator, words))
+        operator = "AND"
+    return terms
+
+def to_fts5_query(terms):
+    """
+    Build an FTS5 MATCH expression from parsed terms
+    
+    Args:
+        terms (list): Result of parse_query
+    
+    Returns:
+        str: MATCH expression, empty if nothing can be searched for
+    """
+    clauses = []
+    excluded = []
+    for operator, words in terms:
+        phrase = '"' + " ".join(words) + '"'
+        if operator == "NOT":
+            excluded.append(phrase)
+        elif operator == "OR" and clauses:
+            clauses[-1] = f"{clauses[-1]} OR {phrase}"
+        else:
+            clauses.append(phrase)
+    if not clauses:
+        return ""
+    expression = " AND ".join(f"({clause})" for clause in clauses)
+    return expression + "".join(f" NOT {phrase}" for phrase in excluded)
+
+def to_tsquery_text(terms):
+    """
+    Build websearch_to_tsquery input from parsed terms
+    
+    Args:
+        terms (list): Result of parse_query
+    
+    Returns:
+        str: Search in websearch syntax, empty if nothing can be searched for
+    """
+    if not any(operator != "NOT" for operator, _ in terms):
+        return ""
+    parts = []
+    for operator, words in terms:
+        phrase = f'"{" ".join(words)}"' if len(words) > 1 else words[0]
+        if operator == "NOT":
+            phrase = "-" + phrase
+        elif operator == "OR" and parts:
+            parts.append("or")
+        parts.append(phrase)
+    return " ".join(parts)
+
+def get_highlight_pattern(terms):
+    """
+    Get a pattern matching the searched words and their inflections
+    
+    The index stems words, so "launches" also finds "launched"; cutting
+    longer words down to a common prefix highlights most of those matches.
+    
+    Args:
+        terms (list): Result of parse_query
+    
+    Returns:
+        re.Pattern: Case-insensitive pattern, or None without searched words
+    """
+    prefixes = {
+        word if len(word) <= 4 else word[:len(word) - 2]
+        for operator, words in terms if operator != "NOT" for word in words
+    }
+    if not prefixes:
+        return None
+    alternatives = "|".join(re.escape(prefix) for prefix in sorted(prefixes, key=len, reverse=True))
+    return re.compile(rf"\b(?:{alternatives})\w*", re.IGNORECASE)
+
+def highlight(value, pattern):
+    """
+    Escape text for HTML and wrap matches in <mark>
+    
+    Args:
+        value (str): Text
+        pattern (re.Pattern): Words to highlight, may be None
+    
+    Returns:
+        Markup: Safe HTML
+    """
+    if pattern is None:
+        return escape(value)
+    parts = []
+    last = 0
+    for match in pattern.finditer(value):
+        parts.append(escape(value[last:match.start()]))
+        parts.append(Markup("<mark>{}</mark>").format(match.group(0)))
+        last = match.end()
+    parts.append(escape(value[last:]))
+    return Markup("").join(parts)
+
+def make_snippet(script, pattern, length=SNIPPET_CHARS):
+    """
+    Cut the part of a script around its first match and highlight it
+    
+    Args:
+        script (str): Episode script
+        pattern (re.Pattern): Words to highlight, may be None
+        length (int): Approximate snippet length in characters
+    
+    Returns:
+        Markup: Safe HTML
+    """
+    content = " ".join((script or "").split())
+    match = pattern.search(content) if pattern is not None else None
+    start = 0
+    if match and match.start() > length // 3:
+        start = content.rfind(" ", 0, match.start() - length // 3) + 1
+    end = start + length
+    if end < len(content):
+        end = max(content.rfind(" ", start, end), match.end() if match else start + 1)
+    
+    snippet = highlight(content[start:end], pattern)
+    if start > 0:
+        snippet = Markup("&hellip; ") + snippet
+    if end < len(content):
+        snippet = snippet + Markup(" &hellip;")
+    return snippet
+
+def search_episodes(query, page=1, per_page=RESULTS_PER_PAGE):
+    """
+    Find episodes whose title or script match a search, best match first
+    
+    Args:
+        query (str): Search as typed, see parse_query
+        page (int): Page number, from 1
+        per_page (int): Results per page
+    
+    Returns:
+        tuple: (list of SearchResult, total number of matches)
+    """
+    from app import db
+    import models
+    
+    terms = parse_query((query or "").strip())
+    page = max(1, page)
+    per_page = min(max(1, per_page), MAX_RESULTS_PER_PAGE)
+    params = {"limit": per_page, "offset": (page - 1) * per_page}
+    dialect = db.engine.dialect.name
+    started = time.perf_counter()
+    
+    if dialect == "sqlite":
+        params["match"] = to_fts5_query(terms)
+        if not params["match"]:
+            return [], 0
+        params["title_weight"] = TITLE_WEIGHT
+        # bm25() is lower for better matches
+        rows = db.session.execute(text(
+            "SELECT rowid, -bm25(episode_search, :title_weight, 1.0) AS score FROM episode_search "
+            "WHERE episode_search MATCH :match ORDER BY score DESC, rowid DESC LIMIT :limit OFFSET :offset"
+        ), params).all()
+        total = db.session.execute(text(
+            "SELECT count(*) FROM episode_search WHERE episode_search MATCH :match"
+        ), params).scalar()
+    elif dialect == "postgresql":
+        params["query"] = to_tsquery_text(terms)
+        if not params["query"]:
+            return [], 0
+        params["config"] = SEARCH_CONFIG
+        rows = db.session.execute(text(
+            "SELECT episode_id, ts_rank_cd(document, search) AS score "
+            "FROM episode_search, websearch_to_tsquery(CAST(:config AS regconfig), :query) AS search "
+            "WHERE document @@ search ORDER BY score DESC, episode_id DESC LIMIT :limit OFFSET :offset"
+        ), params).all()
+        total = db.session.execute(text(
+            "SELECT count(*) FROM episode_search "
+            "WHERE document @@ websearch_to_tsquery(CAST(:config AS regconfig), :query)"
+        ), params).scalar()
+    else:
+        logger.warning(f"Episode search is not available on {dialect}")
+        return [], 0
+    
+    episodes = {episode.id: episode for episode in models.Episode.query.filter(
+        models.Episode.id.in_([episode_id for episode_id, _ in rows])
+    )} if rows else {}
+    pattern = get_highlight_pattern(terms)
+    results = [
+        SearchResult(episodes[episode_id], score, highlight(episodes[episode_id].title, pattern),
+                     make_snippet(episodes[episode_id].script, pattern))
+        for episode_id, score in rows if episode_id in episodes
+    ]
+    logger.debug(f"Search for {query!r}: {total} matches, page {page} in {(time.perf_counter() - started) * 1000:.1f}ms")
+    return results, total
@@ -0,0 +1,575 @@
+"""
+Local stand-ins for the OpenAI, ElevenLabs and RSS feed endpoints the
+pipeline talks to, and for a WebSub hub, so it can be exercised and
+measured without spending money on live APIs.
+
+Run standalone with:
+    python stub_servers.py --latency 0.2 --error-rate 0.01 --rate-limit-rate 0.05
+
+and point the app at the printed OPENAI_BASE_URL / ELEVENLABS_API_BASE.
+"""
+import re
+import gzip
+import hmac
+import json
+import time
+import zlib
+import random
+import struct
+import hashlib
+import logging
+import secrets
+import argparse
+import threading
+import urllib.request
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urlencode
+
+# A silent MPEG-1 Layer III frame: 128 kbps, 44.1 kHz, joint stereo, 1152 samples
+SILENT_FRAME = bytes([0xFF, 0xFB, 0x90, 0x64]) + b"\x00" * 413
+
+# Roughly how fast the stand-in TTS "speaks"
+CHARS_PER_SECOND = 15
+
+WORDS = (
+    "technology startup model launch research cloud developer open source security "
+    "platform users market funding chip network privacy regulation data product "
+    "update release team growth engineers software hardware device companies"
+).split()
+
+STUB_VOICES = [
+    {"voice_id": "8Rym4ZbhAhRTh2D03UoX", "name": "Archie"},
+    {"voice_id": "kmSVBPu7loj4ayNinwWM", "name": "Archie - English teen youth"},
+    {"voice_id": "21m00Tcm4TlvDq8ikWAM", "name": "Rachel"},
+]
+
+class StubConfig:
+    """Latency and failure behaviour shared by the stand-in servers"""
+    
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0, retry_after=1, seed=None):
+        self.latency = latency  # Base delay per request in seconds
+        self.jitter = jitter  # Extra uniformly distributed delay in seconds
+        self.error_rate = error_rate  # Probability of a 500 response
+        self.rate_limit_rate = rate_limit_rate  # Probability of a 429 response
+        self.retry_after = retry_after  # Retry-After seconds sent with 429s
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+    
+    def roll(self):
+        """
+        Decide how the next request fails, if at all
+        
+        Returns:
+            int: HTTP status to answer with, 200 for success
+        """
+        with self.lock:
+            self.requests += 1
+            value = self.random.random()
+            delay = self.latency + self.random.random() * self.jitter
+        
+        if delay:
+            time.sleep(delay)
+        
+        if value < self.rate_limit_rate:
+            status = 429
+        elif value < self.rate_limit_rate + self.error_rate:
+            status = 500
+        else:
+            return 200
+        
+        with self.lock:
+            self.failures += 1
+        return status
+
+def silent_mp3(seconds):
+    """
+    Build a silent MP3 of roughly the given length
+    
+    Args:
+        seconds (float): Target duration
+    
+    Returns:
+        bytes: MP3 data
+    """
+    frames = max(1, int(seconds * 44100 / 1152))
+    return SILENT_FRAME * frames
+
+def tiny_png(size=16, color=(40, 90, 200)):
+    """
+    Build a solid-color PNG image
+    
+    Args:
+        size (int): Width and height in pixels
+        color (tuple): RGB color
+    
+    Returns:
+        bytes: PNG data
+    """
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+    
+    row = b"\x00" + bytes(color) * size
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(row * size))
+        + chunk(b"IEND", b"")
+    )
+
+def lorem(word_count, rng):
+    """
+    Generate filler sentences
+    
+    Args:
+        word_count (int): Number of words
+        rng (Random): Random generator
+    
+    Returns:
+        str: Filler text
+    """
+    sentences = []
+    remaining = max(1, word_count)
+    while remaining > 0:
+        length = min(remaining, rng.randint(8, 16))
+        words = [rng.choice(WORDS) for _ in range(length)]
+        sentences.append(" ".join(words).capitalize() + ".")
+        remaining -= length
+    return " ".join(sentences)
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Common plumbing for the stand-in request handlers"""
+    
+    config = StubConfig()
+    protocol_version = "HTTP/1.1"
+    
+    def log_message(self, format, *args):
+        logging.debug("%s - %s", self.__class__.__name__, format % args)
+    
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+    
+    def send_body(self, status, body, content_type="application/json", headers=None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode("utf-8")
+        elif isinstance(body, str):
+            body = body.encode("utf-8")
+        
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def send_event_stream(self, events, delay=0.0):
+        """
+        Send server-sent events with chunked transfer encoding, ending with [DONE]
+        
+        Args:
+            events (iterable): JSON-serializable event payloads
+            delay (float): Seconds to wait before each event
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        
+        def write_chunk(data):
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+        
+        for event in events:
+            if delay:
+                time.sleep(delay)
+            write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+        write_chunk(b"data: [DONE]\n\n")
+        write_chunk(b"")
+    
+    def fail_if_unlucky(self):
+        """
+        Apply the configured latency, errors and rate limiting
+        
+        Returns:
+            bool: True if an error response was sent
+        """
+        status = self.config.roll()
+        if status == 429:
+            self.send_body(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}}, headers={
+                "Retry-After": str(self.config.retry_after),
+                "x-ratelimit-remaining-requests": "0",
+                "x-ratelimit-reset-requests": f"{self.config.retry_after}s",
+            })
+            return True
+        if status != 200:
+            self.send_body(status, {"error": {"message": "Stub server error", "type": "server_error"}})
+            return True
+        return False
+
+class OpenAIStubHandler(StubHandler):
+    """Chat completions and image generation"""
+    
+    # Words per streamed chat completion chunk, roughly what the API sends
+    words_per_chunk = 3
+    # Seconds between streamed chunks, to mimic the model writing
+    stream_delay = 0.0
+    
+    def do_POST(self):
+        path = urlparse(self.path).path
+        payload = self.read_json()
+        
+        if self.fail_if_unlucky():
+            return
+        
+        if path.endswith("/chat/completions") and payload.get("stream"):
+            self.send_event_stream(self.chat_completion_chunks(self.chat_completion(payload), payload), self.stream_delay)
+        elif path.endswith("/chat/completions"):
+            self.send_body(200, self.chat_completion(payload))
+        elif path.endswith("/images/generations"):
+            host = self.headers.get("Host")
+            self.send_body(200, {
+                "created": int(time.time()),
+                "data": [{"url": f"http://{host}/files/cover.png", "revised_prompt": payload.get("prompt", "")}],
+            })
+        else:
+            self.send_body(404, {"error": {"message": f"Unknown endpoint {path}"}})
+    
+    def do_GET(self):
+        if urlparse(self.path).path == "/files/cover.png":
+            self.send_body(200, tiny_png(), content_type="image/png")
+        else:
+            self.send_body(404, {"error": {"message": "Not found"}})
+    
+    def chat_completion(self, payload):
+        messages = payload.get("messages", [])
+        prompt_text = " ".join(str(message.get("content", "")) for message in messages)
+        
+        # Aim for about half the token budget in words, like a real summary
+        max_tokens = payload.get("max_tokens") or 300
+        
+        # Batched summary requests name their articles and expect a JSON object keyed by them
+        article_ids = re.findall(r"^### Article (\w+)$", prompt_text, re.MULTILINE)
+        if (payload.get("response_format") or {}).get("type") == "json_object" or article_ids:
+            words = max(10, max_tokens // 2 // max(1, len(article_ids)))
+            content = json.dumps({"summaries": {
+                article_id: lorem(words, self.config.random) for article_id in article_ids
+            }})
+        else:
+            content = lorem(max(10, max_tokens // 2), self.config.random)
+        
+        prompt_tokens = len(prompt_text) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-stub-{self.config.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "gpt-3.5-turbo"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+    
+    def chat_completion_chunks(self, completion, payload):
+        """
+        Split a chat completion into streamed chunks of a few words each
+        
+        Args:
+            completion (dict): Result of chat_completion
+            payload (dict): The request, for stream_options
+        
+        Returns:
+            list: chat.completion.chunk events
+        """
+        content = completion["choices"][0]["message"]["content"]
+        base = {"id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"], "model": completion["model"]}
+        
+        words = re.findall(r"\S+\s*", content)
+        events = [dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])]
+        for start in range(0, len(words), self.words_per_chunk):
+            delta = "".join(words[start:start + self.words_per_chunk])
+            events.append(dict(base, choices=[{"index": 0, "delta": {"content": delta}, "finish_reason": None}]))
+        events.append(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            events.append(dict(base, choices=[], usage=completion["usage"]))
+        return events
+
+class ElevenLabsStubHandler(StubHandler):
+    """Voice listing and text-to-speech"""
+    
+    def do_GET(self):
+        if self.fail_if_unlucky():
+            return
+        
+        if urlparse(self.path).path == "/v1/voices":
+            self.send_body(200, {"voices": STUB_VOICES})
+        else:
+            self.send_body(404, {"detail": "Not found"})
+    
+    def do_POST(self):
+        path = urlparse(self.path).path
+        payload = self.read_json()
+        
+        if self.fail_if_unlucky():
+            return
+        
+        if re.match(r"^/v1/text-to-speech/[^/]+$", path):
+            text = payload.get("text", "")
+            self.send_body(200, silent_mp3(len(text) / CHARS_PER_SECOND), content_type="audio/mpeg")
+        else:
+            self.send_body(404, {"detail": "Not found"})
+
+class FeedStubHandler(StubHandler):
+    """Static RSS fixtures at /feeds/<n>.xml"""
+    
+    items_per_feed = 30
+    paragraphs_per_item = 6
+    # WebSub hub the feeds advertise, e.g. the WebSubHubStubHandler's URL
+    hub_url = None
+    
+    def do_GET(self):
+        match = re.match(r"^/feeds/(\d+)\.xml$", urlparse(self.path).path)
+        if not match:
+            self.send_body(404, "Not found", content_type="text/plain")
+            return
+        
+        if self.fail_if_unlucky():
+            return
+        
+        self_url = f"http://{self.headers.get('Host')}{urlparse(self.path).path}"
+        body = build_feed_fixture(
+            int(match.group(1)), self.items_per_feed, self.paragraphs_per_item, self.hub_url, self_url
+        ).encode("utf-8")
+        headers = {}
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+        self.send_body(200, body, content_type="application/rss+xml", headers=headers)
+
+def build_feed_fixture(feed_number, item_count=30, paragraphs=6, hub_url=None, self_url=None):
+    """
+    Build a deterministic RSS document with recent items
+    
+    Args:
+        feed_number (int): Feed number, used as seed and in titles
+        item_count (int): Number of items
+        paragraphs (int): HTML paragraphs per item
+        hub_url (str): WebSub hub to advertise
+        self_url (str): The feed's own URL, advertised with the hub
+    
+    Returns:
+        str: RSS XML
+    """
+    rng = random.Random(feed_number)
+    now = datetime.now(timezone.utc)
+    items = []
+    for i in range(item_count):
+        published = format_datetime(now - timedelta(hours=i * 3))
+        body = "".join(f"<p>{lorem(60, rng)}</p>" for _ in range(paragraphs))
+        items.append(
+            f"<item><title>Feed {feed_number} story {i}: {lorem(6, rng)[:-1]}</title>"
+            f"<link>https://example.com/{feed_number}/{i}</link>"
+            f"<guid>https://example.com/{feed_number}/{i}</guid>"
+            f"<pubDate>{published}</pubDate>"
+            f"<description><![CDATA[{body}]]></description></item>"
+        )
+    hub_links = ""
+    if hub_url:
+        hub_links = f'<atom:link rel="hub" href="{hub_url}"/><atom:link rel="self" href="{self_url}"/>'
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom"><channel>'
+        f"<title>Stub Feed {feed_number}</title><link>https://example.com/{feed_number}</link>{hub_links}"
+        f"<description>Fixture feed {feed_number}</description>{''.join(items)}</channel></rss>"
+    )
+
+class WebSubHubStubHandler(StubHandler):
+    """
+    A minimal WebSub hub
+    
+    Subscribers POST hub.mode=subscribe/unsubscribe and are verified with a
+    challenge on their callback. Publishers POST hub.mode=publish with
+    hub.url set to the topic; the hub fetches it and delivers the content to
+    every subscriber, signed with its secret.
+    """
+    
+    # (topic, callback) to {"secret", "expires"}, shared by every hub started in the process
+    subscriptions = {}
+    lock = threading.Lock()
+    default_lease = 86400
+    
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        form = {name: values[0] for name, values in parse_qs(self.rfile.read(length).decode("utf-8")).items()}
+        mode = form.get("hub.mode")
+        
+        if mode in ("subscribe", "unsubscribe") and form.get("hub.callback") and form.get("hub.topic"):
+            self.send_body(202, "", content_type="text/plain")
+            threading.Thread(target=self.verify, args=(mode, form), daemon=True).start()
+        elif mode == "publish" and (form.get("hub.url") or form.get("hub.topic")):
+            self.send_body(202, "", content_type="text/plain")
+            topic = form.get("hub.url") or form.get("hub.topic")
+            threading.Thread(target=self.distribute, args=(topic,), daemon=True).start()
+        else:
+            self.send_body(400, "Unsupported request", content_type="text/plain")
+    
+    def verify(self, mode, form):
+        """Confirm a subscription change with the subscriber, then apply it"""
+        challenge = secrets.token_hex(16)
+        lease = int(form.get("hub.lease_seconds") or self.default_lease)
+        query = urlencode({
+            "hub.mode": mode, "hub.topic": form["hub.topic"], "hub.challenge": challenge, "hub.lease_seconds": lease,
+        })
+        callback = form["hub.callback"]
+        try:
+            with urllib.request.urlopen(f"{callback}{'&' if '?' in callback else '?'}{query}", timeout=10) as response:
+                confirmed = response.status < 300 and response.read().decode("utf-8") == challenge
+        except Exception as e:
+            logging.debug(f"Verification of {callback} failed: {str(e)}")
+            confirmed = False
+        if not confirmed:
+            return
+        
+        key = (form["hub.topic"], callback)
+        with self.lock:
+            if mode == "subscribe":
+                self.subscriptions[key] = {"secret": form.get("hub.secret"), "expires": time.time() + lease}
+            else:
+                self.subscriptions.pop(key, None)
+    
+    def distribute(self, topic):
+        """Fetch a topic and post its content to its subscribers"""
+        try:
+            with urllib.request.urlopen(topic, timeout=10) as response:
+                content = response.read()
+                content_type = response.headers.get("Content-Type", "application/rss+xml")
+        except Exception as e:
+            logging.debug(f"Fetching topic {topic} failed: {str(e)}")
+            return
+        
+        now = time.time()
+        with self.lock:
+            subscribers = [
+                (callback, subscription["secret"]) for (subscribed_topic, callback), subscription in self.subscriptions.items()
+                if subscribed_topic == topic and subscription["expires"] > now
+            ]
+        for callback, secret in subscribers:
+            headers = {"Content-Type": content_type}
+            if secret:
+                digest = hmac.new(secret.encode("utf-8"), content, hashlib.sha256).hexdigest()
+                headers["X-Hub-Signature"] = f"sha256={digest}"
+            request = urllib.request.Request(callback, data=content, headers=headers, method="POST")
+            try:
+                urllib.request.urlopen(request, timeout=10).close()
+            except Exception as e:
+                logging.debug(f"Delivery to {callback} failed: {str(e)}")
+
+def publish(hub_url, topic):
+    """
+    Tell a hub that a topic has new content
+    
+    Args:
+        hub_url (str): Hub URL
+        topic (str): Topic (feed) URL
+    """
+    data = urlencode({"hub.mode": "publish", "hub.url": topic}).encode("utf-8")
+    urllib.request.urlopen(urllib.request.Request(hub_url, data=data, method="POST"), timeout=10).close()
+
+def start_stub_server(handler_class, config=None, host="127.0.0.1", port=0):
+    """
+    Start a stand-in server on a background thread
+    
+    Args:
+        handler_class (type): One of the stub handler classes
+        config (StubConfig): Latency and failure behaviour
+        host (str): Interface to bind
+        port (int): Port to bind, 0 picks a free one
+    
+    Returns:
+        tuple: (server, base_url); call server.shutdown() to stop it
+    """
+    handler = type(handler_class.__name__, (handler_class,), {"config": config or StubConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    
+    base_url = f"http://{host}:{server.server_address[1]}"
+    logging.info(f"Started {handler_class.__name__} at {base_url}")
+    return server, base_url
+
+def start_all(config=None, host="127.0.0.1", ports=(0, 0, 0, 0)):
+    """
+    Start the OpenAI, ElevenLabs, feed and WebSub hub stand-ins
+    
+    Args:
+        config (StubConfig): Latency and failure behaviour for the API stand-ins
+        host (str): Interface to bind
+        ports (tuple): Ports for the OpenAI, ElevenLabs, feed and hub servers
+    
+    Returns:
+        dict: Servers and base URLs keyed by service name
+    """
+    openai_server, openai_url = start_stub_server(OpenAIStubHandler, config, host, ports[0])
+    elevenlabs_server, elevenlabs_url = start_stub_server(ElevenLabsStubHandler, config, host, ports[1])
+    feed_server, feed_url = start_stub_server(FeedStubHandler, StubConfig(), host, ports[2])
+    hub_server, hub_url = start_stub_server(WebSubHubStubHandler, StubConfig(), host, ports[3])
+    return {
+        "openai": (openai_server, openai_url),
+        "elevenlabs": (elevenlabs_server, elevenlabs_url),
+        "feeds": (feed_server, feed_url),
+        "hub": (hub_server, hub_url),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run local stand-ins for OpenAI, ElevenLabs and RSS feeds")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--openai-port", type=int, default=8701)
+    parser.add_argument("--elevenlabs-port", type=int, default=8702)
+    parser.add_argument("--feeds-port", type=int, default=8703)
+    parser.add_argument("--hub-port", type=int, default=8704)
+    parser.add_argument("--advertise-hub", action="store_true", help="Make the feeds advertise the stand-in WebSub hub")
+    parser.add_argument("--latency", type=float, default=0.0, help="Base delay per API request in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay per API request in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of API requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of API requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429 responses")
+    parser.add_argument("--stream-delay", type=float, default=0.0, help="Delay between streamed chat completion chunks in seconds")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    OpenAIStubHandler.stream_delay = args.stream_delay
+    stub_config = StubConfig(args.latency, args.jitter, args.error_rate, args.rate_limit_rate, args.retry_after)
+    servers = start_all(stub_config, args.host, (args.openai_port, args.elevenlabs_port, args.feeds_port, args.hub_port))
+    if args.advertise_hub:
+        FeedStubHandler.hub_url = servers["hub"][1]
+    
+    print(f"OPENAI_BASE_URL={servers['openai'][1]}/v1")
+    print(f"ELEVENLABS_API_BASE={servers['elevenlabs'][1]}")
+    print(f"Feeds: {servers['feeds'][1]}/feeds/1.xml ... /feeds/N.xml")
+    print(f"WebSub hub: {servers['hub'][1]}")
+    
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
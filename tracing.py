@@ -0,0 +1,327 @@
+"""
+Lightweight tracing with OpenTelemetry-compatible span data.
+
+An episode gets a trace ID when its script is generated; the ID is stored on
+the episode so the audio thread and the publish request can add their spans
+to the same trace. Spans are exported in OTLP/JSON by a background thread,
+either appended to a local JSON lines file or posted to a collector:
+
+    TRACE_EXPORTER=file   (default) TRACE_FILE=storage/traces/spans.jsonl
+    TRACE_EXPORTER=otlp   OTEL_EXPORTER_OTLP_ENDPOINT=http://localhost:4318
+    TRACE_EXPORTER=none
+"""
+import os
+import json
+import time
+import queue
+import fcntl
+import atexit
+import logging
+import secrets
+import threading
+import contextvars
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "aipodcast")
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "file").lower()
+TRACE_FILE = os.environ.get("TRACE_FILE", os.path.join("storage", "traces", "spans.jsonl"))
+OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318").rstrip("/")
+
+# OTLP status codes
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# Spans waiting for the exporter; when it falls behind new spans are dropped
+MAX_QUEUED_SPANS = 10000
+EXPORT_BATCH_SIZE = 512
+EXPORT_INTERVAL = 2.0
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_export_queue = queue.Queue(maxsize=MAX_QUEUED_SPANS)
+_exporter_thread = None
+_exporter_lock = threading.Lock()
+_dropped_spans = 0
+
+def new_trace_id():
+    """
+    Create a random trace ID
+    
+    Returns:
+        str: 32 hex characters
+    """
+    return secrets.token_hex(16)
+
+def new_span_id():
+    """
+    Create a random span ID
+    
+    Returns:
+        str: 16 hex characters
+    """
+    return secrets.token_hex(8)
+
+def current_span():
+    """Get the active span of this thread, or None"""
+    return _current_span.get()
+
+def current_trace_id():
+    """Get the trace ID of the active span, or None"""
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+class Span:
+    """
+    A timed operation within a trace
+    
+    Use it as a context manager, or call end() explicitly when the
+    operation does not fit in one block.
+    """
+    
+    def __init__(self, name, trace_id=None, parent_id=None, attributes=None, links=None, start_time=None):
+        self.name = name
+        self.trace_id = trace_id or new_trace_id()
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.links = list(links or [])
+        self.events = []
+        self.start_time = start_time if start_time is not None else time.time()
+        self.end_time = None
+        self.status = STATUS_OK
+        self.status_message = ""
+        self._token = None
+    
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+    
+    def add_event(self, name, attributes=None):
+        self.events.append((name, time.time(), dict(attributes or {})))
+    
+    def record_exception(self, error):
+        """Mark the span as failed and attach the exception"""
+        self.status = STATUS_ERROR
+        self.status_message = str(error)[:500]
+        self.add_event("exception", {
+            "exception.type": type(error).__name__,
+            "exception.message": str(error)[:500],
+        })
+    
+    def end(self, end_time=None):
+        """Finish the span, restore the previous active span and queue it for export"""
+        if self.end_time is not None:
+            return
+        self.end_time = end_time if end_time is not None else time.time()
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # Ended in another context than it was started in
+                pass
+            self._token = None
+        export_span(self)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.record_exception(exc)
+        self.end()
+        return False
+    
+    def to_otlp(self):
+        """
+        Convert the span to the OTLP/JSON representation
+        
+        Returns:
+            dict: OTLP span
+        """
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(int(self.start_time * 1e9)),
+            "endTimeUnixNano": str(int((self.end_time or time.time()) * 1e9)),
+            "attributes": otlp_attributes(self.attributes),
+            "status": {"code": self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        if self.events:
+            span["events"] = [
+                {"name": name, "timeUnixNano": str(int(at * 1e9)), "attributes": otlp_attributes(attributes)}
+                for name, at, attributes in self.events
+            ]
+        if self.links:
+            span["links"] = [{"traceId": link.trace_id, "spanId": link.span_id} for link in self.links]
+        return span
+
+def start_span(name, trace_id=None, attributes=None, links=None):
+    """
+    Start a span and make it the active span of this thread
+    
+    The span becomes a child of the active span when both belong to the same
+    trace (or no trace ID is given); otherwise it starts a root span.
+    
+    Args:
+        name (str): Operation name, e.g. llm.summarize_article
+        trace_id (str): Trace to add the span to, e.g. episode.trace_id
+        attributes (dict): Span attributes
+        links (list): Spans of other traces this span relates to
+    
+    Returns:
+        Span: The started span
+    """
+    parent = _current_span.get()
+    parent_id = None
+    if parent and (trace_id is None or trace_id == parent.trace_id):
+        trace_id = parent.trace_id
+        parent_id = parent.span_id
+    
+    span = Span(name, trace_id, parent_id, attributes, links)
+    span._token = _current_span.set(span)
+    return span
+
+def record_span(name, start_time, end_time, trace_id=None, attributes=None, links=None, error=None):
+    """
+    Export a span for an operation that was timed by hand
+    
+    Args:
+        name (str): Operation name
+        start_time (float): Start as a Unix timestamp
+        end_time (float): End as a Unix timestamp
+        trace_id (str): Trace to add the span to; defaults to the active trace
+        attributes (dict): Span attributes
+        links (list): Spans of other traces this span relates to
+        error (Exception): Failure to record on the span
+    
+    Returns:
+        Span: The finished span
+    """
+    parent = _current_span.get()
+    parent_id = None
+    if parent and (trace_id is None or trace_id == parent.trace_id):
+        trace_id = parent.trace_id
+        parent_id = parent.span_id
+    
+    span = Span(name, trace_id, parent_id, attributes, links, start_time=start_time)
+    if error is not None:
+        span.record_exception(error)
+    span.end(end_time)
+    return span
+
+def otlp_attributes(attributes):
+    """Convert a dict to an OTLP attribute list"""
+    converted = []
+    for key, value in attributes.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        converted.append({"key": key, "value": typed})
+    return converted
+
+def build_export_request(spans):
+    """
+    Wrap spans in an OTLP ExportTraceServiceRequest
+    
+    Args:
+        spans (list): OTLP span dicts
+    
+    Returns:
+        dict: Request body
+    """
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": otlp_attributes({"service.name": SERVICE_NAME, "process.pid": os.getpid()})},
+            "scopeSpans": [{"scope": {"name": "aipodcast.tracing"}, "spans": spans}],
+        }]
+    }
+
+def export_span(span):
+    """Queue a finished span for the exporter thread"""
+    global _dropped_spans
+    
+    if TRACE_EXPORTER == "none":
+        return
+    
+    ensure_exporter()
+    try:
+        _export_queue.put_nowait(span.to_otlp())
+    except queue.Full:
+        _dropped_spans += 1
+        if _dropped_spans % 1000 == 1:
+            logger.warning(f"Trace export queue is full, dropped {_dropped_spans} span(s)")
+
+def ensure_exporter():
+    """Start the exporter thread of this process if it is not running"""
+    global _exporter_thread
+    
+    if _exporter_thread is not None and _exporter_thread.is_alive():
+        return
+    with _exporter_lock:
+        if _exporter_thread is None or not _exporter_thread.is_alive():
+            _exporter_thread = threading.Thread(target=export_loop, name="trace-exporter", daemon=True)
+            _exporter_thread.start()
+
+def export_loop():
+    """Collect spans into batches and write them out"""
+    while True:
+        batch = [_export_queue.get()]
+        deadline = time.time() + EXPORT_INTERVAL
+        while len(batch) < EXPORT_BATCH_SIZE:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_export_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        write_batch(batch)
+
+def flush():
+    """Export every queued span now (called at interpreter exit)"""
+    batch = []
+    while True:
+        try:
+            batch.append(_export_queue.get_nowait())
+        except queue.Empty:
+            break
+    if batch:
+        write_batch(batch)
+
+def write_batch(spans):
+    """
+    Send one batch of spans to the configured exporter
+    
+    Args:
+        spans (list): OTLP span dicts
+    """
+    body = build_export_request(spans)
+    try:
+        if TRACE_EXPORTER == "otlp":
+            import requests
+            response = requests.post(f"{OTLP_ENDPOINT}/v1/traces", json=body, timeout=10)
+            if response.status_code >= 300:
+                logger.warning(f"Trace collector rejected {len(spans)} span(s): HTTP {response.status_code}")
+        else:
+            os.makedirs(os.path.dirname(TRACE_FILE) or ".", exist_ok=True)
+            line = json.dumps(body, separators=(",", ":")) + "\n"
+            with open(TRACE_FILE, "a") as f:
+                # Several workers append to the same file
+                fcntl.flock(f, fcntl.LOCK_EX)
+                f.write(line)
+    except Exception as e:
+        logger.warning(f"Error exporting {len(spans)} span(s): {str(e)}")
+
+atexit.register(flush)
@@ -7,10 +7,19 @@ import subprocess
 from pydub import AudioSegment
 from models import ElevenLabsVoice
 
+import metrics
+import tracing
+import ratelimit
+
+logger = logging.getLogger(__name__)
+
 # Configure pydub to find ffmpeg
 from pydub.utils import which
 AudioSegment.converter = which("ffmpeg") or "/usr/bin/ffmpeg"
 
+# Base URL of the ElevenLabs API (overridable to point at a local stand-in server)
+ELEVENLABS_API_BASE = os.environ.get("ELEVENLABS_API_BASE", "https://api.elevenlabs.io").rstrip("/")
+
 def get_elevenlabs_api_key():
     """
     Get ElevenLabs API key from environment variables or database
@@ -18,33 +27,33 @@ def get_elevenlabs_api_key():
     Returns:
         str: ElevenLabs API key
     """
-    logging.info("Retrieving ElevenLabs API key")
+    logger.debug("Retrieving ElevenLabs API key")
     
     # First try environment variable
-    elevenlabs_api_key = os.environ.get("ELEVENLABS_API_KEY" # Add your key here)
+    elevenlabs_api_key = os.environ.get("ELEVENLABS_API_KEY")
     if elevenlabs_api_key:
-        logging.info("Found ElevenLabs API key in environment variables")
+        logger.debug("Found ElevenLabs API key in environment variables")
     
     # If not found in environment, check database
     if not elevenlabs_api_key:
-        logging.info("ElevenLabs API key not found in environment, checking database")
+        logger.debug("ElevenLabs API key not found in environment, checking database")
         from app import app, db
         import models
         with app.app_context():
             api_key = models.ApiKey.query.filter_by(name="ELEVENLABS_API_KEY").first()
             if api_key:
                 elevenlabs_api_key = api_key.value
-                logging.info("Found ElevenLabs API key in database")
+                logger.debug("Found ElevenLabs API key in database")
             else:
-                logging.error("No ELEVENLABS_API_KEY record found in database")
+                logger.error("No ELEVENLABS_API_KEY record found in database")
         
     if not elevenlabs_api_key:
-        logging.error("ElevenLabs API key not found in environment variables or database")
+        logger.error("ElevenLabs API key not found in environment variables or database")
         return None
     
     # Log key length for debugging (don't log the actual key)
     original_length = len(elevenlabs_api_key)
-    logging.info(f"Original ElevenLabs API key length: {original_length}")
+    logger.debug("Original ElevenLabs API key length: %s", original_length)
     
     # Ensure API key doesn't have extra whitespace or unexpected text
     elevenlabs_api_key = elevenlabs_api_key.strip()
@@ -52,39 +61,39 @@ def get_elevenlabs_api_key():
     # If key has quotes, remove them
     if elevenlabs_api_key.startswith('"') and elevenlabs_api_key.endswith('"'):
         elevenlabs_api_key = elevenlabs_api_key[1:-1]
-        logging.warning("Removed double quotes from ElevenLabs API key")
+        logger.warning("Removed double quotes from ElevenLabs API key")
     
     if elevenlabs_api_key.startswith("'") and elevenlabs_api_key.endswith("'"):
         elevenlabs_api_key = elevenlabs_api_key[1:-1]
-        logging.warning("Removed single quotes from ElevenLabs API key")
+        logger.warning("Removed single quotes from ElevenLabs API key")
     
     # If key has spaces, take only the first part (the actual API key)
     if ' ' in elevenlabs_api_key:
-        logging.warning("ElevenLabs API key contains spaces. Using only the first part.")
+        logger.warning("ElevenLabs API key contains spaces. Using only the first part.")
         elevenlabs_api_key = elevenlabs_api_key.split()[0]
     
     # Remove any remaining quotes
     original_key = elevenlabs_api_key
     elevenlabs_api_key = elevenlabs_api_key.replace("'", "").replace('"', "")
     if elevenlabs_api_key != original_key:
-        logging.warning("Removed embedded quotes from ElevenLabs API key")
+        logger.warning("Removed embedded quotes from ElevenLabs API key")
     
     # Check final key length
     final_length = len(elevenlabs_api_key)
-    logging.info(f"Final ElevenLabs API key length: {final_length}")
+    logger.debug("Final ElevenLabs API key length: %s", final_length)
     if original_length != final_length:
-        logging.warning(f"API key length changed from {original_length} to {final_length}")
+        logger.warning("API key length changed from %s to %s", original_length, final_length)
     
     # Mask the key for logging (show first 4 and last 4 characters)
     if len(elevenlabs_api_key) > 8:
         masked_key = elevenlabs_api_key[:4] + "..." + elevenlabs_api_key[-4:]
     else:
         masked_key = "***"
-    logging.info(f"Using ElevenLabs API key: {masked_key}")
+    logger.debug("Using ElevenLabs API key: %s", masked_key)
     
     # Ensure the key has the expected format
     if not elevenlabs_api_key.startswith("sk_"):
-        logging.warning(f"ElevenLabs API key has unexpected format (should start with 'sk_')")
+        logger.warning("ElevenLabs API key has unexpected format (should start with 'sk_')")
         
     return elevenlabs_api_key
 
@@ -99,7 +108,7 @@ def check_elevenlabs_api_key(api_key):
         tuple: (bool, str) - Success status and error message if failed
     """
     if not api_key:
-        logging.error("API key is missing")
+        logger.error("API key is missing")
         return False, "API key is missing"
     
     # Clean up the key just to be safe
@@ -107,10 +116,10 @@ def check_elevenlabs_api_key(api_key):
     
     try:
         # Make a simple request to the ElevenLabs API to check the key
-        url = "https://api.elevenlabs.io/v1/voices"
+        url = f"{ELEVENLABS_API_BASE}/v1/voices"
         headers = {"xi-api-key": api_key}
         
-        logging.info("Making test request to ElevenLabs API to validate key")
+        logger.debug("Making test request to ElevenLabs API to validate key")
         response = requests.get(url, headers=headers)
         
         if response.status_code == 200:
@@ -133,29 +142,30 @@ def check_elevenlabs_api_key(api_key):
                     
                     # Check if this is the Archie/Jeremy voice
                     if voice.get("voice_id") == archie_voice_id:
-                        logging.info(f"Found voice with ID {archie_voice_id}: {voice.get('name')}")
+                        logger.debug("Found voice with ID %s: %s", archie_voice_id, voice.get('name'))
                         archie_found = True
             
-            logging.info(f"ElevenLabs API key is valid. Found {len(voices)} voices.")
-            logging.info(f"Available voices: {', '.join(voice_names)}")
+            logger.info("ElevenLabs API key is valid. Found %s voices.", len(voices))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Available voices: %s", ', '.join(voice_names))
             
             # Check if Archie/Jeremy's voice is available
             if not archie_found:
-                logging.warning(f"Voice with ID {archie_voice_id} (Archie/Jeremy) not found in available voices")
+                logger.warning("Voice with ID %s (Archie/Jeremy) not found in available voices", archie_voice_id)
             
             return True, ""
         else:
             error_msg = f"ElevenLabs API key validation failed with status code {response.status_code}: {response.text}"
-            logging.error(error_msg)
+            logger.error(error_msg)
             return False, error_msg
     
     except requests.exceptions.RequestException as req_error:
         error_msg = f"Network error when connecting to ElevenLabs API: {str(req_error)}"
-        logging.error(error_msg)
+        logger.error(error_msg)
         return False, error_msg
     except Exception as e:
         error_msg = f"Error checking ElevenLabs API key: {str(e)}"
-        logging.error(error_msg)
+        logger.error(error_msg)
         return False, error_msg
 
 def chunk_text(text, max_chars=9000):
@@ -203,15 +213,57 @@ def chunk_text(text, max_chars=9000):
     if current_chunk:
         chunks.append(current_chunk)
     
-    logging.info(f"Split text into {len(chunks)} chunks for TTS processing")
+    logger.info("Split text into %s chunks for TTS processing", len(chunks))
     return chunks
 
+# A small first chunk gets the first audio back sooner when the text is streamed
+FIRST_CHUNK_CHARS = 500
+
+def iter_text_chunks(sentences, max_chars=4000, first_chars=FIRST_CHUNK_CHARS):
+    """
+    Group sentences into TTS chunks as they arrive.
+    
+    A chunk is handed out as soon as it is full, so its audio can be requested
+    while later sentences are still being generated. The first chunk is kept
+    small to shorten the time to the first audio.
+    
+    Args:
+        sentences (iterable): Sentences, e.g. from gpt.stream_podcast_script
+        max_chars (int): Maximum characters per chunk
+        first_chars (int): Size at which the first chunk is handed out
+        
+    Returns:
+        generator: Text chunks ending on sentence boundaries
+    """
+    current_chunk = ""
+    target = min(first_chars, max_chars)
+    
+    for sentence in sentences:
+        # A sentence that does not fit in any chunk is split on its own
+        pieces = chunk_text(sentence, max_chars) if len(sentence) > max_chars else [sentence]
+        for piece in pieces:
+            if current_chunk.strip() and len(current_chunk) + len(piece) > max_chars:
+                yield current_chunk
+                current_chunk = ""
+                target = max_chars
+            current_chunk += piece
+        
+        if len(current_chunk) >= target:
+            yield current_chunk
+            current_chunk = ""
+            target = max_chars
+    
+    if current_chunk.strip():
+        yield current_chunk
+
 def convert_to_speech(text, voice_settings, output_path, task_id=None):
     """
     Convert text to speech using ElevenLabs API
     
     Args:
-        text (str): Text to convert to speech
+        text (str or iterable): Text to convert to speech, or sentences as they are
+            generated (see gpt.stream_podcast_script); chunks of a stream are sent
+            as soon as they fill up
         voice_settings (ElevenLabsVoice): Voice settings
         output_path (str): Path to save the audio file
         
@@ -227,9 +279,9 @@ def convert_to_speech(text, voice_settings, output_path, task_id=None):
             
             def update_progress(progress, message=None):
                 set_task_progress(task_id, progress, message)
-                logging.info(f"Updated task {task_id} progress to {progress}% - {message}")
+                logger.debug("Updated task %s progress to %s%% - %s", task_id, progress, message)
         except ImportError:
-            logging.warning("Could not import background_task module for progress updates")
+            logger.warning("Could not import background_task module for progress updates")
     
     # Update progress to show we've started
     if update_progress:
@@ -238,7 +290,7 @@ def convert_to_speech(text, voice_settings, output_path, task_id=None):
     api_key = get_elevenlabs_api_key()
     if not api_key:
         error_msg = "ElevenLabs API key not found. Please configure it in the API Keys settings."
-        logging.error(error_msg)
+        logger.error(error_msg)
         if update_progress:
             update_progress(10, f"Error: {error_msg}")
         raise Exception(error_msg)
@@ -264,11 +316,18 @@ def convert_to_speech(text, voice_settings, output_path, task_id=None):
         if update_progress:
             update_progress(20, "Splitting text into manageable chunks...")
             
-        text_chunks = chunk_text(text, max_chars=4000)  # Reduced chunk size for better reliability
-        logging.info(f"Processing {len(text_chunks)} chunks for text-to-speech conversion")
+        if isinstance(text, str):
+            text_chunks = chunk_text(text, max_chars=4000)  # Reduced chunk size for better reliability
+            total_chunks = len(text_chunks)
+            logger.info("Processing %s chunks for text-to-speech conversion", total_chunks)
+        else:
+            # Streamed text: the number of chunks is only known at the end
+            text_chunks = iter_text_chunks(text, max_chars=4000)
+            total_chunks = None
+            logger.info("Processing streamed text for text-to-speech conversion")
         
         if update_progress:
-            update_progress(25, f"Ready to process {len(text_chunks)} chunks of text...")
+            update_progress(25, f"Ready to process {total_chunks or 'streamed'} chunks of text...")
         
         # Process each chunk and combine the audio
         combined_audio = None
@@ -277,7 +336,7 @@ def convert_to_speech(text, voice_settings, output_path, task_id=None):
         voice_id = voice_settings.voice_id
         
         # Log voice ID for debugging
-        logging.info(f"Using voice ID: {voice_id}")
+        logger.debug("Using voice ID: %s", voice_id)
         
         # Map voice names to their IDs based on the ElevenLabs API
         voice_name_mapping = {
@@ -293,14 +352,14 @@ def convert_to_speech(text, voice_settings, output_path, task_id=None):
         if voice_id_lower in voice_name_mapping:
             original_voice_id = voice_id
             voice_id = voice_name_mapping[voice_id_lower]
-            logging.info(f"Mapped voice name '{original_voice_id}' to ID: {voice_id}")
+            logger.info("Mapped voice name '%s' to ID: %s", original_voice_id, voice_id)
         
         # Double check if we have a valid voice ID
         if not voice_id or len(voice_id) < 10:
-            logging.warning(f"Voice ID '{voice_id}' appears invalid, will try to use anyway")
+            logger.warning("Voice ID '%s' appears invalid, will try to use anyway", voice_id)
         
         # Set up API request parameters
-        url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+        url = f"{ELEVENLABS_API_BASE}/v1/text-to-speech/{voice_id}"
         
         headers = {
             "Accept": "audio/mpeg",
@@ -313,17 +372,22 @@ def convert_to_speech(text, voice_settings, output_path, task_id=None):
             "similarity_boost": voice_settings.similarity_boost
         }
         
+        convert_started = time.perf_counter()
         for i, chunk in enumerate(text_chunks):
-            logging.info(f"Processing chunk {i+1}/{len(text_chunks)} with {len(chunk)} characters")
+            chunk_label = f"{i+1}/{total_chunks}" if total_chunks else f"{i+1}"
+            logger.info("Processing chunk %s with %s characters", chunk_label, len(chunk))
             
             # Calculate current progress: 25% start + 60% progress spread across chunks
             if update_progress:
-                chunk_progress = 25 + int((i / len(text_chunks)) * 60)
-                update_progress(chunk_progress, f"Processing chunk {i+1} of {len(text_chunks)}...")
+                if total_chunks:
+                    chunk_progress = 25 + int((i / total_chunks) * 60)
+                else:
+                    chunk_progress = 25 + min(55, i * 5)
+                update_progress(chunk_progress, f"Processing chunk {chunk_label}...")
             
             # Skip empty chunks
             if not chunk.strip():
-                logging.warning(f"Skipping empty chunk {i+1}")
+                logger.warning("Skipping empty chunk %s", i+1)
                 continue
                 
             data = {
@@ -332,9 +396,11 @@ def convert_to_speech(text, voice_settings, output_path, task_id=None):
                 "voice_settings": voice_settings_dict
             }
             
-            # Number of retries
-            max_retries = 3
+            # Number of attempts; waits between them come from the shared rate limiter and backoff
+            max_retries = 5
             retry_count = 0
+            chunk_started = time.perf_counter()
+            chunk_started_at = time.time()
             
             while retry_count < max_retries:
                 try:
@@ -342,10 +408,12 @@ def convert_to_speech(text, voice_settings, output_path, task_id=None):
                     if update_progress:
                         update_progress(
                             chunk_progress, 
-                            f"Sending chunk {i+1}/{len(text_chunks)} to API (attempt {retry_count+1})..."
+                            f"Sending chunk {chunk_label} to API (attempt {retry_count+1})..."
                         )
                         
-                    logging.info(f"Making API request for chunk {i+1} (attempt {retry_count+1})")
+                    logger.debug("Making API request for chunk %s (attempt %s)", i+1, retry_count+1)
+                    # Wait for the shared ElevenLabs bucket of this key
+                    ratelimit.acquire("elevenlabs", api_key)
                     # Use a longer timeout for ElevenLabs API which can sometimes take longer
                     response = requests.post(
                         url, 
@@ -353,16 +421,17 @@ def convert_to_speech(text, voice_settings, output_path, task_id=None):
                         headers=headers,
                         timeout=60  # Increased to 60 seconds timeout
                     )
+                    ratelimit.observe_response("elevenlabs", api_key, response.status_code, response.headers)
                     
                     if response.status_code != 200:
                         error_msg = f"ElevenLabs API request failed with status code {response.status_code}: {response.text}"
-                        logging.error(error_msg)
+                        logger.error(error_msg)
                         
                         # Specifically check for credit-related errors
                         response_text = response.text.lower()
                         if 'insufficient credit' in response_text or 'character quota' in response_text or 'credits depleted' in response_text or 'reached maximum quota' in response_text:
                             credit_error = "Your ElevenLabs account has insufficient credits. Please add more credits to your ElevenLabs account to continue generating podcast audio."
-                            logging.error(credit_error)
+                            logger.error(credit_error)
                             if update_progress:
                                 update_progress(chunk_progress, f"Error: {credit_error}")
                             raise Exception(credit_error)
@@ -370,9 +439,10 @@ def convert_to_speech(text, voice_settings, output_path, task_id=None):
                         # For some status codes, we should retry
                         if response.status_code in [429, 500, 502, 503, 504]:
                             retry_count += 1
+                            metrics.record_retry("tts_chunk", f"http_{response.status_code}")
                             if retry_count < max_retries:
-                                logging.info(f"Retrying after error (attempt {retry_count+1})")
-                                time.sleep(2)  # Wait 2 seconds before retry
+                                logger.info("Retrying after error (attempt %s)", retry_count+1)
+                                time.sleep(ratelimit.backoff_delay(retry_count))
                                 continue
                             else:
                                 raise Exception(error_msg)
@@ -382,18 +452,19 @@ def convert_to_speech(text, voice_settings, output_path, task_id=None):
                     
                     # Verify that we got actual audio data
                     if len(response.content) < 100:  # An MP3 should be larger than this
-                        logging.error(f"Received suspiciously small response: {len(response.content)} bytes")
-                        logging.error(f"Response content: {response.content}")
+                        logger.error("Received suspiciously small response: %s bytes", len(response.content))
+                        logger.debug("Response content: %r", response.content[:200])
                         retry_count += 1
+                        metrics.record_retry("tts_chunk", "small_response")
                         if retry_count < max_retries:
-                            logging.info(f"Retrying after small response error (attempt {retry_count+1})")
-                            time.sleep(2)
+                            logger.info("Retrying after small response error (attempt %s)", retry_count+1)
+                            time.sleep(ratelimit.backoff_delay(retry_count))
                             continue
                         else:
                             raise Exception("Received invalid audio data from API")
                     
                     # Successful response, process it
-                    logging.info(f"Successfully received audio for chunk {i+1} ({len(response.content)} bytes)")
+                    logger.debug("Successfully received audio for chunk %s (%s bytes)", i+1, len(response.content))
                     
                     # Load audio chunk
                     try:
@@ -405,48 +476,66 @@ def convert_to_speech(text, voice_settings, output_path, task_id=None):
                         else:
                             combined_audio += chunk_audio
                         
+                        metrics.TTS_CHARACTERS.inc(len(chunk))
+                        if i == 0:
+                            metrics.TIME_TO_FIRST_OUTPUT.labels("tts").observe(time.perf_counter() - convert_started)
+                        metrics.observe_stage("tts_chunk", chunk_started)
+                        tracing.record_span("tts.chunk", chunk_started_at, time.time(), attributes={
+                            "tts.chunk.index": i,
+                            "tts.chunk.characters": len(chunk),
+                            "tts.chunk.retries": retry_count,
+                        })
+                        
                         # Break out of retry loop
                         break
                         
                     except Exception as audio_error:
                         error_msg = f"Error processing audio data for chunk {i+1}: {str(audio_error)}"
-                        logging.error(error_msg)
+                        logger.error(error_msg)
                         retry_count += 1
+                        metrics.record_retry("tts_chunk", "audio_decode")
                         if retry_count < max_retries:
-                            logging.info(f"Retrying after audio processing error (attempt {retry_count+1})")
-                            time.sleep(2)
+                            logger.info("Retrying after audio processing error (attempt %s)", retry_count+1)
+                            time.sleep(ratelimit.backoff_delay(retry_count))
                             continue
                         else:
                             raise Exception(error_msg)
                         
+                except ratelimit.RetriesExhausted:
+                    # The rate limit wait alone exceeded its limit; more attempts would wait again
+                    raise
+                    
                 except requests.exceptions.Timeout:
-                    logging.error(f"Request timeout for chunk {i+1}")
+                    logger.error("Request timeout for chunk %s", i+1)
                     retry_count += 1
+                    metrics.record_retry("tts_chunk", "timeout")
                     if retry_count < max_retries:
-                        logging.info(f"Retrying after timeout (attempt {retry_count+1})")
-                        time.sleep(2)
+                        logger.info("Retrying after timeout (attempt %s)", retry_count+1)
+                        time.sleep(ratelimit.backoff_delay(retry_count))
                         continue
                     else:
                         raise Exception(f"Request timeout for chunk {i+1} after {max_retries} attempts")
                         
                 except requests.exceptions.RequestException as req_error:
                     error_msg = f"Network error when connecting to ElevenLabs API: {str(req_error)}"
-                    logging.error(error_msg)
+                    logger.error(error_msg)
                     retry_count += 1
+                    metrics.record_retry("tts_chunk", "network")
                     if retry_count < max_retries:
-                        logging.info(f"Retrying after network error (attempt {retry_count+1})")
-                        time.sleep(2)
+                        logger.info("Retrying after network error (attempt %s)", retry_count+1)
+                        time.sleep(ratelimit.backoff_delay(retry_count))
                         continue
                     else:
                         raise Exception(error_msg)
                         
                 except Exception as chunk_error:
                     error_msg = f"Error processing chunk {i+1}: {str(chunk_error)}"
-                    logging.error(error_msg)
+                    logger.error(error_msg)
                     retry_count += 1
+                    metrics.record_retry("tts_chunk", "error")
                     if retry_count < max_retries:
-                        logging.info(f"Retrying after general error (attempt {retry_count+1})")
-                        time.sleep(2)
+                        logger.info("Retrying after general error (attempt %s)", retry_count+1)
+                        time.sleep(ratelimit.backoff_delay(retry_count))
                         continue
                     else:
                         raise Exception(error_msg)
@@ -466,15 +555,16 @@ def convert_to_speech(text, voice_settings, output_path, task_id=None):
                 
                 # Save audio to a temporary file first
                 temp_path = f"{output_path}.temp"
-                logging.info(f"Saving audio to temporary file: {temp_path}")
-                combined_audio.export(temp_path, format="mp3")
+                logger.info("Saving audio to temporary file: %s", temp_path)
+                with metrics.track_stage("audio_finalize"):
+                    combined_audio.export(temp_path, format="mp3")
                 
                 # Then move to the final path
                 if os.path.exists(temp_path):
                     if os.path.exists(output_path):
                         os.remove(output_path)  # Remove existing file if present
                     os.rename(temp_path, output_path)
-                    logging.info(f"Successfully generated combined audio file at {output_path}")
+                    logger.info("Successfully generated combined audio file at %s", output_path)
                     
                     if update_progress:
                         update_progress(100, "Audio generation completed successfully!")
@@ -485,7 +575,7 @@ def convert_to_speech(text, voice_settings, output_path, task_id=None):
                         update_progress(85, "Error: Failed to save audio file")
                     raise Exception(f"Failed to save temporary audio file at {temp_path}")
             except Exception as save_error:
-                logging.error(f"Error saving audio file: {str(save_error)}")
+                logger.error("Error saving audio file: %s", str(save_error))
                 if update_progress:
                     update_progress(85, f"Error: {str(save_error)}")
                 raise Exception(f"Error saving audio file: {str(save_error)}")
@@ -495,5 +585,6 @@ def convert_to_speech(text, voice_settings, output_path, task_id=None):
             raise Exception("Failed to generate any audio content")
     
     except Exception as e:
-        logging.error(f"Error converting text to speech: {str(e)}")
+        metrics.record_error("text_to_speech", e)
+        logger.error("Error converting text to speech: %s", str(e))
         raise Exception(f"Error converting text to speech: {str(e)}")
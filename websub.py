@@ -0,0 +1,385 @@
+"""
+WebSub (PubSubHubbub) push ingestion.
+
+Feeds that name a hub, in an <atom:link rel="hub"> element or a Link
+header, are subscribed to once WEBSUB_CALLBACK_URL is set to the address
+the hub can reach this app at. The hub then posts new content to
+/websub/callback/<token>, where it is checked against the subscription's
+secret and stored in the article archive right away. A subscribed feed is
+still polled every WEBSUB_FALLBACK_INTERVAL seconds in case the hub misses
+something. The ingestion thread (see ingest.py) sends the subscription
+requests and renews leases before they run out.
+"""
+import os
+import re
+import hmac
+import html
+import logging
+import secrets
+from datetime import datetime, timedelta
+
+from requests.utils import parse_header_links
+
+import feed_transport
+
+logger = logging.getLogger(__name__)
+
+# Public base URL of this app, e.g. https://podcasts.example.com; empty switches WebSub off
+WEBSUB_CALLBACK_URL = os.environ.get("WEBSUB_CALLBACK_URL", "").rstrip("/")
+
+# Lease asked for, in seconds; hubs may grant a different one
+WEBSUB_LEASE_SECONDS = int(os.environ.get("WEBSUB_LEASE_SECONDS", str(7 * 86400)))
+
+# Seconds between polls of a feed whose hub pushes its content
+WEBSUB_FALLBACK_INTERVAL = int(os.environ.get("WEBSUB_FALLBACK_INTERVAL", "21600"))
+
+# Leases are renewed when less than this share of them, but at least an hour, is left
+RENEW_SHARE = 0.1
+MIN_RENEW_MARGIN = 3600
+
+# Seconds to wait for a hub's intent verification before asking again
+VERIFY_TIMEOUT = 3600
+
+# Seconds before a denied or failed subscription is requested again
+RETRY_INTERVAL = 6 * 3600
+
+# Hub links are looked for in the feed head, before this many bytes or the first entry
+HEAD_BYTES = 32 * 1024
+
+SIGNATURE_METHODS = {"sha1", "sha256", "sha384", "sha512"}
+
+LINK_PATTERN = re.compile(rb"<(?:[\w-]+:)?link\b[^>]*>", re.IGNORECASE)
+ATTRIBUTE_PATTERN = re.compile(rb"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+ENTRY_PATTERN = re.compile(rb"<(?:[\w-]+:)?(?:item|entry)\b", re.IGNORECASE)
+
+def is_enabled():
+    """Check whether a callback URL is configured"""
+    return bool(WEBSUB_CALLBACK_URL)
+
+def get_callback_url(token):
+    """Get the URL a hub posts a subscription's content to"""
+    return f"{WEBSUB_CALLBACK_URL}/websub/callback/{token}"
+
+def find_hub(content, headers=None):
+    """
+    Find the hub a feed advertises and the topic URL to subscribe with
+    
+    Args:
+        content (bytes): Feed document
+        headers (dict): Response headers as returned by feed_transport.fetch_feed
+    
+    Returns:
+        tuple: (hub URL, self URL), either None if not advertised
+    """
+    hub = topic = None
+    link_header = (headers or {}).get("link")
+    if link_header:
+        for link in parse_header_links(link_header):
+            rels = link.get("rel", "").split()
+            if "hub" in rels and not hub:
+                hub = link.get("url")
+            if "self" in rels and not topic:
+                topic = link.get("url")
+    
+    head = (content or b"")[:HEAD_BYTES]
+    entry = ENTRY_PATTERN.search(head)
+    if entry:
+        head = head[:entry.start()]
+    for element in LINK_PATTERN.findall(head):
+        attributes = {
+            name.lower(): (double if double is not None else single)
+            for name, double, single in ATTRIBUTE_PATTERN.findall(element)
+        }
+        href = attributes.get(b"href", b"").strip()
+        rels = attributes.get(b"rel", b"").lower().split()
+        if not href:
+            continue
+        if b"hub" in rels and not hub:
+            hub = html.unescape(href.decode("utf-8", "replace"))
+        if b"self" in rels and not topic:
+            topic = html.unescape(href.decode("utf-8", "replace"))
+    return hub, topic
+
+def record_hub(feed_url, content, headers=None):
+    """
+    Remember the hub of a fetched feed, so the ingestion thread subscribes to it
+    
+    Args:
+        feed_url (str): RSS feed URL
+        content (bytes): Feed document
+        headers (dict): Response headers as returned by feed_transport.fetch_feed
+    """
+    from app import db
+    import models
+    
+    if not is_enabled():
+        return
+    hub, topic = find_hub(content, headers)
+    if not hub:
+        return
+    topic = topic or feed_url
+    
+    try:
+        subscription = models.WebSubSubscription.query.filter_by(feed_url=feed_url).first()
+        if subscription is not None and subscription.hub == hub and subscription.topic == topic:
+            return
+        if subscription is None:
+            subscription = models.WebSubSubscription(
+                feed_url=feed_url, token=secrets.token_urlsafe(24), secret=secrets.token_hex(32)
+            )
+            db.session.add(subscription)
+        subscription.hub = hub
+        subscription.topic = topic
+        subscription.state = "new"
+        db.session.commit()
+        logger.info(f"Feed {feed_url} advertises WebSub hub {hub}")
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error recording WebSub hub of feed {feed_url}: {str(e)}")
+
+def request_subscription(subscription, mode="subscribe", now=None):
+    """
+    Ask a subscription's hub to (un)subscribe; the hub then verifies the intent
+    
+    Args:
+        subscription (WebSubSubscription): Subscription row; a failure is committed by the caller
+        mode (str): 'subscribe' or 'unsubscribe'
+        now (datetime): Current time (UTC), defaults to now
+    
+    Returns:
+        bool: True if the hub accepted the request
+    """
+    from app import db
+    
+    data = {
+        "hub.mode": mode,
+        "hub.topic": subscription.topic,
+        "hub.callback": get_callback_url(subscription.token),
+    }
+    if mode == "subscribe":
+        data["hub.secret"] = subscription.secret
+        data["hub.lease_seconds"] = str(WEBSUB_LEASE_SECONDS)
+    
+    # The hub may verify before it answers, so the expected state has to be committed first
+    subscription.requested_at = now or datetime.utcnow()
+    if mode == "unsubscribe":
+        subscription.state = "unsubscribing"
+    elif subscription.state != "active":
+        subscription.state = "pending"
+    db.session.commit()
+    try:
+        response = feed_transport.get_session().post(
+            subscription.hub, data=data,
+            timeout=(feed_transport.FEED_CONNECT_TIMEOUT, feed_transport.FEED_FETCH_TIMEOUT)
+        )
+        if response.status_code not in (202, 204):
+            raise feed_transport.FeedFetchError(f"HTTP {response.status_code}: {response.text[:200]}")
+    except Exception as e:
+        logger.warning(f"WebSub {mode} request for {subscription.feed_url} to {subscription.hub} failed: {str(e)}")
+        subscription.state = "failed"
+        subscription.last_error = f"{type(e).__name__}: {e}"[:255]
+        return False
+    return True
+
+def is_renewal_due(subscription, now):
+    """
+    Check whether a subscription has to be (re)requested
+    
+    Args:
+        subscription (WebSubSubscription): Subscription row
+        now (datetime): Current time (UTC)
+    
+    Returns:
+        bool: True if a subscribe request should be sent now
+    """
+    state = subscription.state
+    if state == "new":
+        return True
+    if state == "active" and subscription.lease_expires is not None:
+        margin = max(MIN_RENEW_MARGIN, (subscription.lease_seconds or WEBSUB_LEASE_SECONDS) * RENEW_SHARE)
+        if subscription.lease_expires - timedelta(seconds=margin) > now:
+            return False
+    if state in ("active", "pending"):
+        # The lease only moves once the hub verifies; until then the last request stands, unless the hub stayed silent
+        return subscription.requested_at is None or subscription.requested_at + timedelta(seconds=VERIFY_TIMEOUT) <= now
+    if state in ("denied", "failed"):
+        return subscription.requested_at is None or subscription.requested_at + timedelta(seconds=RETRY_INTERVAL) <= now
+    return False
+
+def maintain_subscriptions(now=None):
+    """
+    Subscribe to newly found hubs, renew expiring leases and drop subscriptions of removed feeds
+    
+    Args:
+        now (datetime): Current time (UTC), defaults to now
+    
+    Returns:
+        int: Number of requests sent to hubs
+    """
+    from app import db
+    import models
+    
+    if not is_enabled():
+        return 0
+    now = now or datetime.utcnow()
+    active_urls = {url for url, in models.RssFeed.query.with_entities(models.RssFeed.url).filter(
+        models.RssFeed.active == True
+    ).distinct().all()}
+    
+    requests_sent = 0
+    for subscription in models.WebSubSubscription.query.all():
+        try:
+            if subscription.feed_url not in active_urls:
+                if subscription.state in ("active", "pending"):
+                    request_subscription(subscription, "unsubscribe", now)
+                    requests_sent += 1
+                elif subscription.state != "unsubscribing" or (
+                    subscription.requested_at is None
+                    or subscription.requested_at + timedelta(seconds=VERIFY_TIMEOUT) <= now
+                ):
+                    # Never subscribed, or the hub did not confirm the unsubscribe
+                    db.session.delete(subscription)
+            elif is_renewal_due(subscription, now):
+                request_subscription(subscription, "subscribe", now)
+                requests_sent += 1
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error maintaining WebSub subscription of {subscription.feed_url}: {str(e)}")
+    return requests_sent
+
+def verify_intent(token, args, now=None):
+    """
+    Answer a hub's intent verification (or denial) for a subscription
+    
+    Args:
+        token (str): Token in the callback URL
+        args (dict): Query parameters of the hub's GET request
+        now (datetime): Current time (UTC), defaults to now
+    
+    Returns:
+        tuple: (HTTP status, response body)
+    """
+    from app import db
+    import models
+    
+    subscription = models.WebSubSubscription.query.filter_by(token=token).first()
+    if subscription is None:
+        return 404, "Unknown subscription"
+    
+    mode = args.get("hub.mode")
+    if mode == "denied":
+        subscription.state = "denied"
+        subscription.last_error = (args.get("hub.reason") or "Denied by the hub")[:255]
+        db.session.commit()
+        logger.warning(f"WebSub hub denied the subscription of {subscription.feed_url}: {subscription.last_error}")
+        return 200, ""
+    
+    challenge = args.get("hub.challenge")
+    if not challenge or args.get("hub.topic") != subscription.topic:
+        return 404, "Topic mismatch"
+    
+    if mode == "subscribe" and subscription.state in ("pending", "active"):
+        try:
+            lease_seconds = int(args.get("hub.lease_seconds") or WEBSUB_LEASE_SECONDS)
+        except ValueError:
+            lease_seconds = WEBSUB_LEASE_SECONDS
+        subscription.state = "active"
+        subscription.lease_seconds = lease_seconds
+        subscription.lease_expires = (now or datetime.utcnow()) + timedelta(seconds=lease_seconds)
+        subscription.last_error = None
+        db.session.commit()
+        logger.info(f"WebSub subscription of {subscription.feed_url} active for {lease_seconds}s")
+        return 200, challenge
+    
+    if mode == "unsubscribe" and subscription.state == "unsubscribing":
+        db.session.delete(subscription)
+        db.session.commit()
+        logger.info(f"WebSub subscription of {subscription.feed_url} removed")
+        return 200, challenge
+    
+    # Not something this app asked for
+    return 404, "Unexpected mode"
+
+def is_valid_signature(secret, body, signature):
+    """
+    Check the X-Hub-Signature of pushed content
+    
+    Args:
+        secret (str): Subscription secret
+        body (bytes): Request body
+        signature (str): Header value, e.g. "sha256=<hex digest>"
+    
+    Returns:
+        bool: True if the body was signed with the secret
+    """
+    method, _, digest = (signature or "").partition("=")
+    method = method.strip().lower()
+    if method not in SIGNATURE_METHODS or not digest:
+        return False
+    expected = hmac.new(secret.encode("utf-8"), body, method).hexdigest()
+    return hmac.compare_digest(expected, digest.strip().lower())
+
+def receive_push(token, body, headers, now=None):
+    """
+    Store content a hub pushed for a subscription
+    
+    Args:
+        token (str): Token in the callback URL
+        body (bytes): Pushed feed document
+        headers: Request headers
+        now (datetime): Current time (UTC), defaults to now
+    
+    Returns:
+        tuple: (HTTP status, response body)
+    """
+    from app import db
+    import models
+    import rss
+    
+    subscription = models.WebSubSubscription.query.filter_by(token=token).first()
+    if subscription is None:
+        # 410 tells the hub to stop delivering
+        return 410, "Unknown subscription"
+    if len(body) > feed_transport.FEED_MAX_BYTES:
+        return 413, "Content too large"
+    
+    # Unsigned or wrongly signed content is acknowledged but ignored, as the spec asks
+    if not is_valid_signature(subscription.secret, body, headers.get("X-Hub-Signature")):
+        logger.warning(f"Ignoring WebSub push for {subscription.feed_url} with a missing or invalid signature")
+        return 202, ""
+    
+    feed_url = subscription.feed_url
+    parse_headers = {"content-location": subscription.topic}
+    if headers.get("Content-Type"):
+        parse_headers["content-type"] = headers.get("Content-Type")
+    stored = rss.ingest_content(feed_url, body, parse_headers)
+    if stored is None:
+        return 202, ""
+    
+    subscription.last_push = now or datetime.utcnow()
+    db.session.commit()
+    rss.mark_feeds_fetched([feed_url], subscription.last_push)
+    logger.info(f"WebSub push for {feed_url}: {stored} new article(s)")
+    return 202, ""
+
+def get_pushed_feeds(feed_urls, now=None):
+    """
+    Get the feeds whose hub currently pushes their content
+    
+    Args:
+        feed_urls (list): RSS feed URLs
+        now (datetime): Current time (UTC), defaults to now
+    
+    Returns:
+        set: Feed URLs with an active, unexpired subscription
+    """
+    import models
+    
+    if not is_enabled() or not feed_urls:
+        return set()
+    return {url for url, in models.WebSubSubscription.query.with_entities(models.WebSubSubscription.feed_url).filter(
+        models.WebSubSubscription.feed_url.in_(list(set(feed_urls))),
+        models.WebSubSubscription.state == "active",
+        models.WebSubSubscription.lease_expires > (now or datetime.utcnow())
+    ).all()}